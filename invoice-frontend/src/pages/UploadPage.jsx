@@ -7,6 +7,31 @@ import "../styles/dashboard.css";
 // API base URL - adjust as needed
 const API_BASE_URL = import.meta.env.VITE_API_URL || '';
 
+// Queued uploads (202 + job_id) are polled until their job finishes
+const JOB_POLL_INTERVAL_MS = 1500;
+const JOB_POLL_TIMEOUT_MS = 10 * 60 * 1000;
+
+const jobError = (message) => {
+  const error = new Error(message);
+  error.response = { data: { error: message } };
+  return error;
+};
+
+// Resolve an upload response to its result, waiting for the background job when it was queued
+const waitForUpload = async (response) => {
+  if (response.status !== 202 || !response.data?.job_id) {
+    return response.data;
+  }
+  const deadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    const { data: job } = await axios.get(`${API_BASE_URL}/api/home/jobs/${response.data.job_id}/`);
+    if (job.status === 'succeeded') return job.result;
+    if (job.status === 'failed') throw jobError(job.error || 'Processing failed');
+  }
+  throw jobError('Processing is taking longer than expected. Refresh the page later to see the result.');
+};
+
 // Upload Modal Component
 const UploadModal = ({ isOpen, onClose, title, onUpload, acceptedTypes = ".pdf,.png,.jpg,.jpeg", isLoading = false }) => {
   const [selectedFiles, setSelectedFiles] = useState([]);
@@ -256,11 +281,12 @@ const UploadPage = () => {
         formData.append('file', file);
         formData.append('filename', file.name);
 
-        await axios.post(`${API_BASE_URL}/api/home/po/upload/`, formData, {
+        const response = await axios.post(`${API_BASE_URL}/api/home/po/upload/`, formData, {
           headers: {
             'Content-Type': 'multipart/form-data',
           },
         });
+        await waitForUpload(response);
       }
 
       // Refresh data after upload
@@ -288,11 +314,12 @@ const UploadPage = () => {
         formData.append('purchase_order_id', poId);
         formData.append('filename', file.name);
 
-        await axios.post(`${API_BASE_URL}/api/home/invoice/upload-and-verify/`, formData, {
+        const response = await axios.post(`${API_BASE_URL}/api/home/invoice/upload-and-verify/`, formData, {
           headers: {
             'Content-Type': 'multipart/form-data',
           },
         });
+        await waitForUpload(response);
       }
 
       // Refresh data after upload
@@ -2,7 +2,7 @@
 import csv
 import json
 from datetime import timedelta
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.http import HttpResponse
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
@@ -15,7 +15,12 @@ from .models import (
     ItemVerification,
     Discrepancy,
     VerificationStatus,
+    Snapshot,
+    ProcessingJob,
+    JobKind,
+    JobStatus,
 )
+from .jobs import enqueue_job, processing_is_async, run_job_now
 
 # -------------------------
 # Inline admin for item results and discrepancies
@@ -69,6 +74,45 @@ def pretty_json_html(value):
         return format_html("<pre>{}</pre>", str(value))
 
 
+# -------------------------
+# Re-verification actions (stored payloads, no OCR; see reverify.py)
+# -------------------------
+def queue_reverification(modeladmin, request, invoices):
+    """
+    Queue a re-verification job for the invoices. Without a job worker it
+    runs right away, rules-only, so the request never waits on the LLM.
+    """
+    invoice_ids = [str(pk) for pk in invoices.filter(purchase_order__isnull=False).values_list("pk", flat=True)]
+    if not invoice_ids:
+        modeladmin.message_user(request, "No linked invoices to re-verify.", level=messages.WARNING)
+        return
+    job = enqueue_job(JobKind.REVERIFY, "", params={"invoice_ids": invoice_ids, "rules_only": not processing_is_async()})
+    if processing_is_async():
+        modeladmin.message_user(request, f"Queued re-verification of {len(invoice_ids)} invoice(s) as job {job.pk}.")
+        return
+    job = run_job_now(job)
+    if job.status != JobStatus.SUCCEEDED:
+        modeladmin.message_user(request, f"Re-verification failed: {job.error}", level=messages.ERROR)
+        return
+    summary = job.result
+    modeladmin.message_user(
+        request,
+        f"Re-verified {summary['invoices']} invoice(s) (rules only): {summary['matched']} matched, "
+        f"{summary['mismatched']} mismatched, {summary['changed']} changed status.",
+    )
+
+
+def reverify_po_invoices(modeladmin, request, queryset):
+    """Re-verify every invoice linked to the selected POs."""
+    queue_reverification(modeladmin, request, Invoice.objects.filter(purchase_order__in=queryset))
+reverify_po_invoices.short_description = "Re-verify all invoices of selected POs"
+
+
+def reverify_selected_invoices(modeladmin, request, queryset):
+    queue_reverification(modeladmin, request, queryset)
+reverify_selected_invoices.short_description = "Re-verify selected invoices"
+
+
 # -------------------------
 # Admin for PurchaseOrderRef
 # -------------------------
@@ -79,6 +123,7 @@ class PurchaseOrderRefAdmin(admin.ModelAdmin):
     list_filter = ("issued_date",)
     readonly_fields = ("created_at", "updated_at", "payload_preview")
     ordering = ("-created_at",)
+    actions = (reverify_po_invoices,)
     fieldsets = (
         (None, {"fields": ("purchase_order_id", "buyer_name", "supplier_name", "currency", "issued_date")}),
         ("Amounts", {"fields": ("subtotal", "tax", "total")}),
@@ -103,6 +148,7 @@ class InvoiceRefAdmin(admin.ModelAdmin):
     readonly_fields = ("created_at", "updated_at", "payload_preview", "compared_payload_preview")
     ordering = ("-created_at",)
     raw_id_fields = ("purchase_order",)
+    actions = (reverify_selected_invoices,)
     fieldsets = (
         (None, {"fields": ("invoice_id", "purchase_order", "supplier_name", "receiver_email", "source_type", "source_ref")}),
         ("Amounts", {"fields": ("currency", "subtotal", "tax", "total")}),
@@ -153,6 +199,7 @@ def export_runs_to_csv(modeladmin, request, queryset):
         "started_at",
         "finished_at",
         "duration_ms",
+        "stage_timings_ms",
         "mismatch_count",
         "matched_item_count",
     ]
@@ -170,6 +217,7 @@ def export_runs_to_csv(modeladmin, request, queryset):
             "started_at": localtime(run.started_at).isoformat() if run.started_at else "",
             "finished_at": localtime(run.finished_at).isoformat() if run.finished_at else "",
             "duration_ms": run.duration_ms,
+            "stage_timings_ms": json.dumps((run.stage_timings or {}).get("totals") or {}),
             "mismatch_count": run.mismatch_count,
             "matched_item_count": run.matched_item_count,
         })
@@ -196,7 +244,7 @@ class VerificationRunAdmin(admin.ModelAdmin):
     list_select_related = ("invoice", "purchase_order")
     search_fields = ("invoice__invoice_id", "purchase_order__purchase_order_id", "summary", "invoice__supplier_name")
     list_filter = ("status", "created_at", "started_at", "finished_at")
-    readonly_fields = ("created_at", "updated_at", "po_snapshot_preview", "invoice_snapshot_preview", "status", "duration_ms", "started_at", "finished_at")
+    readonly_fields = ("created_at", "updated_at", "po_snapshot_preview", "invoice_snapshot_preview", "status", "duration_ms", "started_at", "finished_at", "stage_timings_preview")
     ordering = ("-created_at",)
     inlines = (VerificationItemResultInline, DiscrepancyInline)
     actions = (mark_runs_matched, mark_runs_mismatched, export_runs_to_csv)
@@ -205,7 +253,7 @@ class VerificationRunAdmin(admin.ModelAdmin):
     fieldsets = (
         (None, {"fields": ("invoice", "purchase_order", "status")}),
         ("Counts & Flags", {"fields": ("mismatch_count", "matched_item_count", "quantities_ok", "prices_ok", "totals_ok", "currency_ok", "linkage_ok")}),
-        ("Timing", {"fields": ("started_at", "finished_at", "duration_ms")}),
+        ("Timing", {"fields": ("started_at", "finished_at", "duration_ms", "stage_timings_preview")}),
         ("Snapshots", {"fields": ("po_snapshot_preview", "invoice_snapshot_preview")}),
         ("Summary", {"fields": ("summary",)}),
         ("Timestamps", {"fields": ("created_at", "updated_at")}),
@@ -261,6 +309,14 @@ class VerificationRunAdmin(admin.ModelAdmin):
         return "-"
     duration_readable.short_description = "Duration"
 
+    def stage_timings_preview(self, obj):
+        timings = obj.stage_timings or {}
+        return pretty_json_html(timings.get("totals") or timings)
+    stage_timings_preview.short_description = "Stage timings (ms)"
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("po_snapshot_ref", "invoice_snapshot_ref")
+
     def po_snapshot_preview(self, obj):
         return pretty_json_html(obj.po_snapshot)
     po_snapshot_preview.short_description = "PO snapshot"
@@ -332,3 +388,40 @@ class DiscrepancyAdmin(admin.ModelAdmin):
             return m[:97] + "..."
         return m
     message_short.short_description = "Message"
+
+
+# -------------------------
+# Admin for Snapshot
+# -------------------------
+@admin.register(Snapshot)
+class SnapshotAdmin(admin.ModelAdmin):
+    list_display = ("short_digest", "created_at")
+    search_fields = ("digest",)
+    readonly_fields = ("digest", "created_at", "data_preview")
+    fields = ("digest", "created_at", "data_preview")
+    ordering = ("-created_at",)
+
+    def short_digest(self, obj):
+        return obj.digest[:12]
+    short_digest.short_description = "Digest"
+
+    def data_preview(self, obj):
+        return pretty_json_html(obj.data)
+    data_preview.short_description = "Snapshot (JSON)"
+
+
+# -------------------------
+# Admin for ProcessingJob
+# -------------------------
+@admin.register(ProcessingJob)
+class ProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ("filename", "kind", "status", "stage", "attempts", "created_at", "finished_at")
+    list_filter = ("kind", "status")
+    search_fields = ("filename", "saved_name", "error")
+    readonly_fields = ("created_at", "updated_at", "started_at", "finished_at", "result_preview")
+    exclude = ("result",)
+    ordering = ("-created_at",)
+
+    def result_preview(self, obj):
+        return pretty_json_html(obj.result)
+    result_preview.short_description = "Result (JSON)"
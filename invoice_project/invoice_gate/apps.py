@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class InvoiceGateConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'invoice_gate'
+
+    def ready(self):
+        from . import signals  # noqa: F401
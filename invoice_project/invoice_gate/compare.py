@@ -3,6 +3,7 @@ import os
 import re
 import json
 import uuid
+import logging
 from decimal import Decimal
 from django.conf import settings
 from django.db import transaction
@@ -13,6 +14,13 @@ from .models import (
     VerificationRun, ItemVerification,
     Discrepancy, VerificationStatus, DiscrepancyLevel, DiscrepancyType
 )
+from .duplicates import duplicate_message
+from .item_index import build_item_index, description_index, is_index_current, item_key
+from .numeric import parse_decimal, parse_number
+from .similarity import ngram_vector
+from .snapshots import build_snapshot, save_snapshots
+from .stats import update_po_stats
+from .timing import stage
 
 # Mistral client
 try:
@@ -20,43 +28,19 @@ try:
 except Exception:
     Mistral = None
 
+logger = logging.getLogger(__name__)
 
-# ---------- Helper functions ----------
-def safe_decimal(value):
-    """Convert various types to Decimal safely"""
-    if value is None:
-        return None
-    if isinstance(value, Decimal):
-        return value
-    if isinstance(value, dict):
-        # Handle nested dict structures
-        for key in ("amount", "value", "total", "amount_due", "VAT_amount", "vat_amount"):
-            if key in value:
-                return safe_decimal(value[key])
-        # Try any numeric value in dict
-        for v in value.values():
-            if isinstance(v, (int, float, str, Decimal)):
-                dec = safe_decimal(v)
-                if dec is not None:
-                    return dec
-        return None
-    if isinstance(value, (int, float)):
-        try:
-            return Decimal(str(value))
-        except Exception:
-            return None
-    if isinstance(value, str):
-        # Remove currency symbols and commas
-        s = re.sub(r"[^\d\.\-]", "", value.strip())
-        if not s or s == '.':
-            return None
-        try:
-            return Decimal(s)
-        except Exception:
-            return None
-    return None
 
+# Description similarity below this is treated as unrelated text
+MIN_DESCRIPTION_SIMILARITY = 0.5
+
+# Matching tolerances: line quantities / prices (and the rule-based total check)
+# within 2% or 1.00, recorded total mismatches beyond 2% or 2.00.
+# Overridden by settings.VERIFICATION_TOLERANCES, and per call for what-if runs.
+DEFAULT_TOLERANCES = {"rel_tol": 0.02, "abs_tol": 1.0, "total_rel_tol": 0.02, "total_abs_tol": 2.0}
 
+
+# ---------- Helper functions ----------
 def normalize_compared_payload(obj):
     """Normalize data for JSON serialization"""
     if isinstance(obj, Decimal):
@@ -71,11 +55,23 @@ def normalize_compared_payload(obj):
     return obj
 
 
-def fuzzy_equal(a, b, rel_tol=0.02, abs_tol=1.0):
+def get_tolerances(overrides=None):
+    """Effective tolerances: defaults < settings.VERIFICATION_TOLERANCES < overrides"""
+    tolerances = dict(DEFAULT_TOLERANCES)
+    tolerances.update(getattr(settings, "VERIFICATION_TOLERANCES", None) or {})
+    tolerances.update({k: v for k, v in (overrides or {}).items() if v is not None})
+    return tolerances
+
+
+def fuzzy_equal(a, b, rel_tol=None, abs_tol=None):
     """
     Compare two numbers with tolerance
-    Increased tolerance to 2% or $1 to handle rounding
+    Defaults to the configured line tolerances (2% or $1) to handle rounding
     """
+    if rel_tol is None or abs_tol is None:
+        tolerances = get_tolerances()
+        rel_tol = tolerances["rel_tol"] if rel_tol is None else rel_tol
+        abs_tol = tolerances["abs_tol"] if abs_tol is None else abs_tol
     try:
         if a is None or b is None:
             return False
@@ -132,83 +128,97 @@ def clean_json_response(text: str) -> str:
     return text
 
 
-def match_items_fuzzy(invoice_items, po_items):
+def match_items_fuzzy(invoice_items, po_items, po_index=None, tolerances=None):
     """
     Fuzzy match items between invoice and PO
-    Returns list of matched pairs with match scores
+    Returns list of matched pairs with match scores; `evidence` is set on
+    pairs matched on item ID or description (not quantity / price alone)
+
+    po_index is the precomputed PO item index (see item_index.py); it is
+    built on the fly when not supplied.
     """
+    tol = get_tolerances(tolerances)
+    tol = {"rel_tol": tol["rel_tol"], "abs_tol": tol["abs_tol"]}
+    if not is_index_current(po_index, po_items):
+        po_index = build_item_index(po_items)
+
+    po_entries = [
+        (po_item, entry["key"], entry["qty"], entry["price"])
+        for po_item, entry in zip(po_items, po_index["items"])
+    ]
+    desc_index = description_index(po_index)
+
     matched_pairs = []
+    matched_po_positions = set()
     
     for inv_item in invoice_items:
-        inv_desc = (inv_item.get("description") or "").lower().strip()
-        inv_id = inv_item.get("item_id", "").upper()
-        inv_qty = inv_item.get("quantity")
-        inv_price = inv_item.get("unit_price")
+        inv_id = item_key(inv_item)
+        inv_qty = parse_number(inv_item.get("quantity"))
+        inv_price = parse_number(inv_item.get("unit_price"))
+        # Description similarity against every PO line in one pass
+        desc_scores = desc_index.scores(ngram_vector(inv_item.get("description")))
         
         best_match = None
+        best_position = None
         best_score = 0
+        best_evidence = False
         
-        for po_item in po_items:
-            po_desc = (po_item.get("description") or "").lower().strip()
-            po_id = po_item.get("item_id", "").upper()
-            po_qty = po_item.get("quantity")
-            po_price = po_item.get("unit_price")
-            
+        for position, (po_item, po_id, po_qty, po_price) in enumerate(po_entries):
             score = 0
+            evidence = False
             
             # Exact ID match = very high score
             if inv_id and po_id and inv_id == po_id:
                 score += 50
+                evidence = True
             
-            # Description similarity
-            if inv_desc and po_desc:
-                # Simple word overlap scoring
-                inv_words = set(inv_desc.split())
-                po_words = set(po_desc.split())
-                common = inv_words & po_words
-                if common:
-                    score += len(common) / max(len(inv_words), len(po_words)) * 30
+            # Description similarity (character n-gram cosine)
+            if desc_scores[position] >= MIN_DESCRIPTION_SIMILARITY:
+                score += desc_scores[position] * 30
+                evidence = True
             
             # Quantity match
-            if inv_qty and po_qty and fuzzy_equal(inv_qty, po_qty):
+            if inv_qty and po_qty and fuzzy_equal(inv_qty, po_qty, **tol):
                 score += 10
             
             # Price match
-            if inv_price and po_price and fuzzy_equal(inv_price, po_price):
+            if inv_price and po_price and fuzzy_equal(inv_price, po_price, **tol):
                 score += 10
             
             if score > best_score:
                 best_score = score
                 best_match = po_item
+                best_position = position
+                best_evidence = evidence
         
+        if best_position is not None:
+            matched_po_positions.add(best_position)
         matched_pairs.append({
             "invoice_item": inv_item,
             "po_item": best_match,
-            "match_score": best_score
+            "match_score": best_score,
+            "evidence": best_evidence
         })
     
     # Check for unmatched PO items
-    matched_po_descs = set()
-    for pair in matched_pairs:
-        if pair["po_item"]:
-            matched_po_descs.add(pair["po_item"].get("description", "").lower())
-    
-    for po_item in po_items:
-        po_desc = (po_item.get("description") or "").lower()
-        if po_desc not in matched_po_descs:
+    for position, po_item in enumerate(po_items):
+        if position not in matched_po_positions:
             matched_pairs.append({
                 "invoice_item": None,
                 "po_item": po_item,
-                "match_score": 0
+                "match_score": 0,
+                "evidence": False
             })
     
     return matched_pairs
 
 
 # ---------- Mistral comparison ----------
-def compare_one_pair(invoice_parsed: dict, po_parsed: dict):
+def compare_one_pair(invoice_parsed: dict, po_parsed: dict, po_index=None, tolerances=None):
     """
     Compare invoice and PO using Mistral AI - Optimized version
+    po_index (the PO's stored item index) and tolerance overrides are passed
+    through to the fallback comparator.
     """
     api_key = os.getenv("MISTRAL_API_KEY") or getattr(settings, "MISTRAL_API_KEY", None)
     if not api_key or Mistral is None:
@@ -234,6 +244,7 @@ def compare_one_pair(invoice_parsed: dict, po_parsed: dict):
 
     invoice_data = prune(invoice_parsed)
     po_data = prune(po_parsed)
+    tol = get_tolerances(tolerances)
 
     prompt = f"""You are a financial document comparison AI. Compare the INVOICE and PURCHASE ORDER below.
 
@@ -241,8 +252,8 @@ Your task: Determine if the invoice matches the purchase order within acceptable
 
 COMPARISON RULES:
 1. Quantities must match exactly (or invoice can be less if items damaged/returned)
-2. Unit prices should match within 2% or $1 tolerance (for rounding)
-3. Totals should match within 2% or $2 tolerance
+2. Unit prices should match within {tol["rel_tol"] * 100:g}% or ${tol["abs_tol"]:g} tolerance (for rounding)
+3. Totals should match within {tol["total_rel_tol"] * 100:g}% or ${tol["total_abs_tol"]:g} tolerance
 4. Vendor names should be the same company (exact match not required)
 5. Line items should correspond to ordered items
 
@@ -344,10 +355,7 @@ Return the comparison JSON:"""
         # Normalize numeric fields in details
         for k in ("invoice_total", "po_total"):
             if k in details:
-                try:
-                    details[k] = float(details[k]) if details[k] is not None else None
-                except Exception:
-                    details[k] = None
+                details[k] = parse_number(details[k])
         
         # Normalize items array
         items = details.get("items", [])
@@ -367,12 +375,7 @@ Return the comparison JSON:"""
             
             # Parse numeric fields
             for field in ["inv_quantity", "po_quantity", "inv_unit_price", "po_unit_price"]:
-                value = it.get(field)
-                if value is not None:
-                    try:
-                        normalized_item[field] = float(value)
-                    except Exception:
-                        normalized_item[field] = None
+                normalized_item[field] = parse_number(it.get(field))
             
             normalized_items.append(normalized_item)
         
@@ -398,14 +401,16 @@ Return the comparison JSON:"""
         print(f"ERROR in Mistral comparison: {e}")
         
         # Fallback to rule-based comparison
-        return fallback_comparison(invoice_parsed, po_parsed)
+        return fallback_comparison(invoice_parsed, po_parsed, po_index=po_index, tolerances=tolerances)
 
 
-def fallback_comparison(invoice_parsed: dict, po_parsed: dict):
+def fallback_comparison(invoice_parsed: dict, po_parsed: dict, po_index=None, tolerances=None):
     """
     Fallback rule-based comparison when Mistral fails
     """
-    print("Using fallback rule-based comparison")
+    logger.debug("Using fallback rule-based comparison")
+    tol = get_tolerances(tolerances)
+    tol = {"rel_tol": tol["rel_tol"], "abs_tol": tol["abs_tol"]}
     
     reasons = []
     details = {
@@ -417,18 +422,18 @@ def fallback_comparison(invoice_parsed: dict, po_parsed: dict):
     }
     
     # Compare totals
-    inv_total = safe_decimal(invoice_parsed.get("total"))
-    po_total = safe_decimal(po_parsed.get("total"))
+    inv_total = parse_decimal(invoice_parsed.get("total"))
+    po_total = parse_decimal(po_parsed.get("total"))
     
     if inv_total and po_total:
-        if not fuzzy_equal(inv_total, po_total):
+        if not fuzzy_equal(inv_total, po_total, **tol):
             reasons.append(f"Total mismatch: Invoice {format_currency(inv_total)} vs PO {format_currency(po_total)}")
     
     # Compare items
-    inv_items = invoice_parsed.get("items", [])
-    po_items = po_parsed.get("items", [])
+    inv_items = invoice_parsed.get("items") or []
+    po_items = po_parsed.get("items") or []
     
-    matched_pairs = match_items_fuzzy(inv_items, po_items)
+    matched_pairs = match_items_fuzzy(inv_items, po_items, po_index=po_index, tolerances=tolerances)
     
     for pair in matched_pairs:
         inv_item = pair["invoice_item"]
@@ -436,13 +441,13 @@ def fallback_comparison(invoice_parsed: dict, po_parsed: dict):
         
         if inv_item and po_item:
             desc = inv_item.get("description") or po_item.get("description")
-            inv_qty = safe_decimal(inv_item.get("quantity"))
-            po_qty = safe_decimal(po_item.get("quantity"))
-            inv_price = safe_decimal(inv_item.get("unit_price"))
-            po_price = safe_decimal(po_item.get("unit_price"))
+            inv_qty = parse_decimal(inv_item.get("quantity"))
+            po_qty = parse_decimal(po_item.get("quantity"))
+            inv_price = parse_decimal(inv_item.get("unit_price"))
+            po_price = parse_decimal(po_item.get("unit_price"))
             
-            qty_ok = fuzzy_equal(inv_qty, po_qty) if (inv_qty and po_qty) else True
-            price_ok = fuzzy_equal(inv_price, po_price) if (inv_price and po_price) else True
+            qty_ok = fuzzy_equal(inv_qty, po_qty, **tol) if (inv_qty and po_qty) else True
+            price_ok = fuzzy_equal(inv_price, po_price, **tol) if (inv_price and po_price) else True
             
             if not qty_ok:
                 reasons.append(f"Quantity mismatch for '{desc}': {inv_qty} vs {po_qty}")
@@ -463,9 +468,9 @@ def fallback_comparison(invoice_parsed: dict, po_parsed: dict):
             reasons.append(f"Extra item on invoice: '{inv_item.get('description')}'")
             details["items"].append({
                 "description": inv_item.get("description"),
-                "inv_quantity": float(safe_decimal(inv_item.get("quantity"))) if inv_item.get("quantity") else None,
+                "inv_quantity": parse_number(inv_item.get("quantity")),
                 "po_quantity": None,
-                "inv_unit_price": float(safe_decimal(inv_item.get("unit_price"))) if inv_item.get("unit_price") else None,
+                "inv_unit_price": parse_number(inv_item.get("unit_price")),
                 "po_unit_price": None,
                 "quantity_ok": False,
                 "price_ok": False,
@@ -476,9 +481,9 @@ def fallback_comparison(invoice_parsed: dict, po_parsed: dict):
             details["items"].append({
                 "description": po_item.get("description"),
                 "inv_quantity": None,
-                "po_quantity": float(safe_decimal(po_item.get("quantity"))) if po_item.get("quantity") else None,
+                "po_quantity": parse_number(po_item.get("quantity")),
                 "inv_unit_price": None,
-                "po_unit_price": float(safe_decimal(po_item.get("unit_price"))) if po_item.get("unit_price") else None,
+                "po_unit_price": parse_number(po_item.get("unit_price")),
                 "quantity_ok": False,
                 "price_ok": False,
                 "match_score": 0
@@ -492,121 +497,214 @@ def fallback_comparison(invoice_parsed: dict, po_parsed: dict):
 
 
 # ---------- Persist verification results ----------
-def persist_verification(invoice_obj, matched_po, status_str, summary, reasons, details):
+def build_verification_run(invoice_obj, matched_po, status_str, summary, reasons, details, timer=None):
     """
-    Save verification results to database
+    Build (but do not save) the VerificationRun for a comparison result
+    With a PipelineTimer the run covers the whole upload pipeline.
     """
-    def to_decimal_safe(v):
-        if v is None:
-            return None
-        try:
-            return Decimal(str(v))
-        except Exception:
-            return None
-
-    with transaction.atomic():
-        run = VerificationRun.objects.create(
-            purchase_order=matched_po,
-            invoice=invoice_obj,
-            status=(VerificationStatus.MATCHED if status_str == "MATCHED" else VerificationStatus.MISMATCHED),
-            summary=summary,
-            mismatch_count=len(reasons) if isinstance(reasons, (list, tuple)) else (1 if reasons else 0),
-            matched_item_count=sum(1 for it in (details.get("items") or []) if it.get("quantity_ok") and it.get("price_ok")),
-            quantities_ok=all(it.get("quantity_ok", True) for it in (details.get("items") or [])),
-            prices_ok=all(it.get("price_ok", True) for it in (details.get("items") or [])),
-            totals_ok=(status_str == "MATCHED"),
-            currency_ok=True,
-            linkage_ok=(matched_po is not None),
-            started_at=timezone.now(),
-            finished_at=timezone.now(),
-            duration_ms=0,
-            po_snapshot=(matched_po.payload if matched_po else None),
-            invoice_snapshot=invoice_obj.payload or None
-        )
+    items = details.get("items") or []
+    now = timezone.now()
+    return VerificationRun(
+        id=uuid.uuid4(),
+        purchase_order=matched_po,
+        invoice=invoice_obj,
+        status=(VerificationStatus.MATCHED if status_str == "MATCHED" else VerificationStatus.MISMATCHED),
+        summary=summary,
+        mismatch_count=len(reasons) if isinstance(reasons, (list, tuple)) else (1 if reasons else 0),
+        matched_item_count=sum(1 for it in items if it.get("quantity_ok") and it.get("price_ok")),
+        quantities_ok=all(it.get("quantity_ok", True) for it in items),
+        prices_ok=all(it.get("price_ok", True) for it in items),
+        totals_ok=(status_str == "MATCHED"),
+        currency_ok=True,
+        linkage_ok=(matched_po is not None),
+        started_at=(timer.started_at if timer else now),
+        finished_at=now,
+        duration_ms=(timer.duration_ms if timer else 0),
+        stage_timings=(timer.as_dict() if timer else None),
+        po_snapshot_ref=build_snapshot(matched_po.payload if matched_po else None),
+        invoice_snapshot_ref=build_snapshot(invoice_obj.payload)
+    )
+
+
+def build_result_rows(run, details, tolerances=None):
+    """
+    Build the ItemVerification and Discrepancy rows for a run in memory.
 
-        # Save item-level results
-        for idx, item in enumerate(details.get("items", [])):
-            desc = item.get("description") or f"item-{idx}"
-            inv_qty = to_decimal_safe(item.get("inv_quantity"))
-            po_qty = to_decimal_safe(item.get("po_quantity"))
-            inv_price = to_decimal_safe(item.get("inv_unit_price"))
-            po_price = to_decimal_safe(item.get("po_unit_price"))
+    Primary keys are generated client-side so each discrepancy can point at
+    its item row before anything is inserted. Returns (item_rows, discrepancy_rows).
+    """
+    tol = get_tolerances(tolerances)
+    item_rows = []
+    discrepancy_rows = []
+
+    for idx, item in enumerate(details.get("items") or []):
+        desc = item.get("description") or f"item-{idx}"
+        inv_qty = parse_decimal(item.get("inv_quantity"))
+        po_qty = parse_decimal(item.get("po_quantity"))
+        inv_price = parse_decimal(item.get("inv_unit_price"))
+        po_price = parse_decimal(item.get("po_unit_price"))
+
+        item_result = ItemVerification(
+            id=uuid.uuid4(),
+            run=run,
+            item_id=str(uuid.uuid4())[:36],
+            description=str(desc)[:500],
+            inv_original_name=str(desc)[:500],
+            po_quantity=(po_qty or Decimal("0")),
+            po_unit_price=(po_price or Decimal("0")),
+            invoice_quantity=(inv_qty or Decimal("0")),
+            invoice_unit_price=(inv_price or Decimal("0")),
+            is_match=(bool(item.get("quantity_ok")) and bool(item.get("price_ok"))),
+            extra_data=item
+        )
+        item_rows.append(item_result)
 
-            item_result = ItemVerification.objects.create(
+        # Discrepancies for this item
+        if not item.get("quantity_ok", True):
+            discrepancy_rows.append(Discrepancy(
                 run=run,
-                item_id=str(uuid.uuid4())[:36],
-                description=str(desc)[:500],
-                inv_original_name=str(desc)[:500],
-                po_quantity=(po_qty or Decimal("0")),
-                po_unit_price=(po_price or Decimal("0")),
-                invoice_quantity=(inv_qty or Decimal("0")),
-                invoice_unit_price=(inv_price or Decimal("0")),
-                is_match=(bool(item.get("quantity_ok")) and bool(item.get("price_ok"))),
-                extra_data=item
-            )
-
-            # Create discrepancies
-            if not item.get("quantity_ok", True):
-                Discrepancy.objects.create(
-                    run=run,
-                    level=DiscrepancyLevel.ITEM,
-                    type=DiscrepancyType.QUANTITY_MISMATCH,
-                    item_result=item_result,
-                    field="quantity",
-                    expected=str(po_qty) if po_qty is not None else "",
-                    actual=str(inv_qty) if inv_qty is not None else "",
-                    message=f"Quantity mismatch for '{desc}': Invoice {inv_qty} vs PO {po_qty}"
-                )
-
-            if not item.get("price_ok", True):
-                Discrepancy.objects.create(
-                    run=run,
-                    level=DiscrepancyLevel.ITEM,
-                    type=DiscrepancyType.PRICE_MISMATCH,
-                    item_result=item_result,
-                    field="unit_price",
-                    expected=str(po_price) if po_price is not None else "",
-                    actual=str(inv_price) if inv_price is not None else "",
-                    message=f"Price mismatch for '{desc}': Invoice {format_currency(inv_price)} vs PO {format_currency(po_price)}"
-                )
+                level=DiscrepancyLevel.ITEM,
+                type=DiscrepancyType.QUANTITY_MISMATCH,
+                item_result=item_result,
+                field="quantity",
+                expected=str(po_qty) if po_qty is not None else "",
+                actual=str(inv_qty) if inv_qty is not None else "",
+                message=f"Quantity mismatch for '{desc}': Invoice {inv_qty} vs PO {po_qty}"
+            ))
+
+        if not item.get("price_ok", True):
+            discrepancy_rows.append(Discrepancy(
+                run=run,
+                level=DiscrepancyLevel.ITEM,
+                type=DiscrepancyType.PRICE_MISMATCH,
+                item_result=item_result,
+                field="unit_price",
+                expected=str(po_price) if po_price is not None else "",
+                actual=str(inv_price) if inv_price is not None else "",
+                message=f"Price mismatch for '{desc}': Invoice {format_currency(inv_price)} vs PO {format_currency(po_price)}"
+            ))
+
+        if (item.get("po_quantity") is None) and (item.get("inv_quantity") is not None):
+            discrepancy_rows.append(Discrepancy(
+                run=run,
+                level=DiscrepancyLevel.ITEM,
+                type=DiscrepancyType.EXTRA_ITEM,
+                item_result=item_result,
+                field="description",
+                expected="",
+                actual=str(desc),
+                message=f"Extra item in invoice: '{desc}'"
+            ))
+
+        if (item.get("inv_quantity") is None) and (item.get("po_quantity") is not None):
+            discrepancy_rows.append(Discrepancy(
+                run=run,
+                level=DiscrepancyLevel.ITEM,
+                type=DiscrepancyType.MISSING_ITEM,
+                item_result=item_result,
+                field="description",
+                expected=str(desc),
+                actual="",
+                message=f"Item missing on invoice: '{desc}'"
+            ))
+
+    duplicate = details.get("duplicate")
+    if duplicate:
+        discrepancy_rows.append(Discrepancy(
+            run=run,
+            level=DiscrepancyLevel.HEADER,
+            type=DiscrepancyType.DUPLICATE_INVOICE,
+            field="invoice_id",
+            expected="",
+            actual=str(duplicate.get("invoice_id") or ""),
+            message=duplicate_message(duplicate)
+        ))
+
+    # Check total mismatch
+    inv_total = details.get("invoice_total")
+    po_total = details.get("po_total")
+    if inv_total is not None and po_total is not None:
+        if not fuzzy_equal(inv_total, po_total, rel_tol=tol["total_rel_tol"], abs_tol=tol["total_abs_tol"]):
+            discrepancy_rows.append(Discrepancy(
+                run=run,
+                level=DiscrepancyLevel.TOTAL,
+                type=DiscrepancyType.TOTAL_MISMATCH,
+                field="total",
+                expected=str(po_total),
+                actual=str(inv_total),
+                message=f"Total mismatch: Invoice {format_currency(inv_total)} vs PO {format_currency(po_total)}"
+            ))
+
+    return item_rows, discrepancy_rows
+
+
+def build_compared_payload(run, reasons, details):
+    """Verification summary stored on Invoice.compared_payload (JSON-safe)"""
+    return normalize_compared_payload({
+        "verification": {
+            "status": run.status,
+            "summary": run.summary,
+            "reasons": reasons,
+            "details": details
+        }
+    })
 
-            if (item.get("po_quantity") is None) and (item.get("inv_quantity") is not None):
-                Discrepancy.objects.create(
-                    run=run,
-                    level=DiscrepancyLevel.ITEM,
-                    type=DiscrepancyType.EXTRA_ITEM,
-                    item_result=item_result,
-                    field="description",
-                    expected="",
-                    actual=str(desc),
-                    message=f"Extra item in invoice: '{desc}'"
-                )
 
-            if (item.get("inv_quantity") is None) and (item.get("po_quantity") is not None):
-                Discrepancy.objects.create(
-                    run=run,
-                    level=DiscrepancyLevel.ITEM,
-                    type=DiscrepancyType.MISSING_ITEM,
-                    item_result=item_result,
-                    field="description",
-                    expected=str(desc),
-                    actual="",
-                    message=f"Item missing on invoice: '{desc}'"
-                )
+def persist_verification(invoice_obj, matched_po, status_str, summary, reasons, details, timer=None,
+                         insert_invoice=False):
+    """
+    Save verification results to database
 
-        # Check total mismatch
-        inv_total = details.get("invoice_total")
-        po_total = details.get("po_total")
-        if inv_total is not None and po_total is not None:
-            if not fuzzy_equal(inv_total, po_total, rel_tol=0.02, abs_tol=2.0):
-                Discrepancy.objects.create(
-                    run=run,
-                    level=DiscrepancyLevel.TOTAL,
-                    type=DiscrepancyType.TOTAL_MISMATCH,
-                    field="total",
-                    expected=str(po_total),
-                    actual=str(inv_total),
-                    message=f"Total mismatch: Invoice {format_currency(inv_total)} vs PO {format_currency(po_total)}"
-                )
+    Writes the (deduplicated) snapshots, the run, then all item rows and all
+    discrepancy rows with one bulk insert each, instead of one INSERT per
+    line/discrepancy.
+    With insert_invoice=True, invoice_obj is still unsaved: its compared
+    payload is filled from the run and it is inserted in the same transaction,
+    so a fresh upload costs one INSERT per table and no follow-up UPDATEs.
+    When a PipelineTimer is given, the persist stage itself is timed and the
+    final timings are written back once the transaction has committed.
+    The invoice's lines are also booked into the PO's consumption ledger
+    (see ledger.py) and the PO's counters updated (see stats.py) in the
+    same transaction.
+    """
+    from .ledger import LedgerUpdate  # ledger.py uses this module's matcher
+
+    with stage(timer, "persist") as timing:
+        run = build_verification_run(invoice_obj, matched_po, status_str, summary, reasons, details, timer=timer)
+        item_rows, discrepancy_rows = build_result_rows(run, details)
+        timing["run_id"] = str(run.id)
+
+        with transaction.atomic():
+            # locks the PO's ledger lines; cumulative over-billing turns the run into a mismatch
+            ledger = LedgerUpdate(invoice_obj, matched_po, new_invoice=insert_invoice)
+            discrepancy_rows.extend(ledger.apply_to_run(run, reasons))
+            timing["status"] = run.status
+            if insert_invoice:
+                invoice_obj.compared_payload = build_compared_payload(run, reasons, details)
+                invoice_obj.save(force_insert=True)
+            ledger.save()
+            save_snapshots([run.po_snapshot_ref, run.invoice_snapshot_ref])
+            run.save(force_insert=True)
+            if item_rows:
+                ItemVerification.objects.bulk_create(item_rows)
+            if discrepancy_rows:
+                Discrepancy.objects.bulk_create(discrepancy_rows)
+            new_link = [(None, run.purchase_order_id, invoice_obj.total, invoice_obj.duplicate_of_id)]
+            update_po_stats(runs=[run], moves=new_link if insert_invoice else ())
+
+    if timer:
+        timer.finish()
+        run.finished_at = timer.finished_at
+        run.duration_ms = timer.duration_ms
+        run.stage_timings = timer.as_dict()
+        try:
+            VerificationRun.objects.filter(pk=run.pk).update(
+                finished_at=run.finished_at,
+                duration_ms=run.duration_ms,
+                stage_timings=run.stage_timings,
+            )
+        except Exception:
+            # results are already committed; only the final timings are lost
+            logger.exception("Failed to store final stage timings for run %s", run.pk)
 
-        return run
+    return run
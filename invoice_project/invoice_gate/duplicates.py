@@ -0,0 +1,136 @@
+# duplicates.py
+"""
+Duplicate-invoice detection at upload time.
+
+Runs right after extraction, before PO linking and the comparison, with at
+most two indexed queries per upload:
+
+1. exact: another invoice with the same fingerprint (normalized vendor key,
+   invoice number, issue date and total - see keys.invoice_fingerprint);
+2. near: invoices of the same vendor that either carry the same invoice
+   number (re-sent with a different date or total) or have the same total
+   within DUPLICATE_NEAR_DAYS of the issue date under a similar number (OCR
+   slips such as "INV-1O42" / "INV-1042", or a dropped prefix). Only a
+   bounded number of rows is read, through the (vendor_key,
+   invoice_number_key) and (vendor_key, total) indexes.
+
+Exact duplicates skip the comparison (or are rejected with
+DUPLICATE_INVOICE_ACTION = "reject"); near duplicates are compared as usual
+and flagged. Either way the invoice points at the original through
+duplicate_of and its run gets a DUPLICATE_INVOICE discrepancy.
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+
+from .keys import invoice_fingerprint, normalize_invoice_number, normalize_vendor_key
+from .models import Invoice
+
+NEAR_DUPLICATE_CANDIDATES = 10
+
+# characters OCR commonly reads for one another
+_OCR_CONFUSABLE = str.maketrans("oilszb", "011528")
+
+Duplicate = namedtuple("Duplicate", ["original", "exact"])
+
+
+def near_days():
+    return getattr(settings, "DUPLICATE_NEAR_DAYS", 7)
+
+
+def rejects_duplicates():
+    return getattr(settings, "DUPLICATE_INVOICE_ACTION", "flag") == "reject"
+
+
+def similar_numbers(a, b):
+    """
+    Number keys that may name the same invoice: equal up to OCR confusions,
+    one a suffix of the other ("1042" / "inv1042"), or either one missing.
+    Plain neighbours such as "inv1041" / "inv1042" are not similar.
+    """
+    if not a or not b:
+        return True
+    a, b = a.translate(_OCR_CONFUSABLE), b.translate(_OCR_CONFUSABLE)
+    shorter, longer = sorted((a, b), key=len)
+    return a == b or (len(shorter) >= 4 and longer.endswith(shorter))
+
+
+# ---------- Detection ----------
+def find_billing_duplicate(invoice_obj):
+    """Duplicate(original, exact) for the first invoice billing the same as invoice_obj (saved or not), or None"""
+    vendor_key = normalize_vendor_key(invoice_obj.supplier_name)
+    number_key = normalize_invoice_number(invoice_obj.invoice_id)
+    if not vendor_key:
+        return None
+    others = Invoice.objects.exclude(pk=invoice_obj.pk).only(
+        "pk", "invoice_id", "invoice_number_key", "fingerprint", "issue_date", "total", "created_at"
+    )
+
+    fingerprint = invoice_fingerprint(vendor_key, number_key, invoice_obj.issue_date, invoice_obj.total)
+    if fingerprint:
+        original = others.filter(fingerprint=fingerprint).order_by("created_at").first()
+        if original is not None:
+            return Duplicate(original, True)
+
+    near = Q()
+    if number_key:
+        near |= Q(invoice_number_key=number_key)
+    if invoice_obj.total is not None and invoice_obj.issue_date:
+        window = timedelta(days=near_days())
+        near |= Q(
+            total=invoice_obj.total,
+            issue_date__range=(invoice_obj.issue_date - window, invoice_obj.issue_date + window),
+        )
+    if not near:
+        return None
+    candidates = others.filter(near, vendor_key=vendor_key).order_by("created_at")[:NEAR_DUPLICATE_CANDIDATES]
+    for candidate in candidates:
+        if similar_numbers(candidate.invoice_number_key, number_key):
+            return Duplicate(candidate, False)
+    return None
+
+
+def duplicate_details(invoice_obj, exact=None):
+    """details["duplicate"] for an invoice marked as a duplicate, else None"""
+    original = invoice_obj.duplicate_of
+    if original is None:
+        return None
+    if exact is None:
+        exact = bool(original.fingerprint) and original.fingerprint == invoice_fingerprint(
+            normalize_vendor_key(invoice_obj.supplier_name), normalize_invoice_number(invoice_obj.invoice_id),
+            invoice_obj.issue_date, invoice_obj.total,
+        )
+    return {"invoice_uuid": str(original.pk), "invoice_id": original.invoice_id, "exact": exact}
+
+
+def duplicate_message(duplicate):
+    kind = "Duplicate" if duplicate["exact"] else "Possible duplicate"
+    return f"{kind} of invoice {duplicate['invoice_id']}"
+
+
+# ---------- Results ----------
+def duplicate_result(parsed, matched_po, duplicate):
+    """Comparison result for an exact duplicate, produced without running the comparator"""
+    po_parsed = matched_po.payload if matched_po and isinstance(matched_po.payload, dict) else {}
+    message = duplicate_message(duplicate)
+    return (
+        "NEEDS REVIEW",
+        f"{message}; not compared",
+        [message],
+        {
+            "invoice_total": parsed.get("total"),
+            "po_total": po_parsed.get("total"),
+            "items": [],
+            "duplicate": duplicate,
+        },
+    )
+
+
+def flag_duplicate(result, duplicate):
+    """A comparison result with the (near) duplicate added to its reasons and details"""
+    status_str, summary, reasons, details = result
+    reasons = [*(reasons if isinstance(reasons, (list, tuple)) else [reasons] if reasons else []),
+               duplicate_message(duplicate)]
+    return "NEEDS REVIEW", summary, reasons, {**details, "duplicate": duplicate}
@@ -0,0 +1,109 @@
+# item_index.py
+"""
+Normalized PO line-item index.
+
+Built once when a PO is uploaded and stored on PurchaseOrder.item_index, so the
+comparator does not have to re-derive item keys, numbers and description
+n-gram vectors from the raw payload for every invoice matched against the PO.
+The inverted n-gram index over those vectors is kept per process, keyed by
+the index digest (description_index()).
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from .numeric import parse_number
+from .similarity import NgramIndex, ngram_counts, vector_norm
+from .snapshots import snapshot_digest
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 4
+
+DESCRIPTION_INDEX_CACHE_SIZE = 256
+
+
+# ---------- Helper functions ----------
+def item_key(item):
+    """Canonical item key (upper-cased, stripped item_id)"""
+    return str(item.get("item_id") or "").strip().upper()
+
+
+# ---------- Build / load ----------
+def build_item_index(items):
+    """
+    Build the normalized index for a list of PO items.
+
+    Each line stores its item key, quantity, unit price and the character
+    n-gram vector used for description similarity. Entries stay aligned with the payload items by
+    position; digest identifies the items the index was built from.
+    """
+    entries = []
+    for item in items or []:
+        if not isinstance(item, dict):
+            item = {}
+        ngrams = ngram_counts(item.get("description"))
+        entries.append({
+            "key": item_key(item),
+            "ngrams": ngrams,
+            "norm": vector_norm(ngrams),
+            "qty": parse_number(item.get("quantity")),
+            "price": parse_number(item.get("unit_price")),
+        })
+    return {"version": INDEX_VERSION, "digest": items_digest(items), "items": entries}
+
+
+def items_digest(items):
+    """SHA-256 of the payload items' canonical JSON"""
+    return snapshot_digest(items or [])
+
+
+def is_index_current(index, items):
+    """True when a stored index was built, by this version, from exactly these payload items"""
+    return (
+        isinstance(index, dict)
+        and index.get("version") == INDEX_VERSION
+        and index.get("digest") == items_digest(items)
+    )
+
+
+def get_po_item_index(po):
+    """
+    Return the stored item index for a PurchaseOrder.
+
+    POs uploaded before the index existed (or whose payload was edited) get
+    the index rebuilt and written back once, without touching updated_at.
+    """
+    payload = po.payload if isinstance(po.payload, dict) else {}
+    items = payload.get("items") or []
+    if is_index_current(po.item_index, items):
+        return po.item_index
+
+    index = build_item_index(items)
+    try:
+        type(po).objects.filter(pk=po.pk).update(item_index=index)
+        po.item_index = index
+    except Exception:
+        logger.exception("Failed to store rebuilt item index for PO %s", po.pk)
+    return index
+
+
+# ---------- Description search ----------
+_description_indexes = OrderedDict()
+_description_lock = threading.Lock()
+
+
+def description_index(index):
+    """NgramIndex over the index's description vectors, built once per PO version and process"""
+    key = (index.get("version"), index.get("digest"))
+    with _description_lock:
+        cached = _description_indexes.get(key)
+        if cached is not None:
+            _description_indexes.move_to_end(key)
+            return cached
+    cached = NgramIndex([(entry["ngrams"], entry["norm"]) for entry in index["items"]])
+    with _description_lock:
+        _description_indexes[key] = cached
+        while len(_description_indexes) > DESCRIPTION_INDEX_CACHE_SIZE:
+            _description_indexes.popitem(last=False)
+    return cached
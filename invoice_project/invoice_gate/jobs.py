@@ -0,0 +1,485 @@
+# jobs.py
+"""
+DB-backed job queue for document processing.
+
+Upload endpoints save the file and enqueue a ProcessingJob; worker processes
+(`python manage.py run_jobs`) claim queued jobs, run the same pipeline the
+synchronous endpoints use and store the response payload on the job. No
+external broker is needed - the jobs table is the queue.
+
+Workers on several nodes can share one Postgres database: jobs are claimed
+with SELECT ... FOR UPDATE SKIP LOCKED, held under a lease that a heartbeat
+thread keeps renewing, and requeued by any worker once the lease of a
+crashed worker expires. Databases without SKIP LOCKED (SQLite in local
+development) claim with a conditional UPDATE instead. Jobs only carry the
+storage name of their file and workers read it through default_storage, so
+workers on other hosts need a shared storage backend (object storage, or
+one MEDIA_ROOT volume mounted on every node).
+
+Invoices uploaded before their PO are linked when the PO arrives and get a
+re-verification job (relink_pending_invoices), run on the spot when there
+are no workers. Bulk reconciliation
+and re-verification run as jobs too, so they never occupy a web worker.
+
+Progress is published as ProcessingJobEvent rows, fed by the pipeline's own
+PipelineTimer stages, and served to clients by a short long-poll (events
+after a given id). Events only carry small scalar stage fields - the result
+lives on the job - and workers prune the events of finished jobs.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .compare import normalize_compared_payload
+from .models import Invoice, PendingPOReference, ProcessingJob, ProcessingJobEvent, JobKind, JobStatus
+from .pipeline import (
+    ProcessingError,
+    process_purchase_order,
+    purchase_order_result,
+    process_invoice,
+    invoice_result,
+    reverify_invoice,
+)
+from .reverify import reverify_invoices, select_invoices
+from .stats import update_po_stats
+from .timing import PipelineTimer
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stage -> progress event name
+STAGE_EVENTS = {
+    "storage_save": "saved",
+    "ocr_page": "page_ocred",
+    "classify": "classified",
+    "extract": "extracted",
+    "link_po": "po_linked",
+    "compare": "compared",
+    "persist": "persisted",
+}
+TERMINAL_EVENTS = ("succeeded", "failed")
+# stage entry fields copied into event data (PipelineTimer entries also carry larger values)
+EVENT_FIELDS = ("page", "method", "doc_type", "item_count", "po_id", "duplicate_of", "status", "ms")
+EVENT_POLL_INTERVAL = 0.5
+EVENT_WAIT_MAX_SECONDS = 5
+EVENT_PRUNE_INTERVAL_SECONDS = 600
+
+
+def processing_is_async():
+    """Whether `run_jobs` workers process the queue (UPLOAD_PROCESSING_ASYNC)"""
+    return getattr(settings, "UPLOAD_PROCESSING_ASYNC", False)
+
+
+def lease_seconds():
+    return getattr(settings, "JOB_LEASE_SECONDS", 60)
+
+
+def max_attempts():
+    return getattr(settings, "JOB_MAX_ATTEMPTS", 3)
+
+
+def event_retention():
+    return timedelta(hours=getattr(settings, "JOB_EVENT_RETENTION_HOURS", 24))
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_job(kind, saved_name, filename=None, params=None):
+    job = ProcessingJob.objects.create(
+        kind=kind,
+        saved_name=saved_name,
+        filename=filename,
+        params=params or None,
+    )
+    record_event(job, "saved", {"filename": filename, "saved_name": saved_name})
+    return job
+
+
+def enqueue_reverify_jobs(invoices):
+    """
+    Queue a re-verification job for each (invoice pk, invoice_id,
+    document_blob_path) row - jobs and their "saved" events are bulk inserted.
+    """
+    jobs = [
+        ProcessingJob(
+            kind=JobKind.INVOICE,
+            saved_name=blob_path or "",
+            filename=invoice_id,
+            params={"reverify_invoice_id": str(pk)},
+        )
+        for pk, invoice_id, blob_path in invoices
+    ]
+    ProcessingJob.objects.bulk_create(jobs, batch_size=500)
+    ProcessingJobEvent.objects.bulk_create([
+        ProcessingJobEvent(job_id=job.pk, event="saved", data={"filename": job.filename, "saved_name": job.saved_name})
+        for job in jobs
+    ], batch_size=500)
+    return jobs
+
+
+# ---------- Relinking ----------
+def relink_pending_invoices(po):
+    """
+    Link the invoices waiting for a newly created PO (pending references with
+    its normalized PO number, or its vendor key and total) and queue their
+    verification. Only matching pending rows are read. Without workers
+    (UPLOAD_PROCESSING_ASYNC off) the jobs are run right here, so call this
+    after the PO's transaction committed. Returns the jobs.
+    """
+    match = []
+    if po.po_number_key:
+        match.append(Q(po_number_key=po.po_number_key))
+    if po.vendor_key and po.total is not None:
+        match.append(Q(vendor_key=po.vendor_key, total=po.total))
+    if not match:
+        return []
+
+    with transaction.atomic():
+        query = match[0] if len(match) == 1 else match[0] | match[1]
+        refs = list(PendingPOReference.objects.select_for_update().filter(query).values_list("pk", "invoice_id"))
+        if not refs:
+            return []
+        PendingPOReference.objects.filter(pk__in=[pk for pk, _ in refs]).delete()
+        rows = list(
+            Invoice.objects.filter(pk__in=[invoice_id for _, invoice_id in refs], purchase_order__isnull=True)
+            .values_list("pk", "invoice_id", "document_blob_path", "total", "duplicate_of_id")
+        )
+        Invoice.objects.filter(pk__in=[row[0] for row in rows]).update(purchase_order=po)
+        update_po_stats(moves=[(None, po.pk, total, duplicate_of_id) for *_, total, duplicate_of_id in rows])
+        invoices = [row[:3] for row in rows]
+
+    jobs = enqueue_reverify_jobs(invoices)
+    if not jobs:
+        return jobs
+    if processing_is_async():
+        logger.info("PO %s: linked %s waiting invoice(s), verification queued", po.purchase_order_id, len(jobs))
+        return jobs
+    logger.info("PO %s: linked %s waiting invoice(s), verifying them now", po.purchase_order_id, len(jobs))
+    return [run_job_now(job) for job in jobs]
+
+
+# ---------- Progress events ----------
+def record_event(job, event, data=None):
+    return ProcessingJobEvent.objects.create(job_id=job.pk, event=event, data=normalize_compared_payload(data))
+
+
+def event_recorder(job):
+    """Timer listener publishing each finished pipeline stage as a progress event"""
+    def record(event, entry):
+        name = STAGE_EVENTS.get(entry["name"])
+        if event == "end" and name:
+            record_event(job, name, {"stage": entry["name"], **{k: entry[k] for k in EVENT_FIELDS if k in entry}})
+    return record
+
+
+def wait_for_job_events(job_id, after_id=0, wait_seconds=EVENT_WAIT_MAX_SECONDS, poll_interval=EVENT_POLL_INTERVAL):
+    """
+    Long-poll: the job's events with id > after_id, returned as soon as there
+    are any, or an empty list after wait_seconds (at most
+    EVENT_WAIT_MAX_SECONDS). Returns (events, done) - done once a terminal
+    event was returned or the job is finished with nothing left to read.
+    """
+    deadline = time.monotonic() + min(max(wait_seconds, 0), EVENT_WAIT_MAX_SECONDS)
+    while True:
+        events = list(ProcessingJobEvent.objects.filter(job_id=job_id, id__gt=after_id or 0).order_by("id")[:100])
+        if events:
+            return events, any(event.event in TERMINAL_EVENTS for event in events)
+        status = ProcessingJob.objects.filter(pk=job_id).values_list("status", flat=True).first()
+        if status is None or status in (JobStatus.SUCCEEDED, JobStatus.FAILED):
+            return [], True
+        if time.monotonic() >= deadline:
+            return [], False
+        time.sleep(poll_interval)
+
+
+def prune_job_events(older_than=None):
+    """Delete the progress events of jobs that finished before older_than (default: JOB_EVENT_RETENTION_HOURS ago)"""
+    cutoff = older_than or timezone.now() - event_retention()
+    deleted, _ = ProcessingJobEvent.objects.filter(
+        job__status__in=(JobStatus.SUCCEEDED, JobStatus.FAILED), job__finished_at__lt=cutoff
+    ).delete()
+    if deleted:
+        logger.info("Pruned %s job event(s)", deleted)
+    return deleted
+
+
+# ---------- Claiming ----------
+def _claim_fields(worker_id, now):
+    return {
+        "status": JobStatus.RUNNING,
+        "stage": "claimed",
+        "attempts": F("attempts") + 1,
+        "started_at": now,
+        "updated_at": now,
+        "locked_by": worker_id,
+        "lease_expires_at": now + timedelta(seconds=lease_seconds()),
+        "heartbeat_at": now,
+    }
+
+
+def _claim_skip_locked(worker_id):
+    with transaction.atomic():
+        job_id = (
+            ProcessingJob.objects.select_for_update(skip_locked=True)
+            .filter(status=JobStatus.QUEUED)
+            .order_by("created_at")
+            .values_list("id", flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        ProcessingJob.objects.filter(pk=job_id).update(**_claim_fields(worker_id, timezone.now()))
+    return ProcessingJob.objects.get(pk=job_id)
+
+
+def _claim_conditional_update(worker_id):
+    """Fallback: the status check is repeated in the UPDATE so racing workers cannot both win"""
+    candidates = ProcessingJob.objects.filter(status=JobStatus.QUEUED).order_by("created_at")
+    for job_id in candidates.values_list("id", flat=True)[:10]:
+        claimed = ProcessingJob.objects.filter(pk=job_id, status=JobStatus.QUEUED).update(
+            **_claim_fields(worker_id, timezone.now())
+        )
+        if claimed:
+            return ProcessingJob.objects.get(pk=job_id)
+    return None
+
+
+def claim_next_job(worker_id=None):
+    """Move the oldest queued job to RUNNING under a lease for worker_id and return it, or None"""
+    worker_id = worker_id or default_worker_id()
+    if connection.features.has_select_for_update_skip_locked:
+        return _claim_skip_locked(worker_id)
+    return _claim_conditional_update(worker_id)
+
+
+def reclaim_expired_jobs():
+    """
+    Requeue running jobs whose lease expired (their worker died or hung);
+    jobs that already used up JOB_MAX_ATTEMPTS are failed instead.
+    Returns (requeued, failed).
+    """
+    now = timezone.now()
+    expired = ProcessingJob.objects.filter(status=JobStatus.RUNNING, lease_expires_at__lt=now)
+    failed = expired.filter(attempts__gte=max_attempts()).update(
+        status=JobStatus.FAILED,
+        stage=None,
+        error="Worker lease expired too many times",
+        error_status=500,
+        finished_at=now,
+        updated_at=now,
+        locked_by=None,
+        lease_expires_at=None,
+    )
+    requeued = expired.filter(attempts__lt=max_attempts()).update(
+        status=JobStatus.QUEUED,
+        stage=None,
+        updated_at=now,
+        locked_by=None,
+        lease_expires_at=None,
+    )
+    if requeued or failed:
+        logger.warning("Reclaimed expired jobs: %s requeued, %s failed", requeued, failed)
+    return requeued, failed
+
+
+# ---------- Leases ----------
+def _owned(job):
+    """Queryset matching the job only while this worker still holds its lease"""
+    return ProcessingJob.objects.filter(pk=job.pk, status=JobStatus.RUNNING, locked_by=job.locked_by)
+
+
+class Heartbeat:
+    """
+    Background thread renewing a job's lease every third of the lease period
+    while the pipeline runs (OCR / LLM calls can take minutes).
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.interval = max(lease_seconds() / 3.0, 1.0)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job.pk}", daemon=True)
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                now = timezone.now()
+                renewed = _owned(self.job).update(
+                    heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_seconds())
+                )
+                if not renewed:
+                    logger.warning("Lost lease on job %s", self.job.pk)
+                    break
+        finally:
+            connection.close()  # the thread's own DB connection
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+# ---------- Running ----------
+def stage_reporter(job):
+    """Timer listener that records the current stage on the job row"""
+    def report(event, entry):
+        if event == "start" and entry["name"] != job.stage:
+            job.stage = entry["name"]
+            _owned(job).update(stage=job.stage, updated_at=timezone.now())
+    return report
+
+
+def read_job_document(job):
+    """The uploaded file's bytes, read through the storage backend it was saved to"""
+    with default_storage.open(job.saved_name, "rb") as document:
+        return document.read()
+
+
+def progress_recorder(job):
+    """progress(stage, processed, total) callback of the bulk operations, published as progress events"""
+    def progress(stage_name, done, total):
+        record_event(job, "progress", {"stage": stage_name, "processed": done, "total": total})
+        if stage_name != job.stage:
+            job.stage = stage_name
+            _owned(job).update(stage=stage_name, updated_at=timezone.now())
+    return progress
+
+
+def execute_job(job, timer):
+    """Run the pipeline for a job and return its JSON-safe result payload"""
+    params = job.params or {}
+    filename = job.filename or job.saved_name
+    if job.kind == JobKind.RECONCILE:
+        from .reconcile import reconcile_unlinked_invoices  # reconcile.py queues its follow-up jobs here
+
+        result = reconcile_unlinked_invoices(
+            dry_run=params.get("dry_run", False),
+            queue_verification=params.get("verify", True),
+            limit=params.get("limit"),
+            progress=progress_recorder(job),
+        )
+    elif job.kind == JobKind.REVERIFY:
+        progress = progress_recorder(job)
+        invoices = select_invoices(
+            purchase_order_id=params.get("purchase_order_id"),
+            invoice_ids=params.get("invoice_ids"),
+            all_invoices=params.get("all", False),
+        )
+        result = reverify_invoices(
+            invoices,
+            tolerances=params.get("tolerances"),
+            rules_only=params.get("rules_only", False),
+            progress=lambda done, total: progress("verified", done, total),
+        )
+    elif job.kind == JobKind.PURCHASE_ORDER:
+        po_obj, parsed = process_purchase_order(
+            job.saved_name, job.saved_name, filename, timer=timer, content_hash=params.get("content_hash"),
+            data=read_job_document(job),
+        )
+        result = purchase_order_result(po_obj, parsed)
+    elif job.kind == JobKind.INVOICE and params.get("reverify_invoice_id"):
+        invoice_obj = Invoice.objects.select_related("purchase_order").get(pk=params["reverify_invoice_id"])
+        result = invoice_result(*reverify_invoice(
+            invoice_obj, explicit_po_id=params.get("purchase_order_id"), timer=timer,
+        ))
+    elif job.kind == JobKind.INVOICE:
+        result = invoice_result(*process_invoice(
+            job.saved_name, job.saved_name, filename,
+            explicit_po_id=params.get("purchase_order_id"), timer=timer,
+            content_hash=params.get("content_hash"), data=read_job_document(job),
+        ))
+    else:
+        raise ProcessingError(f"Unknown job kind: {job.kind}")
+    return normalize_compared_payload(result)
+
+
+def finish_job(job, status, **fields):
+    """Record the outcome, unless the lease was lost and another worker took the job over"""
+    job.status = status
+    job.finished_at = timezone.now()
+    for name, value in fields.items():
+        setattr(job, name, value)
+    finished = _owned(job).update(
+        status=job.status, finished_at=job.finished_at, updated_at=job.finished_at,
+        lease_expires_at=None, **fields
+    )
+    if not finished:
+        logger.warning("Job %s finished after its lease was reclaimed; result discarded", job.pk)
+    return bool(finished)
+
+
+def run_job(job):
+    """Process a claimed job; failures are recorded on the job, never raised"""
+    timer = PipelineTimer(listeners=[stage_reporter(job), event_recorder(job)])
+    record_event(job, "started", {"attempt": job.attempts, "worker": job.locked_by})
+    try:
+        with Heartbeat(job):
+            result = execute_job(job, timer)
+    except ProcessingError as exc:
+        if finish_job(job, JobStatus.FAILED, stage=None, error=exc.message, error_status=exc.status_code,
+                      result=exc.as_response_data()):
+            record_event(job, "failed", {"error": exc.message, "http_status": exc.status_code})
+    except Exception as exc:
+        logger.exception("Job %s failed", job.pk)
+        if finish_job(job, JobStatus.FAILED, stage=None, error=str(exc), error_status=500):
+            record_event(job, "failed", {"error": str(exc), "http_status": 500})
+    else:
+        if finish_job(job, JobStatus.SUCCEEDED, stage=None, result=result):
+            record_event(job, "succeeded", {"total_ms": timer.duration_ms})
+    return job
+
+
+def run_job_now(job):
+    """
+    Claim one specific queued job and run it in this process - for
+    deployments without a worker. Returns the job as it finished, or as it
+    is if another process claimed it first.
+    """
+    claimed = ProcessingJob.objects.filter(pk=job.pk, status=JobStatus.QUEUED).update(
+        **_claim_fields(default_worker_id(), timezone.now())
+    )
+    job = ProcessingJob.objects.get(pk=job.pk)
+    return run_job(job) if claimed else job
+
+
+def run_pending_jobs(limit=None, worker_id=None):
+    """Run queued jobs until the queue is empty (or limit jobs ran). Returns the count."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next_job(worker_id)
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+def work_forever(poll_interval=2.0, worker_id=None):
+    """
+    Worker loop: reclaim expired leases, drain the queue, then sleep
+    poll_interval seconds. Old job events are pruned every
+    EVENT_PRUNE_INTERVAL_SECONDS.
+    """
+    worker_id = worker_id or default_worker_id()
+    logger.info("Job worker %s started", worker_id)
+    next_prune = 0
+    while True:
+        if time.monotonic() >= next_prune:
+            prune_job_events()
+            next_prune = time.monotonic() + EVENT_PRUNE_INTERVAL_SECONDS
+        reclaim_expired_jobs()
+        if not run_pending_jobs(worker_id=worker_id):
+            time.sleep(poll_interval)
@@ -0,0 +1,88 @@
+# keys.py
+"""
+Normalized match keys used to link invoices to purchase orders, and to spot
+duplicate invoices, with plain index lookups instead of case-insensitive /
+substring scans.
+"""
+import hashlib
+import re
+import unicodedata
+from decimal import Decimal
+
+# Legal-form tokens dropped from the end of vendor names ("Acme Ltd." == "ACME limited")
+LEGAL_SUFFIXES = frozenset({
+    "ltd", "limited", "inc", "incorporated", "corp", "corporation", "co", "company",
+    "llc", "llp", "lp", "plc", "pvt", "private", "pte", "pty",
+    "gmbh", "mbh", "ag", "kg", "ug", "ohg", "ev",
+    "sa", "sas", "sarl", "srl", "spa", "sl", "bv", "nv", "oy", "ab", "as", "aps", "kk",
+})
+
+_non_alnum_rx = re.compile(r"[^0-9a-z]+")
+_dotted_rx = re.compile(r"\b((?:[a-z]\.){2,})")  # "s.a." / "b.v." -> "sa" / "bv"
+
+
+def _fold(text):
+    """Case-fold and strip accents"""
+    text = unicodedata.normalize("NFKD", str(text))
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+
+
+def normalize_vendor_key(name):
+    """
+    Vendor name -> match key, or None.
+
+    Case-folded, accents and punctuation removed, "&" read as "and", and
+    trailing legal forms stripped: "ACME Ltd.", "Acme, Limited" and
+    "acme" all give "acme".
+    """
+    if not name:
+        return None
+    text = _fold(name).replace("&", " and ")
+    text = _dotted_rx.sub(lambda m: m.group(1).replace(".", ""), text)
+    tokens = _non_alnum_rx.sub(" ", text).split()
+    while len(tokens) > 1 and tokens[-1] in LEGAL_SUFFIXES:
+        tokens.pop()
+    key = " ".join(tokens)[:255]
+    return key or None
+
+
+def normalize_po_number(value):
+    """
+    PO number -> match key, or None.
+
+    Case-folded with separators and punctuation removed, so "PO-00042",
+    "po 00042" and "PO/00042" all give "po00042".
+    """
+    if value is None:
+        return None
+    key = _non_alnum_rx.sub("", _fold(value))[:100]
+    return key or None
+
+
+_leading_zeros_rx = re.compile(r"(?<![0-9])0+(?=[0-9])")
+
+
+def normalize_invoice_number(value):
+    """
+    Invoice number -> match key, or None.
+
+    Like normalize_po_number, with leading zeros of digit runs dropped as
+    well: "INV-00042", "inv 42" and "INV/042" all give "inv42".
+    """
+    key = normalize_po_number(value)
+    if key is None:
+        return None
+    return _leading_zeros_rx.sub("", key) or None
+
+
+def invoice_fingerprint(vendor_key, invoice_number_key, issue_date, total):
+    """
+    SHA-256 over vendor key, invoice number key, issue date and total, or
+    None without a vendor and number. Equal fingerprints mean the same bill.
+    """
+    if not vendor_key or not invoice_number_key:
+        return None
+    total_text = f"{Decimal(total):.2f}" if total is not None else ""
+    date_text = str(issue_date) if issue_date else ""
+    data = "|".join([vendor_key, invoice_number_key, date_text, total_text])
+    return hashlib.sha256(data.encode()).hexdigest()
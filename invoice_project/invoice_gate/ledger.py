@@ -0,0 +1,249 @@
+# ledger.py
+"""
+Per-line consumption ledger for purchase orders.
+
+When an invoice is verified against a PO its lines are matched to the PO's
+lines and their quantities / amounts are added to the PO's POLineLedger
+rows, which are locked (SELECT ... FOR UPDATE) for the rest of the
+transaction so concurrent verifications against the same PO serialize on
+them. Every invoice's share is kept as POLedgerEntry rows: re-verifying an
+invoice (or linking it to another PO) first takes its previous share back
+out, so each invoice counts once. Over-billing - more units invoiced in
+total than ordered, compared exactly - is then checked on the touched lines
+only: O(lines of the invoice), without reading the PO's other invoices.
+
+Ledger lines mirror the PO's payload items by position. Price / quantity
+corrections are picked up when the lines are next locked; when a saved PO's
+lines no longer line up with its items, signals.py rebuilds its ledger from
+the linked invoices (rebuild_po_ledger, also run by the
+`rebuild_po_ledger` command).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .compare import match_items_fuzzy
+from .item_index import get_po_item_index, item_key
+from .models import (
+    Discrepancy, DiscrepancyLevel, DiscrepancyType, Invoice, POLedgerEntry, POLineLedger, PurchaseOrder, VerificationStatus,
+)
+from .numeric import parse_decimal
+
+CENT = Decimal("0.01")
+PRICE_PLACES = Decimal("0.0001")  # POLineLedger.unit_price
+# POLineLedger fields copied from the PO's payload items
+LINE_FIELDS = ("item_key", "description", "ordered_quantity", "unit_price")
+
+
+def _quantize(value, places):
+    return value.quantize(places) if value is not None else None
+
+
+def ledger_lines_for(po, items):
+    """Unsaved ledger rows for a PO's payload items"""
+    return [
+        POLineLedger(
+            purchase_order=po,
+            position=position,
+            item_key=item_key(item)[:100] or None,
+            description=str(item.get("description") or "")[:500] or None,
+            ordered_quantity=_quantize(parse_decimal(item.get("quantity")), CENT),
+            unit_price=_quantize(parse_decimal(item.get("unit_price")), PRICE_PLACES),
+        )
+        for position, item in enumerate(items)
+        if isinstance(item, dict)
+    ]
+
+
+def refresh_line(line, current, po):
+    """Copy the payload item's fields onto a line of po; True if anything changed"""
+    if current is None or line.purchase_order_id != po.pk:
+        return False
+    changed = False
+    for field in LINE_FIELDS:
+        if getattr(line, field) != getattr(current, field):
+            setattr(line, field, getattr(current, field))
+            changed = True
+    return changed
+
+
+def invoice_contributions(invoice_items, po, po_items):
+    """
+    {PO line position: (quantity, amount)} for the invoice lines matched to
+    the PO's lines. Lines paired on quantity / price alone (no item ID or
+    description evidence) book nothing.
+    """
+    positions = {id(item): position for position, item in enumerate(po_items)}
+    shares = defaultdict(lambda: [Decimal(0), Decimal(0)])
+    for pair in match_items_fuzzy(invoice_items, po_items, po_index=get_po_item_index(po)):
+        inv_item, po_item = pair["invoice_item"], pair["po_item"]
+        if not inv_item or not po_item or not pair["evidence"]:
+            continue
+        quantity = parse_decimal(inv_item.get("quantity")) or Decimal(0)
+        price = parse_decimal(inv_item.get("unit_price"))
+        amount = parse_decimal(inv_item.get("line_total"))
+        if amount is None:
+            amount = quantity * price if price is not None else Decimal(0)
+        share = shares[positions[id(po_item)]]
+        share[0] += quantity
+        share[1] += amount
+    return {position: (q.quantize(CENT), a.quantize(CENT)) for position, (q, a) in shares.items()}
+
+
+class LedgerUpdate:
+    """
+    The ledger change for one verification, made inside the caller's
+    transaction. Creating it locks the affected lines and computes their new
+    totals; save() writes them (after the invoice row exists).
+    """
+
+    def __init__(self, invoice_obj, matched_po, new_invoice=False):
+        self.invoice = invoice_obj
+        self.po = matched_po
+        self.lines = {}
+        self.touched = {}
+        self.entries = []
+        self.had_entries = False
+
+        payload = invoice_obj.payload if isinstance(invoice_obj.payload, dict) else {}
+        invoice_items = payload.get("items") or []
+
+        po_items = []
+        if invoice_obj.duplicate_of_id:
+            matched_po = self.po = None  # a duplicate bills nothing new; it only gives back any earlier share
+        if matched_po is not None and isinstance(matched_po.payload, dict):
+            po_items = matched_po.payload.get("items") or []
+        contributions = invoice_contributions(invoice_items, matched_po, po_items) if po_items and invoice_items else {}
+        previous = [] if new_invoice else list(
+            POLedgerEntry.objects.filter(invoice_id=invoice_obj.pk).values_list("line_id", "quantity", "amount")
+        )
+        self.had_entries = bool(previous)
+        if not contributions and not previous:
+            return
+
+        by_position = self._lock_lines(matched_po if contributions else None, po_items, [p[0] for p in previous])
+        for line_id, quantity, amount in previous:
+            line = self.lines[line_id]
+            line.invoiced_quantity -= quantity
+            line.invoiced_amount -= amount
+            self.touched[line.pk] = line
+        for position, (quantity, amount) in contributions.items():
+            line = by_position.get(position)
+            if line is None:
+                continue
+            line.invoiced_quantity += quantity
+            line.invoiced_amount += amount
+            self.touched[line.pk] = line
+            self.entries.append(POLedgerEntry(line=line, invoice_id=invoice_obj.pk, quantity=quantity, amount=amount))
+
+    def _lock_lines(self, po, po_items, previous_line_ids):
+        """
+        Lock the PO's lines and the lines of the invoice's previous entries.
+        PO lines are created on first use and refreshed from the current
+        payload items (a corrected quantity or price counts from now on).
+        """
+        def locked():
+            match = Q(pk__in=previous_line_ids)
+            if po is not None:
+                match |= Q(purchase_order=po)
+            return list(POLineLedger.objects.select_for_update().filter(match).order_by("purchase_order_id", "position"))
+
+        lines = locked()
+        if po is not None:
+            expected = {line.position: line for line in ledger_lines_for(po, po_items)}
+            positions = {line.position for line in lines if line.purchase_order_id == po.pk}
+            if expected.keys() - positions:
+                POLineLedger.objects.bulk_create(
+                    [line for position, line in expected.items() if position not in positions], ignore_conflicts=True
+                )
+                lines = locked()
+            stale = [line for line in lines if refresh_line(line, expected.get(line.position), po)]
+            if stale:
+                POLineLedger.objects.bulk_update(stale, LINE_FIELDS)
+        self.lines = {line.pk: line for line in lines}
+        return {line.position: line for line in lines if po is not None and line.purchase_order_id == po.pk}
+
+    def over_billed_lines(self):
+        """Touched lines of the matched PO whose cumulative quantity exceeds the ordered quantity"""
+        return [
+            line for line in self.touched.values()
+            if self.po is not None and line.purchase_order_id == self.po.pk
+            and line.ordered_quantity is not None and line.invoiced_quantity > line.ordered_quantity
+        ]
+
+    def apply_to_run(self, run, reasons):
+        """
+        Turn over-billing into discrepancies of the run being persisted (the
+        run becomes mismatched and reasons is extended). Returns the rows.
+        """
+        rows = []
+        for line in sorted(self.over_billed_lines(), key=lambda line: line.position):
+            desc = line.description or line.item_key or f"line {line.position + 1}"
+            rows.append(Discrepancy(
+                run=run,
+                level=DiscrepancyLevel.ITEM,
+                type=DiscrepancyType.OVER_BILLED,
+                field="quantity",
+                expected=str(line.ordered_quantity),
+                actual=str(line.invoiced_quantity),
+                message=f"Over-billed '{desc}': {line.invoiced_quantity} invoiced in total vs {line.ordered_quantity} ordered",
+            ))
+        if rows:
+            run.status = VerificationStatus.MISMATCHED
+            run.quantities_ok = False
+            run.mismatch_count += len(rows)
+            if isinstance(reasons, list):
+                reasons.extend(row.message for row in rows)
+        return rows
+
+    def save(self):
+        if self.had_entries:
+            POLedgerEntry.objects.filter(invoice_id=self.invoice.pk).delete()
+        if self.entries:
+            POLedgerEntry.objects.bulk_create(self.entries)
+        if self.touched:
+            now = timezone.now()
+            for line in self.touched.values():
+                line.updated_at = now
+            POLineLedger.objects.bulk_update(
+                list(self.touched.values()), ["invoiced_quantity", "invoiced_amount", "updated_at"]
+            )
+
+
+def release_invoice(invoice_obj):
+    """Take a (deleted / unlinked) invoice's share back out of the ledger"""
+    update = LedgerUpdate(invoice_obj, None)
+    update.save()
+
+
+# ---------- Rebuilding ----------
+def ledger_is_current(po):
+    """Whether the PO's ledger lines (if any) are the lines of its current payload items"""
+    items = (po.payload.get("items") or []) if isinstance(po.payload, dict) else []
+    stored = list(po.line_ledger.order_by("position").values_list("position", *LINE_FIELDS))
+    if not stored:
+        return True
+    expected = [(line.position, *(getattr(line, field) for field in LINE_FIELDS)) for line in ledger_lines_for(po, items)]
+    return stored == expected
+
+
+def rebuild_po_ledger(purchase_orders=None):
+    """
+    Recreate the ledger lines and entries of the given POs (default: all)
+    from their linked invoices, oldest first, one transaction per PO.
+    Returns the number of invoices booked.
+    """
+    if purchase_orders is None:
+        purchase_orders = PurchaseOrder.objects.filter(invoices__isnull=False).distinct()
+    booked = 0
+    for po in purchase_orders:
+        with transaction.atomic():
+            POLineLedger.objects.filter(purchase_order=po).delete()  # entries cascade
+            invoices = Invoice.objects.filter(purchase_order=po, duplicate_of__isnull=True).order_by("created_at", "pk")
+            for invoice_obj in invoices.iterator(chunk_size=200):
+                LedgerUpdate(invoice_obj, po, new_invoice=True).save()
+                booked += 1
+    return booked
@@ -0,0 +1,59 @@
+# backfill_match_keys.py
+from django.core.management.base import BaseCommand
+
+from invoice_gate.keys import invoice_fingerprint, normalize_invoice_number, normalize_po_number, normalize_vendor_key
+from invoice_gate.models import PurchaseOrder, Invoice
+
+# model -> {key field: (source fields, function)}, computed in order (the fingerprint uses the keys before it)
+MATCH_KEYS = {
+    PurchaseOrder: {
+        "vendor_key": (("supplier_name",), normalize_vendor_key),
+        "po_number_key": (("purchase_order_id",), normalize_po_number),
+    },
+    Invoice: {
+        "vendor_key": (("supplier_name",), normalize_vendor_key),
+        "invoice_number_key": (("invoice_id",), normalize_invoice_number),
+        "fingerprint": (("vendor_key", "invoice_number_key", "issue_date", "total"), invoice_fingerprint),
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill / refresh the normalized match keys (vendor_key, po_number_key, invoice_number_key) "
+        "and invoice fingerprints on purchase orders and invoices."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true", help="Only count rows whose keys would change")
+
+    def handle(self, *args, **options):
+        for model, keys in MATCH_KEYS.items():
+            changed = self.backfill(model, keys, options["batch_size"], options["dry_run"])
+            verb = "would change" if options["dry_run"] else "updated"
+            self.stdout.write(self.style.SUCCESS(f"{model.__name__}: {changed} row(s) {verb}"))
+
+    def backfill(self, model, keys, batch_size, dry_run):
+        changed = 0
+        pending = []
+        fields = {"pk", *keys, *(source for sources, _ in keys.values() for source in sources)}
+        rows = model.objects.only(*fields).order_by("pk").iterator(chunk_size=batch_size)
+        for obj in rows:
+            dirty = False
+            for field, (sources, compute) in keys.items():
+                key = compute(*(getattr(obj, source) for source in sources))
+                if key != getattr(obj, field):
+                    setattr(obj, field, key)
+                    dirty = True
+            if not dirty:
+                continue
+            changed += 1
+            pending.append(obj)
+            if len(pending) >= batch_size:
+                if not dry_run:
+                    model.objects.bulk_update(pending, list(keys))
+                pending = []
+        if pending and not dry_run:
+            model.objects.bulk_update(pending, list(keys))
+        return changed
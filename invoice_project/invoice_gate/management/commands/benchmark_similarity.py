@@ -0,0 +1,91 @@
+# benchmark_similarity.py
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from invoice_gate.similarity import NgramIndex, ngram_vector
+
+_NOUNS = ["bolt", "nut", "washer", "screw", "bracket", "hinge", "valve", "gasket", "cable", "pipe",
+          "flange", "bearing", "spring", "clamp", "rivet", "anchor", "coupling", "fitting", "hose", "seal"]
+_MATERIALS = ["steel", "stainless", "brass", "copper", "nylon", "aluminium", "zinc", "rubber", "pvc", "carbon"]
+_FINISHES = ["galvanized", "black", "polished", "coated", "heavy duty", "hex", "flat", "round", "long", "short"]
+
+
+def word_overlap(a, b):
+    """Legacy description score from match_items_fuzzy (word-set overlap)"""
+    a_words = set((a or "").lower().split())
+    b_words = set((b or "").lower().split())
+    common = a_words & b_words
+    if not common:
+        return 0.0
+    return len(common) / max(len(a_words), len(b_words))
+
+
+def make_description(rng):
+    return "{} {} {} M{}x{}".format(
+        rng.choice(_FINISHES), rng.choice(_MATERIALS), rng.choice(_NOUNS),
+        rng.choice([4, 5, 6, 8, 10, 12]), rng.choice([10, 20, 25, 30, 40, 50, 60]),
+    ).title()
+
+
+def make_variant(desc, rng):
+    """Invoice-style rewrite of a PO description"""
+    words = desc.split()
+    style = rng.randrange(5)
+    if style == 0:
+        words = list(reversed(words))
+    elif style == 1:
+        return ",".join(w.upper() for w in words)
+    elif style == 2:
+        words = [w.replace("x", " X ") for w in words]
+    elif style == 3:
+        rng.shuffle(words)
+    else:
+        i = rng.randrange(len(words))
+        w = words[i]
+        if len(w) > 3:
+            j = rng.randrange(1, len(w) - 1)
+            words[i] = w[:j] + w[j + 1:]
+    return " ".join(words).lower() if rng.random() < 0.5 else " ".join(words)
+
+
+class Command(BaseCommand):
+    help = "Benchmark description similarity: legacy word overlap vs character n-gram index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", type=int, default=200, help="PO lines per document")
+        parser.add_argument("--queries", type=int, default=500, help="Invoice lines to score")
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        po_lines = [make_description(rng) for _ in range(options["lines"])]
+        targets = [rng.randrange(len(po_lines)) for _ in range(options["queries"])]
+        queries = [make_variant(po_lines[t], rng) for t in targets]
+
+        def top1(scores):
+            best = max(range(len(scores)), key=scores.__getitem__)
+            return best if scores[best] > 0 else None
+
+        # Legacy: pairwise word overlap
+        start = time.perf_counter()
+        legacy_hits = 0
+        for query, target in zip(queries, targets):
+            scores = [word_overlap(query, line) for line in po_lines]
+            legacy_hits += top1(scores) == target
+        legacy_secs = time.perf_counter() - start
+
+        # N-gram: index built once per PO, one sparse product per query
+        start = time.perf_counter()
+        index = NgramIndex.from_texts(po_lines)
+        ngram_hits = 0
+        for query, target in zip(queries, targets):
+            ngram_hits += top1(index.scores(ngram_vector(query))) == target
+        ngram_secs = time.perf_counter() - start
+
+        pairs = len(queries) * len(po_lines)
+        for name, hits, secs in (("word_overlap", legacy_hits, legacy_secs), ("char_ngram", ngram_hits, ngram_secs)):
+            self.stdout.write(
+                f"{name:<13} top1={hits / len(queries):6.1%}  {secs * 1000:8.1f} ms  {pairs / secs:12,.0f} pairs/s"
+            )
@@ -0,0 +1,19 @@
+# rebuild_po_ledger.py
+from django.core.management.base import BaseCommand
+
+from invoice_gate.ledger import rebuild_po_ledger
+from invoice_gate.models import PurchaseOrder
+
+
+class Command(BaseCommand):
+    help = "Recreate the per-line PO consumption ledger from the invoices linked to each purchase order."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--po", action="append", default=[], help="purchase_order_id to rebuild (repeatable; default: all)")
+
+    def handle(self, *args, **options):
+        purchase_orders = None
+        if options["po"]:
+            purchase_orders = PurchaseOrder.objects.filter(purchase_order_id__in=options["po"])
+        booked = rebuild_po_ledger(purchase_orders)
+        self.stdout.write(self.style.SUCCESS(f"Booked {booked} invoice(s) into the PO ledger"))
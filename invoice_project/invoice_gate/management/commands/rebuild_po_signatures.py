@@ -0,0 +1,27 @@
+# rebuild_po_signatures.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from invoice_gate.models import PurchaseOrder
+from invoice_gate.po_candidates import index_purchase_order
+
+
+class Command(BaseCommand):
+    help = "Rebuild the MinHash/LSH line-item signatures used to find candidate POs for invoices without a PO number."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--missing-only", action="store_true", help="Only index POs that have no signature yet")
+
+    def handle(self, *args, **options):
+        pos = PurchaseOrder.objects.only("pk", "payload").order_by("pk")
+        if options["missing_only"]:
+            pos = pos.filter(signature_bands__isnull=True)
+        count = 0
+        for po in pos.iterator(chunk_size=options["batch_size"]):
+            with transaction.atomic():
+                index_purchase_order(po)
+            count += 1
+            if count % options["batch_size"] == 0:
+                self.stdout.write(f"  {count} PO(s) indexed...")
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} purchase order(s)"))
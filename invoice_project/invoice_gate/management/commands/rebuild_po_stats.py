@@ -0,0 +1,19 @@
+# rebuild_po_stats.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from invoice_gate.stats import rebuild_po_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-PO counters (invoice count, run counts, last verification, open amount) from invoices and runs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true", help="Only count rows that are missing or out of date")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total, drifted = rebuild_po_stats(batch_size=options["batch_size"], dry_run=options["dry_run"])
+        verb = "would be fixed" if options["dry_run"] else "fixed"
+        self.stdout.write(self.style.SUCCESS(f"{total} purchase order(s), {drifted} stats row(s) {verb}"))
@@ -0,0 +1,35 @@
+# reconcile_invoices.py
+import json
+
+from django.core.management.base import BaseCommand
+
+from invoice_gate.reconcile import reconcile_unlinked_invoices
+
+
+class Command(BaseCommand):
+    help = (
+        "Link all unlinked invoices to purchase orders in one global pass "
+        "(blocking by PO number / vendor, rule-based scoring) and queue their re-verification "
+        "(with UPLOAD_PROCESSING_ASYNC; otherwise they are reported as unverified)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report the links that would be made")
+        parser.add_argument("--no-verify", action="store_true", help="Link only, do not queue re-verification jobs")
+        parser.add_argument("--limit", type=int, default=None, help="Only consider the N oldest unlinked invoices")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        def progress(stage_name, done, total):
+            self.stdout.write(f"  {stage_name}: {done}/{total}")
+
+        summary = reconcile_unlinked_invoices(
+            dry_run=options["dry_run"],
+            queue_verification=not options["no_verify"],
+            limit=options["limit"],
+            batch_size=options["batch_size"],
+            progress=progress,
+        )
+        for link in summary.pop("links", []):
+            self.stdout.write(f"  {link['invoice_id']} -> {link['po_id']} (score {link['score']})")
+        self.stdout.write(self.style.SUCCESS(json.dumps(summary)))
@@ -0,0 +1,54 @@
+# reverify_invoices.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice_gate.pipeline import ProcessingError
+from invoice_gate.reverify import reverify_invoices, select_invoices, what_if_statuses
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-verify stored invoices (of one PO, a list, or all) from their payloads - no OCR / extraction - "
+        "optionally under other tolerances. --what-if only reports the resulting statuses, computed in SQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--po", dest="purchase_order_id", help="PurchaseOrder UUID")
+        parser.add_argument("--invoice", dest="invoice_ids", action="append", help="Invoice UUID (repeatable)")
+        parser.add_argument("--all", action="store_true", help="All linked invoices")
+        parser.add_argument("--rel-tol", type=float)
+        parser.add_argument("--abs-tol", type=float)
+        parser.add_argument("--total-rel-tol", type=float)
+        parser.add_argument("--total-abs-tol", type=float)
+        parser.add_argument("--rules-only", action="store_true", help="Rule-based comparison only (no LLM calls)")
+        parser.add_argument("--what-if", action="store_true", help="Only report the statuses the latest runs would get")
+        parser.add_argument("--workers", type=int, default=None)
+
+    def handle(self, *args, **options):
+        try:
+            invoices = select_invoices(options["purchase_order_id"], options["invoice_ids"], options["all"])
+        except ProcessingError as exc:
+            raise CommandError(exc.message)
+        tolerances = {
+            "rel_tol": options["rel_tol"],
+            "abs_tol": options["abs_tol"],
+            "total_rel_tol": options["total_rel_tol"],
+            "total_abs_tol": options["total_abs_tol"],
+        }
+
+        if options["what_if"]:
+            summary = what_if_statuses(invoices, tolerances)
+            for change in summary.pop("changes"):
+                self.stdout.write(f"  {change['invoice_id']}: {change['from']} -> {change['to']}")
+            self.stdout.write(self.style.SUCCESS(json.dumps(summary)))
+            return
+
+        summary = reverify_invoices(
+            invoices,
+            tolerances=tolerances,
+            rules_only=options["rules_only"],
+            max_workers=options["workers"],
+            progress=lambda done, total: self.stdout.write(f"  verified: {done}/{total}"),
+        )
+        self.stdout.write(self.style.SUCCESS(json.dumps(summary)))
@@ -0,0 +1,73 @@
+# run_jobs.py
+import multiprocessing
+import time
+from multiprocessing.connection import wait
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from invoice_gate.jobs import prune_job_events, reclaim_expired_jobs, run_pending_jobs, work_forever
+
+# pause before replacing a worker process that died, so a crash loop does not spin
+RESPAWN_DELAY_SECONDS = 5
+
+
+def _worker_main(poll_interval):
+    # each child opens its own DB connection and leases jobs as host:pid
+    work_forever(poll_interval=poll_interval)
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued upload jobs (OCR, extraction, matching). Runs until stopped unless --once is given. "
+        "Safe to run on several nodes against the same database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit")
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument("--concurrency", type=int, default=1, help="Worker processes to run on this node")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            prune_job_events()
+            reclaim_expired_jobs()
+            count = run_pending_jobs()
+            self.stdout.write(self.style.SUCCESS(f"Processed {count} job(s)"))
+            return
+
+        concurrency = max(options["concurrency"], 1)
+        if concurrency == 1:
+            self.stdout.write("Waiting for jobs...")
+            work_forever(poll_interval=options["poll_interval"])
+            return
+
+        def start(n):
+            # connections must not be shared with forked children
+            connections.close_all()
+            process = multiprocessing.Process(
+                target=_worker_main,
+                args=(options["poll_interval"],),
+                name=f"run_jobs-{n}",
+            )
+            process.start()
+            return process
+
+        processes = [start(n) for n in range(concurrency)]
+        self.stdout.write(f"Started {concurrency} worker processes, waiting for jobs...")
+        try:
+            while True:
+                # block until a child exits, then replace it; its leased job is reclaimed once the lease expires
+                wait([process.sentinel for process in processes])
+                for n, process in enumerate(processes):
+                    if process.is_alive():
+                        continue
+                    process.join()
+                    self.stderr.write(f"{process.name} exited with code {process.exitcode}, restarting")
+                    time.sleep(RESPAWN_DELAY_SECONDS)
+                    processes[n] = start(n)
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
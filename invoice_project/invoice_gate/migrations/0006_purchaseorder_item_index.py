@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_gate', '0005_rename_verificationitemresult_itemverification_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='item_index',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_gate', '0006_purchaseorder_item_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='verificationrun',
+            name='stage_timings',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
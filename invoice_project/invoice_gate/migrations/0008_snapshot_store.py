@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:56
+#
+# Snapshot store, step 1 of 3: the store and the reference columns. The copy
+# and the removal of the inline columns are separate migrations (separate
+# transactions): on Postgres the new FKs are deferred constraints, and
+# ALTER TABLE on a table with pending trigger events from the copy fails.
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_gate', '0007_verificationrun_stage_timings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Snapshot',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='verificationrun',
+            name='invoice_snapshot_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='invoice_gate.snapshot'),
+        ),
+        migrations.AddField(
+            model_name='verificationrun',
+            name='po_snapshot_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='invoice_gate.snapshot'),
+        ),
+    ]
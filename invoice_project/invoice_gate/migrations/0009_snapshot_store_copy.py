@@ -0,0 +1,73 @@
+# Snapshot store, step 2 of 3: copy the inline run snapshots into the store.
+# Reversible: unapplying copies the stored snapshots back into the inline
+# columns, which step 3's reverse has re-added by then.
+
+import hashlib
+import json
+
+from django.db import migrations
+from django.db.models import Q
+
+
+def _digest(data):
+    text = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def move_snapshots_to_store(apps, schema_editor):
+    """Copy inline run snapshots into the content-addressed store"""
+    Snapshot = apps.get_model("invoice_gate", "Snapshot")
+    VerificationRun = apps.get_model("invoice_gate", "VerificationRun")
+
+    runs = VerificationRun.objects.only("id", "po_snapshot", "invoice_snapshot").iterator(chunk_size=500)
+    batch = []
+    for run in runs:
+        snapshots = {}
+        if run.po_snapshot:
+            run.po_snapshot_ref_id = _digest(run.po_snapshot)
+            snapshots[run.po_snapshot_ref_id] = run.po_snapshot
+        if run.invoice_snapshot:
+            run.invoice_snapshot_ref_id = _digest(run.invoice_snapshot)
+            snapshots[run.invoice_snapshot_ref_id] = run.invoice_snapshot
+        if not snapshots:
+            continue
+        Snapshot.objects.bulk_create(
+            [Snapshot(digest=d, data=data) for d, data in snapshots.items()],
+            ignore_conflicts=True,
+        )
+        batch.append(run)
+        if len(batch) >= 500:
+            VerificationRun.objects.bulk_update(batch, ["po_snapshot_ref", "invoice_snapshot_ref"])
+            batch = []
+    if batch:
+        VerificationRun.objects.bulk_update(batch, ["po_snapshot_ref", "invoice_snapshot_ref"])
+
+
+def restore_inline_snapshots(apps, schema_editor):
+    """Reverse: copy the referenced store snapshots back into the inline columns"""
+    VerificationRun = apps.get_model("invoice_gate", "VerificationRun")
+
+    runs = VerificationRun.objects.filter(Q(po_snapshot_ref__isnull=False) | Q(invoice_snapshot_ref__isnull=False))
+    batch = []
+    for run in runs.select_related("po_snapshot_ref", "invoice_snapshot_ref").iterator(chunk_size=500):
+        run.po_snapshot = run.po_snapshot_ref.data if run.po_snapshot_ref_id else None
+        run.invoice_snapshot = run.invoice_snapshot_ref.data if run.invoice_snapshot_ref_id else None
+        batch.append(run)
+        if len(batch) >= 500:
+            VerificationRun.objects.bulk_update(batch, ["po_snapshot", "invoice_snapshot"])
+            batch = []
+    if batch:
+        VerificationRun.objects.bulk_update(batch, ["po_snapshot", "invoice_snapshot"])
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0008_snapshot_store_copy')]
+
+    dependencies = [
+        ('invoice_gate', '0008_snapshot_store'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_snapshots_to_store, restore_inline_snapshots),
+    ]
@@ -0,0 +1,24 @@
+# Snapshot store, step 3 of 3: drop the inline snapshot columns. Reversing
+# re-adds them empty; step 2's reverse fills them from the store.
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0008_snapshot_store_cleanup')]
+
+    dependencies = [
+        ('invoice_gate', '0009_snapshot_store_copy'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='verificationrun',
+            name='invoice_snapshot',
+        ),
+        migrations.RemoveField(
+            model_name='verificationrun',
+            name='po_snapshot',
+        ),
+    ]
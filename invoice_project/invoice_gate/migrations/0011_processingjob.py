@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:01
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0009_processingjob')]
+
+    dependencies = [
+        ('invoice_gate', '0010_snapshot_store_cleanup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('kind', models.CharField(choices=[('purchase_order', 'Purchase Order'), ('invoice', 'Invoice')], max_length=20)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('stage', models.CharField(blank=True, max_length=50, null=True)),
+                ('saved_name', models.CharField(max_length=512)),
+                ('file_path', models.CharField(max_length=1024)),
+                ('filename', models.CharField(blank=True, max_length=255, null=True)),
+                ('params', models.JSONField(blank=True, null=True)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('error_status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='invoice_gat_status_7ed17f_idx')],
+            },
+        ),
+    ]
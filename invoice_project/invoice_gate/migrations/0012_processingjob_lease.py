@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0010_processingjob_lease')]
+
+    dependencies = [
+        ('invoice_gate', '0011_processingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='processingjob',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='processingjob',
+            name='locked_by',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='processingjob',
+            index=models.Index(fields=['status', 'lease_expires_at'], name='invoice_gat_status_3c155b_idx'),
+        ),
+    ]
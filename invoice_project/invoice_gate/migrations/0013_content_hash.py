@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0011_content_hash')]
+
+    dependencies = [
+        ('invoice_gate', '0012_processingjob_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0012_processingjobevent')]
+
+    dependencies = [
+        ('invoice_gate', '0013_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingJobEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(max_length=50)),
+                ('data', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='invoice_gate.processingjob')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['job', 'id'], name='invoice_gat_job_id_4c9f9b_idx')],
+            },
+        ),
+    ]
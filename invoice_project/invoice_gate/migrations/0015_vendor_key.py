@@ -0,0 +1,74 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:09
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# Frozen copy of keys.normalize_vendor_key as of this migration
+LEGAL_SUFFIXES = frozenset({
+    "ltd", "limited", "inc", "incorporated", "corp", "corporation", "co", "company",
+    "llc", "llp", "lp", "plc", "pvt", "private", "pte", "pty",
+    "gmbh", "mbh", "ag", "kg", "ug", "ohg", "ev",
+    "sa", "sas", "sarl", "srl", "spa", "sl", "bv", "nv", "oy", "ab", "as", "aps", "kk",
+})
+_non_alnum_rx = re.compile(r"[^0-9a-z]+")
+_dotted_rx = re.compile(r"\b((?:[a-z]\.){2,})")
+
+
+def _vendor_key(name):
+    if not name:
+        return None
+    text = unicodedata.normalize("NFKD", str(name))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold().replace("&", " and ")
+    text = _dotted_rx.sub(lambda m: m.group(1).replace(".", ""), text)
+    tokens = _non_alnum_rx.sub(" ", text).split()
+    while len(tokens) > 1 and tokens[-1] in LEGAL_SUFFIXES:
+        tokens.pop()
+    return " ".join(tokens)[:255] or None
+
+
+def fill_vendor_keys(apps, schema_editor):
+    for model_name in ("PurchaseOrder", "Invoice"):
+        model = apps.get_model("invoice_gate", model_name)
+        pending = []
+        rows = model.objects.filter(supplier_name__isnull=False).only("pk", "supplier_name").order_by("pk")
+        for obj in rows.iterator(chunk_size=1000):
+            obj.vendor_key = _vendor_key(obj.supplier_name)
+            pending.append(obj)
+            if len(pending) >= 1000:
+                model.objects.bulk_update(pending, ["vendor_key"])
+                pending = []
+        if pending:
+            model.objects.bulk_update(pending, ["vendor_key"])
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0013_vendor_key')]
+
+    dependencies = [
+        ('invoice_gate', '0014_processingjobevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='vendor_key',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='vendor_key',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['vendor_key', 'total'], name='invoice_gat_vendor__4795a9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['vendor_key', 'total'], name='invoice_gat_vendor__44f44e_idx'),
+        ),
+        migrations.RunPython(fill_vendor_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:11
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+_non_alnum_rx = re.compile(r"[^0-9a-z]+")
+
+
+def _po_number_key(value):
+    # frozen copy of keys.normalize_po_number as of this migration
+    if value is None:
+        return None
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return _non_alnum_rx.sub("", text)[:100] or None
+
+
+def fill_po_number_keys(apps, schema_editor):
+    PurchaseOrder = apps.get_model("invoice_gate", "PurchaseOrder")
+    pending = []
+    rows = PurchaseOrder.objects.only("pk", "purchase_order_id").order_by("pk")
+    for po in rows.iterator(chunk_size=1000):
+        po.po_number_key = _po_number_key(po.purchase_order_id)
+        pending.append(po)
+        if len(pending) >= 1000:
+            PurchaseOrder.objects.bulk_update(pending, ["po_number_key"])
+            pending = []
+    if pending:
+        PurchaseOrder.objects.bulk_update(pending, ["po_number_key"])
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0014_po_number_key')]
+
+    dependencies = [
+        ('invoice_gate', '0015_vendor_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='po_number_key',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.RunPython(fill_po_number_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0015_posignatureband')]
+
+    dependencies = [
+        ('invoice_gate', '0016_po_number_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='POSignatureBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField()),
+                ('purchase_order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='signature_bands', to='invoice_gate.purchaseorder')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket', 'purchase_order'], name='invoice_gat_bucket_029518_idx')],
+            },
+        ),
+    ]
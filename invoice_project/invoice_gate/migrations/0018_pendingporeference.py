@@ -0,0 +1,81 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:13
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+# Frozen copies of keys.normalize_vendor_key / normalize_po_number as of this migration
+LEGAL_SUFFIXES = frozenset({
+    "ltd", "limited", "inc", "incorporated", "corp", "corporation", "co", "company",
+    "llc", "llp", "lp", "plc", "pvt", "private", "pte", "pty",
+    "gmbh", "mbh", "ag", "kg", "ug", "ohg", "ev",
+    "sa", "sas", "sarl", "srl", "spa", "sl", "bv", "nv", "oy", "ab", "as", "aps", "kk",
+})
+_non_alnum_rx = re.compile(r"[^0-9a-z]+")
+_dotted_rx = re.compile(r"\b((?:[a-z]\.){2,})")
+
+
+def _fold(text):
+    text = unicodedata.normalize("NFKD", str(text))
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+
+
+def _vendor_key(name):
+    if not name:
+        return None
+    text = _dotted_rx.sub(lambda m: m.group(1).replace(".", ""), _fold(name).replace("&", " and "))
+    tokens = _non_alnum_rx.sub(" ", text).split()
+    while len(tokens) > 1 and tokens[-1] in LEGAL_SUFFIXES:
+        tokens.pop()
+    return " ".join(tokens)[:255] or None
+
+
+def _po_number_key(value):
+    if value is None:
+        return None
+    return _non_alnum_rx.sub("", _fold(value))[:100] or None
+
+
+def record_unlinked_invoices(apps, schema_editor):
+    # vendor keys come from supplier_name: the column is empty where 0013 ran without its backfill
+    Invoice = apps.get_model("invoice_gate", "Invoice")
+    PendingPOReference = apps.get_model("invoice_gate", "PendingPOReference")
+    refs = []
+    rows = Invoice.objects.filter(purchase_order__isnull=True).values_list("pk", "payload", "supplier_name", "total")
+    for pk, payload, supplier_name, total in rows.iterator(chunk_size=1000):
+        po_number = payload.get("po_number") if isinstance(payload, dict) else None
+        po_number_key = _po_number_key(po_number)
+        vendor_key = _vendor_key(supplier_name)
+        if po_number_key or vendor_key:
+            refs.append(PendingPOReference(invoice_id=pk, po_number_key=po_number_key, vendor_key=vendor_key, total=total))
+    PendingPOReference.objects.bulk_create(refs, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0016_pendingporeference')]
+
+    dependencies = [
+        ('invoice_gate', '0017_posignatureband'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingPOReference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('po_number_key', models.CharField(blank=True, db_index=True, max_length=100, null=True)),
+                ('vendor_key', models.CharField(blank=True, max_length=255, null=True)),
+                ('total', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('invoice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pending_po_reference', to='invoice_gate.invoice')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['vendor_key', 'total'], name='invoice_gat_vendor__3af53c_idx')],
+            },
+        ),
+        migrations.RunPython(record_unlinked_invoices, migrations.RunPython.noop),
+    ]
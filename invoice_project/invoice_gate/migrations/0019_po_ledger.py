@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0017_po_ledger')]
+
+    dependencies = [
+        ('invoice_gate', '0018_pendingporeference'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='discrepancy',
+            name='type',
+            field=models.CharField(choices=[('missing_item', 'Missing Item'), ('extra_item', 'Extra Item'), ('quantity_mismatch', 'Quantity Mismatch'), ('price_mismatch', 'Price Mismatch'), ('tax_mismatch', 'Tax Mismatch'), ('subtotal_mismatch', 'Subtotal Mismatch'), ('total_mismatch', 'Grand Total Mismatch'), ('currency_mismatch', 'Currency Mismatch'), ('po_link_mismatch', 'PO Link Mismatch'), ('over_billed', 'Over-billed (cumulative)')], max_length=30),
+        ),
+        migrations.CreateModel(
+            name='POLineLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('item_key', models.CharField(blank=True, max_length=100, null=True)),
+                ('description', models.CharField(blank=True, max_length=500, null=True)),
+                ('ordered_quantity', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('unit_price', models.DecimalField(blank=True, decimal_places=4, max_digits=14, null=True)),
+                ('invoiced_quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('invoiced_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('purchase_order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='line_ledger', to='invoice_gate.purchaseorder')),
+            ],
+            options={
+                'ordering': ['purchase_order', 'position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='POLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='invoice_gate.invoice')),
+                ('line', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='invoice_gate.polineledger')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='polineledger',
+            constraint=models.UniqueConstraint(fields=('purchase_order', 'position'), name='uniq_po_ledger_line'),
+        ),
+        migrations.AddConstraint(
+            model_name='poledgerentry',
+            constraint=models.UniqueConstraint(fields=('invoice', 'line'), name='uniq_po_ledger_entry'),
+        ),
+    ]
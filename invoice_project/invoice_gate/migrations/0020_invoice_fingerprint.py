@@ -0,0 +1,109 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:25
+
+import hashlib
+import re
+import unicodedata
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copies of the keys.py normalizers and invoice_fingerprint as of this migration
+LEGAL_SUFFIXES = frozenset({
+    "ltd", "limited", "inc", "incorporated", "corp", "corporation", "co", "company",
+    "llc", "llp", "lp", "plc", "pvt", "private", "pte", "pty",
+    "gmbh", "mbh", "ag", "kg", "ug", "ohg", "ev",
+    "sa", "sas", "sarl", "srl", "spa", "sl", "bv", "nv", "oy", "ab", "as", "aps", "kk",
+})
+_non_alnum_rx = re.compile(r"[^0-9a-z]+")
+_dotted_rx = re.compile(r"\b((?:[a-z]\.){2,})")
+_leading_zeros_rx = re.compile(r"(?<![0-9])0+(?=[0-9])")
+
+
+def _fold(text):
+    text = unicodedata.normalize("NFKD", str(text))
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+
+
+def _vendor_key(name):
+    if not name:
+        return None
+    text = _dotted_rx.sub(lambda m: m.group(1).replace(".", ""), _fold(name).replace("&", " and "))
+    tokens = _non_alnum_rx.sub(" ", text).split()
+    while len(tokens) > 1 and tokens[-1] in LEGAL_SUFFIXES:
+        tokens.pop()
+    return " ".join(tokens)[:255] or None
+
+
+def _invoice_number_key(value):
+    if value is None:
+        return None
+    key = _non_alnum_rx.sub("", _fold(value))[:100]
+    if not key:
+        return None
+    return _leading_zeros_rx.sub("", key) or None
+
+
+def _fingerprint(vendor_key, number_key, issue_date, total):
+    if not vendor_key or not number_key:
+        return None
+    total_text = f"{Decimal(total):.2f}" if total is not None else ""
+    data = "|".join([vendor_key, number_key, str(issue_date) if issue_date else "", total_text])
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def fill_fingerprints(apps, schema_editor):
+    # the vendor key is derived from supplier_name: the column is empty where 0013 ran without its backfill
+    Invoice = apps.get_model("invoice_gate", "Invoice")
+    fields = ["vendor_key", "invoice_number_key", "fingerprint"]
+    pending = []
+    rows = Invoice.objects.only("pk", "invoice_id", "supplier_name", "issue_date", "total").order_by("pk")
+    for invoice in rows.iterator(chunk_size=1000):
+        invoice.vendor_key = _vendor_key(invoice.supplier_name)
+        invoice.invoice_number_key = _invoice_number_key(invoice.invoice_id)
+        invoice.fingerprint = _fingerprint(
+            invoice.vendor_key, invoice.invoice_number_key, invoice.issue_date, invoice.total
+        )
+        pending.append(invoice)
+        if len(pending) >= 1000:
+            Invoice.objects.bulk_update(pending, fields)
+            pending = []
+    if pending:
+        Invoice.objects.bulk_update(pending, fields)
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0018_invoice_fingerprint')]
+
+    dependencies = [
+        ('invoice_gate', '0019_po_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='invoice_gate.invoice'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='invoice_number_key',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='discrepancy',
+            name='type',
+            field=models.CharField(choices=[('missing_item', 'Missing Item'), ('extra_item', 'Extra Item'), ('quantity_mismatch', 'Quantity Mismatch'), ('price_mismatch', 'Price Mismatch'), ('tax_mismatch', 'Tax Mismatch'), ('subtotal_mismatch', 'Subtotal Mismatch'), ('total_mismatch', 'Grand Total Mismatch'), ('currency_mismatch', 'Currency Mismatch'), ('po_link_mismatch', 'PO Link Mismatch'), ('over_billed', 'Over-billed (cumulative)'), ('duplicate_invoice', 'Duplicate Invoice')], max_length=30),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['vendor_key', 'invoice_number_key'], name='invoice_gat_vendor__a26c5c_idx'),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+
+
+def fill_po_stats(apps, schema_editor):
+    """Same computation as stats.rebuild_po_stats, on the historical models"""
+    PurchaseOrder = apps.get_model("invoice_gate", "PurchaseOrder")
+    Invoice = apps.get_model("invoice_gate", "Invoice")
+    VerificationRun = apps.get_model("invoice_gate", "VerificationRun")
+    POStats = apps.get_model("invoice_gate", "POStats")
+
+    invoices = {
+        row["purchase_order_id"]: row
+        for row in Invoice.objects.filter(purchase_order__isnull=False).values("purchase_order_id")
+        .annotate(n=Count("pk"), amount=Sum("total", filter=Q(duplicate_of__isnull=True)))
+    }
+    runs = {
+        row["purchase_order_id"]: row
+        for row in VerificationRun.objects.filter(purchase_order__isnull=False).values("purchase_order_id")
+        .annotate(
+            matched=Count("pk", filter=Q(status="matched")),
+            mismatched=Count("pk", filter=~Q(status="matched")),
+            last=Max("finished_at"),
+        )
+    }
+    rows = []
+    for po_id, total in PurchaseOrder.objects.values_list("pk", "total").iterator(chunk_size=1000):
+        inv = invoices.get(po_id) or {}
+        run = runs.get(po_id) or {}
+        invoiced = inv.get("amount") or 0
+        rows.append(POStats(
+            purchase_order_id=po_id,
+            invoice_count=inv.get("n") or 0,
+            matched_runs=run.get("matched") or 0,
+            mismatched_runs=run.get("mismatched") or 0,
+            last_verified_at=run.get("last"),
+            invoiced_amount=invoiced,
+            open_amount=total - invoiced if total is not None else None,
+        ))
+    POStats.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0019_postats')]
+
+    dependencies = [
+        ('invoice_gate', '0020_invoice_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='POStats',
+            fields=[
+                ('purchase_order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='invoice_gate.purchaseorder')),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('matched_runs', models.IntegerField(default=0)),
+                ('mismatched_runs', models.IntegerField(default=0)),
+                ('last_verified_at', models.DateTimeField(blank=True, null=True)),
+                ('invoiced_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('open_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(fill_po_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:45
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0020_processingjob_drop_file_path')]
+
+    dependencies = [
+        ('invoice_gate', '0021_postats'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='processingjob',
+            name='file_path',
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0021_processingjob_reconcile')]
+
+    dependencies = [
+        ('invoice_gate', '0022_processingjob_drop_file_path'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='processingjob',
+            name='kind',
+            field=models.CharField(choices=[('purchase_order', 'Purchase Order'), ('invoice', 'Invoice'), ('reconcile', 'Reconcile Invoices')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='processingjob',
+            name='saved_name',
+            field=models.CharField(blank=True, max_length=512),
+        ),
+    ]
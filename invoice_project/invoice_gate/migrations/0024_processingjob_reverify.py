@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0022_processingjob_reverify')]
+
+    dependencies = [
+        ('invoice_gate', '0023_processingjob_reconcile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='processingjob',
+            name='kind',
+            field=models.CharField(choices=[('purchase_order', 'Purchase Order'), ('invoice', 'Invoice'), ('reconcile', 'Reconcile Invoices'), ('reverify', 'Re-verify Invoices')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-19 08:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    replaces = [('invoice_gate', '0024_keyset_pagination_indexes')]
+
+    dependencies = [
+        ('invoice_gate', '0025_backfill_po_ledger'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='verificationrun',
+            name='invoice_gat_created_5f9844_idx',
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['created_at', 'id'], name='invoice_gat_created_86570b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['created_at', 'id'], name='invoice_gat_created_2186bb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verificationrun',
+            index=models.Index(fields=['created_at', 'id'], name='invoice_gat_created_5d44b9_idx'),
+        ),
+    ]
@@ -8,6 +8,8 @@ from django.db import models
 from django.utils import timezone
 from django.core.validators import MinValueValidator
 
+from .keys import invoice_fingerprint, normalize_invoice_number, normalize_po_number, normalize_vendor_key
+
 from .models import *  # noqa: F403
 
 
@@ -35,10 +37,116 @@ class PurchaseOrder(TimeStampedUUIDModel):
     # Full raw JSON you parsed/received for PO
     payload = models.JSONField(blank=True, null=True)
 
+    # Normalized line-item index built at upload time (see item_index.py)
+    item_index = models.JSONField(blank=True, null=True)
+
+    # SHA-256 of the uploaded document, used to skip re-processing duplicates
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+
+    # normalize_vendor_key(supplier_name), kept in sync by save()
+    vendor_key = models.CharField(max_length=255, blank=True, null=True)
+
+    # normalize_po_number(purchase_order_id), kept in sync by save()
+    po_number_key = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["vendor_key", "total"]),
+            models.Index(fields=["created_at", "id"]),  # keyset pagination (pagination.py)
+        ]
+
+    def save(self, *args, **kwargs):
+        self.vendor_key = normalize_vendor_key(self.supplier_name)
+        self.po_number_key = normalize_po_number(self.purchase_order_id)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            derived = set()
+            if "supplier_name" in update_fields:
+                derived.add("vendor_key")
+            if "purchase_order_id" in update_fields:
+                derived.add("po_number_key")
+            if derived:
+                kwargs["update_fields"] = {*update_fields, *derived}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"PO {self.purchase_order_id}"
 
 
+# ---------- PO consumption ledger ----------
+class POLineLedger(models.Model):
+    """
+    Running totals for one PO line across all invoices verified against it
+    (see ledger.py). position is the line's index in the PO payload items.
+    """
+    purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.CASCADE, related_name="line_ledger")
+    position = models.PositiveIntegerField()
+    item_key = models.CharField(max_length=100, blank=True, null=True)
+    description = models.CharField(max_length=500, blank=True, null=True)
+    ordered_quantity = models.DecimalField(max_digits=14, decimal_places=2, blank=True, null=True)
+    unit_price = models.DecimalField(max_digits=14, decimal_places=4, blank=True, null=True)
+    invoiced_quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    invoiced_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["purchase_order", "position"]
+        constraints = [
+            models.UniqueConstraint(fields=["purchase_order", "position"], name="uniq_po_ledger_line"),
+        ]
+
+    def __str__(self):
+        return f"PO {self.purchase_order_id} line {self.position}"
+
+
+class POLedgerEntry(models.Model):
+    """One invoice's contribution to a ledger line, so re-verifying the invoice replaces rather than adds"""
+    line = models.ForeignKey(POLineLedger, on_delete=models.CASCADE, related_name="entries")
+    invoice = models.ForeignKey("Invoice", on_delete=models.CASCADE, related_name="ledger_entries")
+    quantity = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["invoice", "line"], name="uniq_po_ledger_entry"),
+        ]
+
+
+# ---------- PO statistics ----------
+class POStats(models.Model):
+    """
+    Denormalized counters of one PO, updated in the transactions that link
+    invoices to it and write its runs (see stats.py) so list views read them
+    with a join instead of counting. rebuild_po_stats repairs any drift.
+    """
+    purchase_order = models.OneToOneField(
+        PurchaseOrder, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    invoice_count = models.IntegerField(default=0)
+    matched_runs = models.IntegerField(default=0)
+    mismatched_runs = models.IntegerField(default=0)
+    last_verified_at = models.DateTimeField(blank=True, null=True)
+    # totals of the linked invoices (duplicates excluded) and what is left of the PO total
+    invoiced_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    open_amount = models.DecimalField(max_digits=14, decimal_places=2, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stats of PO {self.purchase_order_id}"
+
+
+# ---------- PO candidate index ----------
+class POSignatureBand(models.Model):
+    """One LSH band of a PO's line-item MinHash signature (see po_candidates.py)"""
+    purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.CASCADE, related_name="signature_bands")
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["bucket", "purchase_order"]),
+        ]
+
+
 # ---------- Invoice ----------
 class InvoiceSource:
     EMAIL = "email"
@@ -82,16 +190,86 @@ class Invoice(TimeStampedUUIDModel):
     document_container = models.CharField(max_length=100, blank=True, null=True)  # e.g. "invoices"
     document_blob_path = models.CharField(max_length=512, blank=True, null=True)
 
+    # SHA-256 of the uploaded document, used to skip re-processing duplicates
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+
+    # normalize_vendor_key(supplier_name), kept in sync by save()
+    vendor_key = models.CharField(max_length=255, blank=True, null=True)
+
+    # duplicate detection (see duplicates.py): normalize_invoice_number(invoice_id) and
+    # invoice_fingerprint(vendor_key, number key, issue_date, total), kept in sync by save()
+    invoice_number_key = models.CharField(max_length=100, blank=True, null=True)
+    fingerprint = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    duplicate_of = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="duplicates"
+    )
+
     class Meta:
         indexes = [
             models.Index(fields=["invoice_id"]),
             models.Index(fields=["source_type", "source_ref"]),
+            models.Index(fields=["vendor_key", "total"]),
+            models.Index(fields=["vendor_key", "invoice_number_key"]),
+            models.Index(fields=["created_at", "id"]),  # keyset pagination (pagination.py)
         ]
 
+    def save(self, *args, **kwargs):
+        self.vendor_key = normalize_vendor_key(self.supplier_name)
+        self.invoice_number_key = normalize_invoice_number(self.invoice_id)
+        self.fingerprint = invoice_fingerprint(self.vendor_key, self.invoice_number_key, self.issue_date, self.total)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            derived = set()
+            if "supplier_name" in update_fields:
+                derived.add("vendor_key")
+            if "invoice_id" in update_fields:
+                derived.add("invoice_number_key")
+            if {"supplier_name", "invoice_id", "issue_date", "total"}.intersection(update_fields):
+                derived.add("fingerprint")
+            if derived:
+                kwargs["update_fields"] = {*update_fields, *derived}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Invoice {self.invoice_id}"
 
 
+class PendingPOReference(models.Model):
+    """
+    An invoice that could not be linked yet, keyed by the PO it refers to.
+    Matched (and deleted) when a PO with the same PO number, or the same
+    vendor key and total, is created (see jobs.relink_pending_invoices).
+    """
+    invoice = models.OneToOneField(Invoice, on_delete=models.CASCADE, related_name="pending_po_reference")
+    po_number_key = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    vendor_key = models.CharField(max_length=255, blank=True, null=True)
+    total = models.DecimalField(max_digits=14, decimal_places=2, blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["vendor_key", "total"]),
+        ]
+
+
+# ---------- Snapshot Store ----------
+class Snapshot(models.Model):
+    """
+    Content-addressed JSON snapshot (PO / invoice payload at verification time).
+    Keyed by the SHA-256 of the canonical JSON so identical payloads are stored once.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Snapshot {self.digest[:12]}"
+
+
 # ---------- Verification Results ----------
 class VerificationStatus:
     PENDING = "pending"
@@ -138,18 +316,40 @@ class VerificationRun(TimeStampedUUIDModel):
     started_at = models.DateTimeField(blank=True, null=True)
     finished_at = models.DateTimeField(blank=True, null=True)
     duration_ms = models.PositiveIntegerField(default=0)
+    # Per-stage pipeline timings: {"started_at", "finished_at", "total_ms", "totals": {...}, "stages": [...]}
+    stage_timings = models.JSONField(blank=True, null=True)
 
-    # Snapshots for audit
-    po_snapshot = models.JSONField(blank=True, null=True)
-    invoice_snapshot = models.JSONField(blank=True, null=True)
+    # Snapshots for audit (deduplicated, see snapshots.py)
+    po_snapshot_ref = models.ForeignKey(
+        Snapshot,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="+"
+    )
+    invoice_snapshot_ref = models.ForeignKey(
+        Snapshot,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="+"
+    )
 
     class Meta:
         ordering = ["-created_at"]
         indexes = [
             models.Index(fields=["status"]),
-            models.Index(fields=["created_at"]),
+            models.Index(fields=["created_at", "id"]),  # keyset pagination (pagination.py)
         ]
 
+    @property
+    def po_snapshot(self):
+        return self.po_snapshot_ref.data if self.po_snapshot_ref_id else None
+
+    @property
+    def invoice_snapshot(self):
+        return self.invoice_snapshot_ref.data if self.invoice_snapshot_ref_id else None
+
     def __str__(self):
         return f"Verify {self.invoice.invoice_id} vs PO {self.purchase_order.purchase_order_id if self.purchase_order else 'N/A'}"
 
@@ -177,6 +377,8 @@ class DiscrepancyType:
     TOTAL_MISMATCH = "total_mismatch"
     CURRENCY_MISMATCH = "currency_mismatch"
     PO_LINK_MISMATCH = "po_link_mismatch"
+    OVER_BILLED = "over_billed"
+    DUPLICATE_INVOICE = "duplicate_invoice"
 
     CHOICES = [
         (MISSING_ITEM, "Missing Item"),
@@ -188,6 +390,8 @@ class DiscrepancyType:
         (TOTAL_MISMATCH, "Grand Total Mismatch"),
         (CURRENCY_MISMATCH, "Currency Mismatch"),
         (PO_LINK_MISMATCH, "PO Link Mismatch"),
+        (OVER_BILLED, "Over-billed (cumulative)"),
+        (DUPLICATE_INVOICE, "Duplicate Invoice"),
     ]
 
 
@@ -247,3 +451,93 @@ class Discrepancy(TimeStampedUUIDModel):
         target = f"Item {self.item_result.item_id}" if self.item_result_id else "Header/Total"
         return f"[{self.get_level_display()}] {self.get_type_display()} - {target}"
 
+
+
+# ---------- Background Processing Jobs ----------
+class JobKind:
+    PURCHASE_ORDER = "purchase_order"
+    INVOICE = "invoice"
+    RECONCILE = "reconcile"  # bulk: link unlinked invoices (reconcile.py), no file
+    REVERIFY = "reverify"  # bulk: re-verify stored invoices (reverify.py), no file
+
+    CHOICES = [
+        (PURCHASE_ORDER, "Purchase Order"),
+        (INVOICE, "Invoice"),
+        (RECONCILE, "Reconcile Invoices"),
+        (REVERIFY, "Re-verify Invoices"),
+    ]
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+
+
+class ProcessingJob(TimeStampedUUIDModel):
+    """
+    One uploaded document waiting for / going through the processing
+    pipeline, or one bulk operation (reconciliation, re-verification). Rows are claimed and
+    run by the `run_jobs` worker (see jobs.py).
+    """
+    kind = models.CharField(max_length=20, choices=JobKind.CHOICES)
+    status = models.CharField(max_length=20, choices=JobStatus.CHOICES, default=JobStatus.QUEUED)
+    stage = models.CharField(max_length=50, blank=True, null=True)  # current pipeline stage while running
+
+    # Uploaded file: its name in default_storage (workers read it from there); empty for bulk jobs
+    saved_name = models.CharField(max_length=512, blank=True)
+    filename = models.CharField(max_length=255, blank=True, null=True)
+    params = models.JSONField(blank=True, null=True)  # e.g. {"purchase_order_id": ...}
+
+    result = models.JSONField(blank=True, null=True)  # same payload the synchronous endpoint returns
+    error = models.TextField(blank=True, null=True)
+    error_status = models.PositiveSmallIntegerField(blank=True, null=True)  # HTTP status the sync endpoint would use
+
+    attempts = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    # Lease held by the worker running the job; renewed by heartbeats and
+    # reclaimed by other workers once it expires (crashed worker)
+    locked_by = models.CharField(max_length=255, blank=True, null=True)
+    lease_expires_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["status", "lease_expires_at"]),
+        ]
+
+    def __str__(self):
+        return f"Job {self.kind} {self.filename or self.saved_name} ({self.status})"
+
+
+class ProcessingJobEvent(models.Model):
+    """
+    Progress event emitted by the pipeline while a job runs (stage finished,
+    page OCRed, ...). The auto-increment id is the `after` cursor of the
+    events long-poll (jobs.wait_for_job_events).
+    """
+    job = models.ForeignKey(ProcessingJob, on_delete=models.CASCADE, related_name="events")
+    event = models.CharField(max_length=50)
+    data = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["job", "id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.event} (job {self.job_id})"
@@ -0,0 +1,203 @@
+# numeric.py
+"""
+Shared money / number parsing for OCR output, LLM extraction and comparison.
+
+Handles currency symbols, codes and abbreviations before or after the amount
+("$12", "USD 12", "Rs. 12", "12 EUR"), grouping separators in both
+conventions ("1,234.56" and "1.234,56"), Swiss apostrophes, spaces, and
+negatives written as "-12", "12-" or "(12)", and the "/-" ending of rupee
+amounts ("Rs. 500/-"). Letters between digits (exponents such as "1e5",
+"2x3") and any other slash (dates, fractions such as "1/2") make a string
+unparseable. String parses are memoized because the same amounts repeat
+across headers, line items and re-verifications.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+# Keys tried (in order) when an amount arrives wrapped in a dict, e.g. {'VAT_amount': 123.0}
+AMOUNT_KEYS = ("amount", "value", "total", "amount_due", "VAT_amount", "vat_amount")
+
+ITEM_NUMERIC_FIELDS = ("quantity", "unit_price", "line_total")
+HEADER_NUMERIC_FIELDS = ("subtotal", "tax", "total")
+
+_strip_rx = re.compile(r"[^\d.,'\-()]")
+_letters_rx = re.compile(r"[^\W\d_]")
+_currency_word_rx = re.compile(r"[^\W\d_]+\.?")  # "USD", "Rs.", "Fr."
+_digits_rx = re.compile(r"\d")
+_slash_dash_rx = re.compile(r"/-$")  # "Rs. 500/-"
+_comma_decimal_rx = re.compile(r"^\d{1,3}(?:\.\d{3})+,\d+$|^\d+,\d{1,2}$|^\d+,\d{4,}$")
+_dot_decimal_rx = re.compile(r"^\d{1,3}(?:,\d{3})+\.\d+$|^\d+\.\d{1,2}$|^\d+\.\d{4,}$")
+
+
+# ---------- Convention detection ----------
+def _clean(text):
+    """Drop everything except digits, separators and sign markers"""
+    return _strip_rx.sub("", text)
+
+
+def _strip_currency(text):
+    """
+    Remove currency words (with an abbreviation dot) around the digits, so
+    the dot of "Rs. 100" is not read as a decimal point. Returns None when
+    letters sit between digits.
+    """
+    digits = [m.start() for m in _digits_rx.finditer(text)]
+    if not digits:
+        return text
+    first, last = digits[0], digits[-1] + 1
+    if _letters_rx.search(text, first, last):
+        return None
+    return _currency_word_rx.sub("", text[:first]) + text[first:last] + _currency_word_rx.sub("", text[last:])
+
+
+def detect_decimal_separator(texts):
+    """
+    Return "," or "." when the given strings unambiguously use one decimal
+    convention, else None. Ambiguous values such as "1,234" or "1.234" are
+    ignored; the first unambiguous value decides.
+    """
+    for text in texts:
+        body = _clean(_strip_currency(text) or "").strip("-()").replace("'", "")
+        if _comma_decimal_rx.match(body):
+            return ","
+        if _dot_decimal_rx.match(body):
+            return "."
+    return None
+
+
+# ---------- Parsing ----------
+@lru_cache(maxsize=8192)
+def _parse_string(text, decimal_sep):
+    s = _slash_dash_rx.sub("", text)
+    if "/" in s:
+        return None
+    s = _strip_currency(s)
+    if s is None:
+        return None
+    s = _clean(s)
+    if not _digits_rx.search(s):
+        return None
+
+    negative = False
+    if s.startswith("(") and s.endswith(")"):
+        negative, s = True, s[1:-1]
+    s = s.replace("(", "").replace(")", "")
+    if s.startswith("-"):
+        negative, s = True, s.lstrip("-")
+    elif s.endswith("-"):
+        negative, s = True, s.rstrip("-")
+    s = s.replace("'", "")
+    if "-" in s:
+        return None
+
+    has_dot, has_comma = "." in s, "," in s
+    if has_dot and has_comma:
+        # the right-most separator is the decimal one
+        sep = "," if s.rfind(",") > s.rfind(".") else "."
+    elif has_comma:
+        head, _, tail = s.rpartition(",")
+        if decimal_sep == ",":
+            sep = ","
+        elif decimal_sep == "." or s.count(",") > 1 or (len(tail) == 3 and head.lstrip("0")):
+            sep = "."  # "1,234" / "1,234,567" -> grouping commas
+        else:
+            sep = ","  # "12,5" / "1234,56"
+    elif has_dot and s.count(".") > 1:
+        sep = ","  # "1.234.567" -> grouping dots
+    elif has_dot and decimal_sep == ",":
+        head, _, tail = s.rpartition(".")
+        sep = "," if (len(tail) == 3 and head.lstrip("0")) else "."
+    else:
+        sep = "."
+
+    group = "," if sep == "." else "."
+    s = s.replace(group, "")
+    if sep == ",":
+        s = s.replace(",", ".")
+    if s.count(".") > 1 or s in ("", "."):
+        return None
+    try:
+        value = Decimal(s)
+    except (InvalidOperation, ValueError):
+        return None
+    return -value if negative else value
+
+
+def parse_decimal(value, decimal_sep=None):
+    """
+    Convert a value to Decimal or return None.
+
+    Accepts numbers, numeric strings (with currency symbols, grouping and
+    either decimal convention) or dicts like {'VAT_amount': 123.0}.
+    decimal_sep forces the convention for ambiguous strings ("1.234").
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, Decimal):
+        return value if value.is_finite() else None
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, float):
+        if value != value or value in (float("inf"), float("-inf")):
+            return None
+        return Decimal(str(value))
+    if isinstance(value, str):
+        return _parse_string(value.strip(), decimal_sep)
+    if isinstance(value, dict):
+        for key in AMOUNT_KEYS:
+            if key in value:
+                return parse_decimal(value[key], decimal_sep)
+        for v in value.values():
+            if isinstance(v, (int, float, str, Decimal)):
+                dec = parse_decimal(v, decimal_sep)
+                if dec is not None:
+                    return dec
+    return None
+
+
+def parse_number(value, decimal_sep=None):
+    """Same as parse_decimal but returns a float (for JSON payloads)"""
+    dec = parse_decimal(value, decimal_sep)
+    return float(dec) if dec is not None else None
+
+
+# ---------- Whole-document normalization ----------
+def normalize_items(items, fields=ITEM_NUMERIC_FIELDS, decimal_sep=None):
+    """
+    Convert the numeric fields of a list of item dicts to floats in place.
+
+    The decimal convention is detected once for the whole list (unless given),
+    so an ambiguous "1.234" on one line is read the same way as "2.345,50" on
+    another. Returns the detected separator.
+    """
+    if decimal_sep is None:
+        decimal_sep = detect_decimal_separator(
+            item[f] for item in items if isinstance(item, dict)
+            for f in fields if isinstance(item.get(f), str)
+        )
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        for field in fields:
+            if field in item:
+                item[field] = parse_number(item[field], decimal_sep)
+    return decimal_sep
+
+
+def normalize_document_numbers(data):
+    """
+    Normalize header totals and line items of a parsed document in one pass,
+    sharing a single detected decimal convention. Mutates and returns data.
+    """
+    items = data.get("items") if isinstance(data.get("items"), list) else []
+    decimal_sep = detect_decimal_separator(
+        [data[f] for f in HEADER_NUMERIC_FIELDS if isinstance(data.get(f), str)]
+        + [item[f] for item in items if isinstance(item, dict)
+           for f in ITEM_NUMERIC_FIELDS if isinstance(item.get(f), str)]
+    )
+    for field in HEADER_NUMERIC_FIELDS:
+        if field in data:
+            data[field] = parse_number(data[field], decimal_sep)
+    normalize_items(items, decimal_sep=decimal_sep)
+    return data
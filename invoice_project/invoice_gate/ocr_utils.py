@@ -12,6 +12,9 @@ import pytesseract
 # Mistral SDK (latest version)
 from mistralai import Mistral
 
+from .numeric import normalize_document_numbers, parse_number
+from .timing import stage
+
 # Setup logging
 logger = logging.getLogger(__name__)
 
@@ -101,17 +104,23 @@ def preprocess_image(image: Image.Image) -> Image.Image:
         return image
 
 
-def file_to_text(filepath: str) -> str:
+def file_to_text(filepath: str, timer=None, data: bytes = None) -> str:
     """
     Convert PDF or image file to text using OCR
+    Each page is recorded as an "ocr_page" stage on the optional PipelineTimer.
+    When the upload is still in memory, pass its bytes as data to skip
+    re-reading the file from disk (filepath is then only used for logging).
     """
     log("Processing file:", filepath)
-    ext = os.path.splitext(filepath)[1].lower()
+    if data is not None:
+        ext = ".pdf" if data.startswith(b"%PDF-") else ".image"
+    else:
+        ext = os.path.splitext(filepath)[1].lower()
     
     try:
         if ext == ".pdf":
             log("PDF detected, converting pages to images using PyMuPDF")
-            doc = fitz.open(filepath)
+            doc = fitz.open(stream=data, filetype="pdf") if data is not None else fitz.open(filepath)
             all_text = []
             
             total_pages = len(doc)
@@ -119,34 +128,37 @@ def file_to_text(filepath: str) -> str:
             log(f"PDF has {total_pages} pages, processing first {pages_to_process}")
             
             for i in range(pages_to_process):
-                try:
-                    log(f"Processing page {i+1}/{pages_to_process}")
-                    page = doc[i]
-                    
-                    # Try to extract text directly first (faster for text-based PDFs)
-                    direct_text = page.get_text()
-                    if direct_text and len(direct_text.strip()) > 50:
-                        log(f"Page {i+1}: Using direct text extraction")
-                        all_text.append(direct_text)
+                with stage(timer, "ocr_page", page=i + 1) as timing:
+                    try:
+                        log(f"Processing page {i+1}/{pages_to_process}")
+                        page = doc[i]
+                        
+                        # Try to extract text directly first (faster for text-based PDFs)
+                        direct_text = page.get_text()
+                        if direct_text and len(direct_text.strip()) > 50:
+                            log(f"Page {i+1}: Using direct text extraction")
+                            timing["method"] = "direct"
+                            all_text.append(direct_text)
+                            continue
+                        
+                        # If no text, use OCR
+                        log(f"Page {i+1}: Using OCR")
+                        timing["method"] = "ocr"
+                        pix = page.get_pixmap(dpi=300)
+                        img_data = pix.tobytes("png")
+                        image = Image.open(io.BytesIO(img_data))
+                        
+                        processed_image = preprocess_image(image)
+                        page_text = run_local_ocr(processed_image)
+                        
+                        if page_text.strip():
+                            all_text.append(page_text)
+                        
+                        del pix, image, processed_image
+                        
+                    except Exception as page_error:
+                        logger.error(f"Error processing page {i+1}: {page_error}")
                         continue
-                    
-                    # If no text, use OCR
-                    log(f"Page {i+1}: Using OCR")
-                    pix = page.get_pixmap(dpi=300)
-                    img_data = pix.tobytes("png")
-                    image = Image.open(io.BytesIO(img_data))
-                    
-                    processed_image = preprocess_image(image)
-                    page_text = run_local_ocr(processed_image)
-                    
-                    if page_text.strip():
-                        all_text.append(page_text)
-                    
-                    del pix, image, processed_image
-                    
-                except Exception as page_error:
-                    logger.error(f"Error processing page {i+1}: {page_error}")
-                    continue
             
             doc.close()
             final_text = "\n\n--- PAGE BREAK ---\n\n".join(all_text)
@@ -156,9 +168,10 @@ def file_to_text(filepath: str) -> str:
         else:
             # Image file
             log("Image file detected")
-            image = Image.open(filepath)
-            processed_image = preprocess_image(image)
-            text = run_local_ocr(processed_image)
+            with stage(timer, "ocr_page", page=1, method="ocr"):
+                image = Image.open(io.BytesIO(data) if data is not None else filepath)
+                processed_image = preprocess_image(image)
+                text = run_local_ocr(processed_image)
             log(f"Image processing complete. Text length: {len(text)}")
             return text
             
@@ -330,48 +343,23 @@ Return ONLY the JSON object:"""
         if not data.get("doc_type"):
             data["doc_type"] = doc_type_hint or "unknown"
         
-        # Normalize numeric fields
-        for field in ["subtotal", "tax", "total"]:
-            if field in data:
-                if isinstance(data[field], str):
-                    try:
-                        cleaned = re.sub(r"[^\d.]", "", data[field])
-                        data[field] = float(cleaned) if cleaned else None
-                    except Exception:
-                        data[field] = None
-                elif isinstance(data[field], (int, float)):
-                    data[field] = float(data[field])
-
         # Normalize items array
         if "items" not in data or not isinstance(data["items"], list):
             data["items"] = []
         
-        normalized_items = []
-        for item in data["items"]:
-            normalized_item = {
+        data["items"] = [
+            {
                 "item_id": item.get("item_id"),
                 "description": item.get("description"),
-                "quantity": None,
-                "unit_price": None,
-                "line_total": None
+                "quantity": item.get("quantity"),
+                "unit_price": item.get("unit_price"),
+                "line_total": item.get("line_total")
             }
-            
-            for field in ["quantity", "unit_price", "line_total"]:
-                value = item.get(field)
-                if isinstance(value, str):
-                    try:
-                        cleaned = re.sub(r"[^\d.]", "", value)
-                        normalized_item[field] = float(cleaned) if cleaned else None
-                    except Exception:
-                        normalized_item[field] = None
-                elif isinstance(value, (int, float)):
-                    normalized_item[field] = float(value)
-                else:
-                    normalized_item[field] = value
-            
-            normalized_items.append(normalized_item)
-        
-        data["items"] = normalized_items
+            for item in data["items"] if isinstance(item, dict)
+        ]
+
+        # Normalize numeric fields (header totals + items share one decimal convention)
+        normalize_document_numbers(data)
 
         # Add metadata
         data["raw_text"] = ocr_text[:1000]
@@ -423,20 +411,12 @@ def parse_items_from_text(text: str) -> list:
         match = item_pattern.search(line)
         if match:
             desc, qty, price, total = match.groups()
-            try:
-                quantity = int(qty)
-                unit_price = float(price.replace(",", ""))
-                line_total = float(total.replace(",", ""))
-                
-                items.append({
-                    "description": desc.strip(),
-                    "quantity": quantity,
-                    "unit_price": unit_price,
-                    "line_total": line_total
-                })
-                continue
-            except Exception:
-                pass
+            items.append({
+                "description": desc.strip(),
+                "quantity": int(qty),
+                "unit_price": parse_number(price),
+                "line_total": parse_number(total)
+            })
     
     log(f"Regex parsed {len(items)} line items")
     return items
@@ -497,26 +477,17 @@ def extract_with_regex(text: str, doc_type: str = None) -> dict:
     # Extract totals
     total_match = re.search(r"(grand\s*total|total)[^\d]*([\d\.,]+)", text, re.IGNORECASE)
     if total_match:
-        try:
-            result["total"] = float(total_match.group(2).replace(",", ""))
-        except Exception:
-            pass
+        result["total"] = parse_number(total_match.group(2))
 
     # Extract subtotal
     subtotal_match = re.search(r"subtotal[^\d]*([\d\.,]+)", text, re.IGNORECASE)
     if subtotal_match:
-        try:
-            result["subtotal"] = float(subtotal_match.group(1).replace(",", ""))
-        except Exception:
-            pass
+        result["subtotal"] = parse_number(subtotal_match.group(1))
 
     # Extract tax
     tax_match = re.search(r"tax[^\d]*([\d\.,]+)", text, re.IGNORECASE)
     if tax_match:
-        try:
-            result["tax"] = float(tax_match.group(1).replace(",", ""))
-        except Exception:
-            pass
+        result["tax"] = parse_number(tax_match.group(1))
 
     # Parse items
     result["items"] = parse_items_from_text(text)
@@ -526,37 +497,49 @@ def extract_with_regex(text: str, doc_type: str = None) -> dict:
     return result
 
 
-def extract_structured_fields(text: str, doc_type_hint: str = None) -> dict:
+def extract_structured_fields(text: str, doc_type_hint: str = None, timer=None) -> dict:
     """
     Main extraction function - tries Mistral first, falls back to regex
+    Records "classify" and "extract" stages on the optional PipelineTimer.
     """
     log("Starting structured field extraction")
     log(f"Text length: {len(text)} characters")
     
     # Classify document type
-    doc_type = classify_document_type(text)
-    if doc_type_hint:
-        doc_type = doc_type_hint
+    with stage(timer, "classify") as timing:
+        doc_type = classify_document_type(text)
+        if doc_type_hint:
+            doc_type = doc_type_hint
+        timing["doc_type"] = doc_type
     log(f"Document classified as: {doc_type}")
 
     # Get Mistral API key
     api_key = os.getenv("MISTRAL_API_KEY") or getattr(settings, "MISTRAL_API_KEY", None)
 
-    # Try Mistral extraction
-    if api_key and api_key.strip():
-        log("Attempting Mistral AI extraction")
-        mistral_data = run_mistral_extraction(text, api_key, doc_type_hint=doc_type)
-        
-        # Check if successful
-        if (mistral_data.get("extraction_method") == "mistral" and 
-            (mistral_data.get("total") is not None or len(mistral_data.get("items", [])) > 0)):
-            log("✓ Mistral extraction successful")
-            return mistral_data
+    with stage(timer, "extract") as timing:
+        data = None
+        # Try Mistral extraction
+        if api_key and api_key.strip():
+            log("Attempting Mistral AI extraction")
+            mistral_data = run_mistral_extraction(text, api_key, doc_type_hint=doc_type)
+            
+            # Check if successful
+            if (mistral_data.get("extraction_method") == "mistral" and 
+                (mistral_data.get("total") is not None or len(mistral_data.get("items", [])) > 0)):
+                log("✓ Mistral extraction successful")
+                timing["method"] = "mistral"
+                data = mistral_data
+            else:
+                log(f"✗ Mistral extraction incomplete: {mistral_data.get('extraction_method')}")
         else:
-            log(f"✗ Mistral extraction incomplete: {mistral_data.get('extraction_method')}")
-    else:
-        log("No Mistral API key - skipping AI extraction")
+            log("No Mistral API key - skipping AI extraction")
+
+        if data is None:
+            # Fallback to regex
+            log("Using regex fallback")
+            timing["method"] = "regex"
+            data = extract_with_regex(text, doc_type)
 
-    # Fallback to regex
-    log("Using regex fallback")
-    return extract_with_regex(text, doc_type)
+        # summary for progress listeners (see jobs.py)
+        timing["item_count"] = len(data.get("items") or [])
+    return data
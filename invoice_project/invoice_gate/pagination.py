@@ -0,0 +1,90 @@
+# pagination.py
+"""
+Keyset pagination for the dashboard list endpoints.
+
+Lists are ordered by (created_at, id), newest first. A page request with
+`cursor` (the opaque `next_cursor` of the previous page) continues with
+`WHERE created_at < c OR (created_at = c AND id < i)` - the expanded form
+of `(created_at, id) < (c, i)` - which walks the (created_at, id) index of
+each listed table instead of skipping `offset` rows. One extra row is read
+to know whether there is a next page. Totals are only counted when asked for
+(`count=true`).
+
+Requests without a cursor keep the old contract: `limit` / `offset` slicing
+and an exact `count` (`count=false` skips it). Both kinds of response
+carry `next_cursor`, so a client can switch to cursors from any page.
+"""
+import base64
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.response import Response
+
+MAX_LIMIT = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(obj):
+    raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(created_at, pk) from a cursor; raises InvalidCursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_text, pk_text = raw.split("|", 1)
+        created_at = parse_datetime(created_text)
+        pk = uuid.UUID(pk_text)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise InvalidCursor("Invalid cursor") from exc
+    if created_at is None:
+        raise InvalidCursor("Invalid cursor")
+    return created_at, pk
+
+
+def _flag(value, default):
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes")
+
+
+def paginate(queryset, limit, offset=0, cursor=None):
+    """(rows, next_cursor) for one page of queryset, newest first"""
+    queryset = queryset.order_by("-created_at", "-id")
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        offset = 0
+    rows = list(queryset[offset:offset + limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+class KeysetPaginationMixin:
+    """list() for ListAPIViews: cursor pages, or the legacy limit / offset ones"""
+    default_limit = 10
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        limit = min(max(int(params.get('limit', self.default_limit)), 1), MAX_LIMIT)
+        offset = max(int(params.get('offset', 0)), 0)
+        cursor = params.get('cursor') or None
+
+        queryset = self.get_queryset()
+        try:
+            rows, next_cursor = paginate(queryset, limit, offset=offset, cursor=cursor)
+        except InvalidCursor as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = {}
+        if _flag(params.get('count'), default=cursor is None):
+            data['count'] = queryset.count()
+        data['results'] = self.get_serializer(rows, many=True).data
+        data['next_cursor'] = next_cursor
+        return Response(data)
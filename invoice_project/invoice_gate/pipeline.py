@@ -0,0 +1,534 @@
+# pipeline.py
+"""
+Document processing pipeline behind the upload endpoints.
+
+OCR, extraction, PO linking and comparison all run before anything is
+written; the resulting rows are then inserted in a single transaction
+(one INSERT per table) instead of create-then-update round trips.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.db import IntegrityError, connection, transaction
+from django.utils.dateparse import parse_date
+
+from .models import PurchaseOrder, Invoice, PendingPOReference, VerificationRun, VerificationStatus
+from .ocr_utils import file_to_text, extract_structured_fields
+from .compare import (
+    compare_one_pair,
+    fallback_comparison,
+    build_compared_payload,
+    normalize_compared_payload,
+    persist_verification,
+)
+from .duplicates import (
+    duplicate_details,
+    duplicate_result,
+    find_billing_duplicate,
+    flag_duplicate,
+    rejects_duplicates,
+)
+from .item_index import build_item_index, get_po_item_index
+from .keys import normalize_po_number, normalize_vendor_key
+from .numeric import parse_decimal
+from .po_cache import lookup_purchase_order
+from .po_candidates import pick_candidate_purchase_order
+from .snapshots import build_snapshot, save_snapshots
+from .stats import update_po_stats
+from .timing import PipelineTimer, stage
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessingError(Exception):
+    """A document could not be processed; message is safe to return to clients"""
+
+    def __init__(self, message, detail=None, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.detail = detail
+        self.status_code = status_code
+
+    def as_response_data(self):
+        data = {"error": self.message}
+        if self.detail:
+            data["detail"] = self.detail
+        return data
+
+
+# ---------- helpers ----------
+def extract_vendor_name(vendor_field):
+    """
+    vendor_field may be a string or dict (like {'name': 'Foo', ...}).
+    Return a concise string or None.
+    """
+    if not vendor_field:
+        return None
+    if isinstance(vendor_field, str):
+        return vendor_field.strip()[:255] or None
+    if isinstance(vendor_field, dict):
+        # prefer "name" then "vendor" then attempt join of address/name
+        for key in ("name", "vendor", "supplier", "supplier_name"):
+            if key in vendor_field and vendor_field[key]:
+                return str(vendor_field[key]).strip()[:255]
+        # fallback to concatenating first few values
+        vals = [str(v).strip() for v in vendor_field.values() if v and isinstance(v, (str, int, float))]
+        if vals:
+            return " | ".join(vals)[:255]
+    # other types
+    try:
+        return str(vendor_field)[:255]
+    except Exception:
+        return None
+
+
+def parse_document_date(value):
+    """Best-effort date parsing; the raw string stays in the payload"""
+    if not value:
+        return None
+    try:
+        return parse_date(value) or None
+    except Exception:
+        return None
+
+
+def extract_document(fullpath, doc_type, timer=None, data=None):
+    """OCR + structured extraction. Raises ProcessingError on empty text."""
+    text = file_to_text(fullpath, timer=timer, data=data)
+    if not text.strip():
+        raise ProcessingError("OCR / text extraction failed - empty text")
+    return extract_structured_fields(text, doc_type_hint=doc_type, timer=timer) or {}
+
+
+# ---------- Purchase orders ----------
+def process_purchase_order(saved_name, fullpath, filename, timer=None, content_hash=None, data=None):
+    """
+    Extract a PO document and insert it with a single INSERT.
+    data optionally holds the file bytes when the upload is still in memory.
+    Returns (po_obj, parsed).
+    """
+    parsed = extract_document(fullpath, "po", timer=timer, data=data)
+
+    # attach file path in payload before the row is written
+    parsed.setdefault("_storage", {})["document_blob_path"] = saved_name
+
+    purchase_order_id = parsed.get("id") or filename
+    po_obj = PurchaseOrder(
+        purchase_order_id=purchase_order_id,
+        currency=parsed.get("currency") or None,
+        subtotal=parse_decimal(parsed.get("subtotal")),
+        tax=parse_decimal(parsed.get("tax")),
+        total=parse_decimal(parsed.get("total")),
+        issued_date=parse_document_date(parsed.get("date")),
+        buyer_name=parsed.get("buyer") or parsed.get("requested_by") or None,
+        supplier_name=extract_vendor_name(parsed.get("vendor")),
+        payload=parsed,
+        item_index=build_item_index(parsed.get("items")),
+        content_hash=content_hash
+    )
+    try:
+        with stage(timer, "persist") as timing, transaction.atomic():
+            po_obj.save(force_insert=True)  # LSH bands are written by the post_save signal
+            timing["po_id"] = purchase_order_id
+    except IntegrityError:
+        raise ProcessingError(f"Already exists: {purchase_order_id}")
+
+    if timer:
+        timer.finish()
+        logger.info("PO %s processed in %sms: %s", po_obj.purchase_order_id, timer.duration_ms, timer.totals())
+    return po_obj, parsed
+
+
+def purchase_order_result(po_obj, parsed):
+    return {
+        "po_id": po_obj.purchase_order_id,
+        "uuid": str(po_obj.id),
+        "supplier": po_obj.supplier_name,
+        "total": po_obj.total,
+        "parsed": parsed
+    }
+
+
+def find_duplicate_purchase_order(content_hash):
+    if not content_hash:
+        return None
+    return PurchaseOrder.objects.filter(content_hash=content_hash).order_by("created_at").first()
+
+
+# ---------- Invoices ----------
+def find_purchase_order(parsed, supplier_name, total_dec, explicit_po_id=None):
+    """Link an invoice to a PO (several heuristics, most specific first)"""
+    matched_po = None
+    try:
+        if explicit_po_id:
+            matched_po = PurchaseOrder.objects.filter(id=explicit_po_id).first()
+    except Exception:
+        matched_po = None
+
+    if not matched_po and parsed.get("po_number"):
+        try:
+            matched_po = lookup_purchase_order(parsed.get("po_number"))
+        except Exception:
+            matched_po = None
+
+    if not matched_po:
+        # index lookup on (vendor_key, total)
+        vendor_key = normalize_vendor_key(supplier_name)
+        if vendor_key and total_dec is not None:
+            try:
+                matched_po = PurchaseOrder.objects.filter(
+                    vendor_key=vendor_key,
+                    total=total_dec
+                ).order_by("-created_at").first()
+            except Exception:
+                matched_po = None
+
+    if not matched_po:
+        inv_id = parsed.get("id")
+        if inv_id:
+            try:
+                matched_po = lookup_purchase_order(inv_id)
+            except Exception:
+                matched_po = None
+
+    if not matched_po and not parsed.get("po_number"):
+        # no PO reference at all: nearest POs by line items (MinHash/LSH), checked by the comparator
+        try:
+            matched_po = pick_candidate_purchase_order(parsed)
+        except Exception:
+            logger.exception("PO candidate search failed")
+            matched_po = None
+
+    return matched_po
+
+
+def compare_invoice(parsed, matched_po, timer=None, po_index=None, tolerances=None, rules_only=False,
+                    duplicate=None):
+    """
+    Run the comparator; comparator failures become a NEEDS REVIEW result.
+    rules_only skips the LLM and uses the rule-based comparator directly.
+    duplicate (see duplicates.duplicate_details) flags the result; exact
+    duplicates are not compared at all.
+    """
+    if duplicate and duplicate["exact"]:
+        return duplicate_result(parsed, matched_po, duplicate)
+    po_parsed = matched_po.payload if matched_po and isinstance(matched_po.payload, dict) else {}
+    if matched_po and po_index is None:
+        po_index = get_po_item_index(matched_po)
+    comparator = fallback_comparison if rules_only else compare_one_pair
+    try:
+        with stage(timer, "compare") as timing:
+            result = comparator(parsed, po_parsed, po_index=po_index, tolerances=tolerances)
+            timing["status"] = result[0]
+            timing["summary"] = result[1]
+    except Exception as exc:
+        logger.exception("Comparator failed")
+        result = (
+            "NEEDS REVIEW",
+            f"Comparator error: {str(exc)}",
+            [f"Comparator exception: {str(exc)}"],
+            {
+                "invoice_total": parsed.get("total"),
+                "po_total": po_parsed.get("total"),
+                "items": []
+            },
+        )
+    return flag_duplicate(result, duplicate) if duplicate else result
+
+
+def build_invoice(parsed, saved_name, filename, matched_po=None, content_hash=None):
+    """Unsaved Invoice for an extracted document"""
+    try:
+        default_source = Invoice._meta.get_field("source_type").default
+    except Exception:
+        default_source = "upload"
+
+    return Invoice(
+        invoice_id=parsed.get("id") or filename,
+        purchase_order=matched_po,
+        issue_date=parse_document_date(parsed.get("date")),
+        currency=parsed.get("currency") or None,
+        subtotal=parse_decimal(parsed.get("subtotal")),
+        tax=parse_decimal(parsed.get("tax")),
+        total=parse_decimal(parsed.get("total")),
+        supplier_name=extract_vendor_name(parsed.get("vendor")),
+        source_type=default_source,
+        source_ref=saved_name,
+        payload=parsed,
+        document_blob_path=saved_name,
+        content_hash=content_hash
+    )
+
+
+def persist_invoice_fallback(invoice_obj, matched_po, po_parsed, status_str, summary, reasons, details, timer=None):
+    """
+    Minimal invoice + run when the full persistence failed, so the response
+    keeps its shape. Raises ProcessingError if even this cannot be written.
+    """
+    try:
+        po_snapshot, invoice_snapshot = build_snapshot(po_parsed), build_snapshot(invoice_obj.payload)
+        run = VerificationRun(
+            purchase_order=matched_po,
+            invoice=invoice_obj,
+            status=(VerificationStatus.MATCHED if status_str == "MATCHED" else VerificationStatus.MISMATCHED),
+            summary=summary,
+            mismatch_count=(len(reasons) if isinstance(reasons, (list, tuple)) else (1 if reasons else 0)),
+            matched_item_count=details.get("matched_items", 0) if isinstance(details, dict) else 0,
+            quantities_ok=details.get("quantities_ok", True) if isinstance(details, dict) else True,
+            prices_ok=details.get("prices_ok", True) if isinstance(details, dict) else True,
+            totals_ok=(status_str == "MATCHED"),
+            currency_ok=details.get("currency_ok", True) if isinstance(details, dict) else True,
+            linkage_ok=(matched_po is not None),
+            started_at=timer.started_at if timer else None,
+            finished_at=None,
+            duration_ms=timer.duration_ms if timer else 0,
+            stage_timings=timer.as_dict() if timer else None,
+            po_snapshot_ref=po_snapshot,
+            invoice_snapshot_ref=invoice_snapshot
+        )
+        invoice_obj.compared_payload = build_compared_payload(run, reasons, details)
+        with transaction.atomic():
+            invoice_obj.save(force_insert=True)
+            save_snapshots([po_snapshot, invoice_snapshot])
+            run.save(force_insert=True)
+            update_po_stats(
+                runs=[run], moves=[(None, run.purchase_order_id, invoice_obj.total, invoice_obj.duplicate_of_id)]
+            )
+        return run
+    except Exception as exc:
+        logger.exception("Failed to create fallback VerificationRun")
+        raise ProcessingError("Failed to persist verification run", detail=str(exc), status_code=500)
+
+
+def process_invoice(saved_name, fullpath, filename, explicit_po_id=None, timer=None,
+                    matched_po=None, po_indexes=None, content_hash=None, data=None):
+    """
+    Extract, link, compare and persist one invoice document.
+
+    The invoice row is built in memory with its PO link and compared
+    payload, then written together with its run, item results and
+    discrepancies in one transaction. A batch passes its already loaded
+    matched_po and a SharedPOIndex so the PO is not looked up again.
+    data optionally holds the file bytes when the upload is still in memory.
+    Returns (invoice_obj, matched_po, run, reasons, details).
+    """
+    parsed = extract_document(fullpath, "invoice", timer=timer, data=data)
+
+    invoice_obj = build_invoice(parsed, saved_name, filename, content_hash=content_hash)
+
+    # Same bill uploaded before? Checked before linking / comparing
+    with stage(timer, "duplicates") as timing:
+        found = find_billing_duplicate(invoice_obj)
+        timing["duplicate_of"] = found.original.invoice_id if found else None
+    if found and found.exact and rejects_duplicates():
+        raise ProcessingError(f"Duplicate of invoice {found.original.invoice_id}", status_code=409)
+    invoice_obj.duplicate_of = found.original if found else None
+    duplicate = duplicate_details(invoice_obj, exact=found.exact) if found else None
+
+    # Attempt linking to a PO (several heuristics)
+    if matched_po is None:
+        with stage(timer, "link_po") as timing:
+            matched_po = find_purchase_order(parsed, invoice_obj.supplier_name, invoice_obj.total, explicit_po_id)
+            timing["po_id"] = matched_po.purchase_order_id if matched_po else None
+    invoice_obj.purchase_order = matched_po
+
+    po_index = po_indexes.get(matched_po) if (po_indexes is not None and matched_po) else None
+    status_str, summary, reasons, details = compare_invoice(
+        parsed, matched_po, timer=timer, po_index=po_index, duplicate=duplicate
+    )
+
+    try:
+        run = persist_verification(
+            invoice_obj, matched_po, status_str, summary, reasons, details,
+            timer=timer, insert_invoice=True,
+        )
+    except Exception:
+        logger.exception("persist_verification failed; creating fallback run")
+        po_parsed = matched_po.payload if matched_po and isinstance(matched_po.payload, dict) else {}
+        run = persist_invoice_fallback(invoice_obj, matched_po, po_parsed, status_str, summary, reasons, details, timer=timer)
+
+    if matched_po is None:
+        record_pending_reference(invoice_obj, parsed)
+    return invoice_obj, matched_po, run, reasons, details
+
+
+def invoice_result(invoice_obj, matched_po, run, reasons, details):
+    """Response payload for a processed invoice"""
+    return {
+        "invoice": {
+            "uuid": str(invoice_obj.id),
+            "invoice_id": invoice_obj.invoice_id,
+            "supplier": invoice_obj.supplier_name,
+            "total": float(invoice_obj.total) if invoice_obj.total is not None else None,
+        },
+        "matched_po": {
+            "uuid": str(matched_po.id) if matched_po else None,
+            "po_id": matched_po.purchase_order_id if matched_po else None,
+        },
+        "verification": {
+            "run_id": str(run.id),
+            "status": run.status,
+            "summary": run.summary,
+            "mismatch_count": run.mismatch_count,
+            "reasons": reasons,
+            "details": details
+        }
+    }
+
+
+# ---------- Duplicate uploads ----------
+def find_duplicate_invoice(content_hash):
+    if not content_hash:
+        return None
+    return (
+        Invoice.objects.filter(content_hash=content_hash)
+        .select_related("purchase_order")
+        .order_by("created_at")
+        .first()
+    )
+
+
+def existing_invoice_result(invoice_obj):
+    """Response payload of the latest verification of an already processed invoice"""
+    run = invoice_obj.verification_runs.order_by("-created_at").first()
+    if run is None:
+        return None
+    verification = (invoice_obj.compared_payload or {}).get("verification") or {}
+    return invoice_result(
+        invoice_obj, invoice_obj.purchase_order, run,
+        verification.get("reasons") or [], verification.get("details") or {},
+    )
+
+
+def reverify_invoice(invoice_obj, explicit_po_id=None, timer=None):
+    """
+    Verify an already extracted invoice again (e.g. after its PO changed),
+    reusing the stored payload instead of running OCR / extraction.
+    Returns the same tuple as process_invoice.
+    """
+    parsed = invoice_obj.payload if isinstance(invoice_obj.payload, dict) else {}
+
+    matched_po = invoice_obj.purchase_order
+    if explicit_po_id or matched_po is None:
+        with stage(timer, "link_po") as timing:
+            matched_po = find_purchase_order(parsed, invoice_obj.supplier_name, invoice_obj.total, explicit_po_id) or matched_po
+            timing["po_id"] = matched_po.purchase_order_id if matched_po else None
+
+    status_str, summary, reasons, details = compare_invoice(
+        parsed, matched_po, timer=timer, duplicate=duplicate_details(invoice_obj)
+    )
+    run = persist_verification(invoice_obj, matched_po, status_str, summary, reasons, details, timer=timer)
+
+    previous_po_id = invoice_obj.purchase_order_id
+    invoice_obj.purchase_order = matched_po
+    invoice_obj.compared_payload = build_compared_payload(run, reasons, details)
+    with transaction.atomic():
+        Invoice.objects.filter(pk=invoice_obj.pk).update(
+            purchase_order=matched_po, compared_payload=invoice_obj.compared_payload
+        )
+        update_po_stats(moves=[(previous_po_id, invoice_obj.purchase_order_id, invoice_obj.total, invoice_obj.duplicate_of_id)])
+    if matched_po is None:
+        record_pending_reference(invoice_obj, parsed)
+    else:
+        PendingPOReference.objects.filter(invoice=invoice_obj).delete()
+    return invoice_obj, matched_po, run, reasons, details
+
+
+# ---------- Pending PO references ----------
+def record_pending_reference(invoice_obj, parsed):
+    """
+    Remember an unlinked invoice under its PO number / vendor key so that
+    the PO's upload can link it later. Failures are logged, never raised.
+    """
+    po_number_key = normalize_po_number(parsed.get("po_number"))
+    if po_number_key is None and invoice_obj.vendor_key is None:
+        return None
+    try:
+        ref, _ = PendingPOReference.objects.update_or_create(
+            invoice=invoice_obj,
+            defaults={"po_number_key": po_number_key, "vendor_key": invoice_obj.vendor_key, "total": invoice_obj.total},
+        )
+        return ref
+    except Exception:
+        logger.exception("Failed to record pending PO reference for invoice %s", invoice_obj.pk)
+        return None
+
+
+# ---------- Batches ----------
+class SharedPOIndex:
+    """Item indexes of the POs used in a batch, loaded once and shared by the worker threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}
+
+    def get(self, po):
+        with self._lock:
+            if po.pk not in self._indexes:
+                self._indexes[po.pk] = get_po_item_index(po)
+            return self._indexes[po.pk]
+
+
+def load_batch_purchase_order(purchase_order_id):
+    """PO every invoice of a batch is verified against; ProcessingError if it does not exist"""
+    try:
+        po = PurchaseOrder.objects.filter(id=purchase_order_id).first()
+    except Exception:
+        po = None
+    if po is None:
+        raise ProcessingError(f"Purchase order not found: {purchase_order_id}", status_code=404)
+    return po
+
+
+def _process_batch_entry(position, upload, matched_po, po_indexes):
+    saved_name, fullpath, filename, content_hash = upload
+    entry = {"index": position, "filename": filename}
+    try:
+        duplicate = find_duplicate_invoice(content_hash)
+        result = existing_invoice_result(duplicate) if duplicate else None
+        if result is not None:
+            entry["duplicate"] = True
+        elif duplicate:
+            result = invoice_result(*reverify_invoice(duplicate, timer=PipelineTimer()))
+            entry["duplicate"] = True
+        else:
+            result = invoice_result(*process_invoice(
+                saved_name, fullpath, filename, timer=PipelineTimer(),
+                matched_po=matched_po, po_indexes=po_indexes, content_hash=content_hash,
+            ))
+        entry.update(status="ok", http_status=200, result=normalize_compared_payload(result))
+    except ProcessingError as exc:
+        entry.update(status="error", http_status=exc.status_code, **exc.as_response_data())
+    except Exception as exc:
+        logger.exception("Batch item %s (%s) failed", position, filename)
+        entry.update(status="error", http_status=500, error="Processing failed", detail=str(exc))
+    finally:
+        connection.close()  # pool threads each hold their own connection
+    return entry
+
+
+def process_invoice_batch(uploads, matched_po=None, max_workers=4):
+    """
+    Process saved invoice uploads [(saved_name, fullpath, filename, content_hash), ...]
+    concurrently on at most max_workers threads (OCR and LLM calls are
+    I/O-bound), yielding one result entry per file as soon as it finishes.
+    Files already processed before (same content hash) return the stored
+    result; their saved_name / fullpath may be None.
+
+    With matched_po every invoice is verified against that PO, whose item
+    index is loaded once for the whole batch.
+    """
+    po_indexes = SharedPOIndex()
+    if matched_po is not None:
+        po_indexes.get(matched_po)
+
+    if not uploads:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(uploads))), thread_name_prefix="batch") as pool:
+        futures = [
+            pool.submit(_process_batch_entry, position, upload, matched_po, po_indexes)
+            for position, upload in enumerate(uploads)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,114 @@
+# po_cache.py
+"""
+Per-worker LRU cache for PO-number lookups.
+
+Maps normalize_po_number(number) -> (PO id, updated_at, normalized item
+index) plus the loaded PurchaseOrder, so linking a batch of invoices that all
+reference the same PO costs one indexed query for the first and none after.
+
+Entries are dropped by signals.py whenever a PO is saved or deleted in this
+process; PO_LOOKUP_CACHE_TTL bounds how long another process's edits can go
+unseen. An expired entry is revalidated against the PO's updated_at (one
+single-column query) and kept for another TTL if the row is unchanged, so
+the PO and its item index are only reloaded after an edit. Misses are never
+cached, so a newly uploaded PO is found immediately.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+from .item_index import get_po_item_index
+from .keys import normalize_po_number
+from .models import PurchaseOrder
+
+CachedPO = namedtuple("CachedPO", ["po_id", "updated_at", "item_index", "po", "expires_at"])
+
+
+class POLookupCache:
+    def __init__(self, maxsize=256, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # po_number_key -> CachedPO
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            expired = entry is not None and entry.expires_at < time.monotonic()
+        if expired:
+            entry = self._revalidate(key, entry)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        # callers get their own instance; the cached one is never handed out
+        po = copy.copy(entry.po)
+        po.item_index = entry.item_index
+        return po
+
+    def put(self, key, po, item_index):
+        entry = CachedPO(po.pk, po.updated_at, item_index, copy.copy(po), time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _revalidate(self, key, entry):
+        """Renewed entry if the PO row still has the cached updated_at, else None (entry dropped)"""
+        updated_at = PurchaseOrder.objects.filter(pk=entry.po_id).values_list("updated_at", flat=True).first()
+        with self._lock:
+            current = self._entries.get(key) is entry
+            if updated_at is None or updated_at != entry.updated_at:
+                if current:
+                    del self._entries[key]
+                return None
+            entry = entry._replace(expires_at=time.monotonic() + self.ttl)
+            if current:
+                self._entries[key] = entry
+            return entry
+
+    def invalidate(self, po_id=None, key=None):
+        with self._lock:
+            if key is not None:
+                self._entries.pop(key, None)
+            if po_id is not None:
+                for stale in [k for k, entry in self._entries.items() if entry.po_id == po_id]:
+                    del self._entries[stale]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+po_lookup_cache = POLookupCache(
+    maxsize=getattr(settings, "PO_LOOKUP_CACHE_SIZE", 256),
+    ttl=getattr(settings, "PO_LOOKUP_CACHE_TTL", 300.0),
+)
+
+
+def lookup_purchase_order(po_number):
+    """PurchaseOrder whose normalized number equals po_number's, or None"""
+    key = normalize_po_number(po_number)
+    if key is None:
+        return None
+    po = po_lookup_cache.get(key)
+    if po is not None:
+        return po
+    po = PurchaseOrder.objects.filter(po_number_key=key).order_by("created_at").first()
+    if po is not None:
+        po_lookup_cache.put(key, po, get_po_item_index(po))
+    return po
+
+
+def invalidate_purchase_order(po):
+    po_lookup_cache.invalidate(po_id=po.pk, key=normalize_po_number(po.purchase_order_id))
@@ -0,0 +1,154 @@
+# po_candidates.py
+"""
+Candidate PO retrieval for invoices that carry no PO reference.
+
+Every PO gets a MinHash signature over its line items (item IDs plus
+description tokens), split into LSH bands; each band is stored as one
+POSignatureBand row keyed by a hash bucket. An invoice's signature is
+banded the same way and POs sharing at least one bucket are candidates,
+ranked by how many bands they share - one indexed query, independent of the
+number of POs. Only open POs compete: those whose total is already used
+up by linked invoices (POStats.open_amount <= 0) are left out, while POs
+without a total stay in. The few top candidates are then checked with the
+deterministic comparator and the best one is linked - provided enough of the
+invoice's lines match it on item ID or description (PO_CANDIDATE_MIN_SCORE);
+otherwise the invoice stays unlinked. Bands are rewritten whenever a PO is
+saved (signals.py).
+
+With 32 bands of 3 rows, item sets with Jaccard similarity 0.4 collide in
+some band ~88% of the time, unrelated ones (0.05) ~0.4%.
+"""
+import hashlib
+import logging
+import random
+
+from django.conf import settings
+from django.db.models import Count
+
+from .compare import fallback_comparison, match_items_fuzzy
+from .item_index import get_po_item_index, item_key
+from .models import PurchaseOrder, POSignatureBand
+from .similarity import normalize_tokens
+
+logger = logging.getLogger(__name__)
+
+NUM_BANDS = 32
+ROWS_PER_BAND = 3
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+_PRIME = (1 << 61) - 1
+
+# fixed seed: signatures must stay comparable across processes and restarts
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def top_k():
+    return getattr(settings, "PO_CANDIDATE_TOP_K", 5)
+
+
+def min_score():
+    return getattr(settings, "PO_CANDIDATE_MIN_SCORE", 30.0)
+
+
+# ---------- Signatures ----------
+def item_features(items):
+    """Set of shingles for a list of line items: item IDs and description tokens"""
+    features = set()
+    for item in items or []:
+        if not isinstance(item, dict):
+            continue
+        key = item_key(item)
+        if key:
+            features.add(f"#{key}")
+        features.update(normalize_tokens(item.get("description")))
+    return features
+
+
+def _feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+
+
+def minhash_signature(features):
+    """NUM_PERM min-hash values of a feature set, or None if it is empty"""
+    if not features:
+        return None
+    hashes = [_feature_hash(f) for f in features]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_buckets(signature):
+    """One signed 64-bit bucket per band (the band number is part of the hash)"""
+    buckets = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        data = f"{band}:{','.join(map(str, rows))}".encode()
+        buckets.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big", signed=True))
+    return buckets
+
+
+def items_buckets(items):
+    signature = minhash_signature(item_features(items))
+    return band_buckets(signature) if signature else []
+
+
+# ---------- Index maintenance ----------
+def index_purchase_order(po):
+    """(Re)write the PO's LSH bands from its payload items"""
+    payload = po.payload if isinstance(po.payload, dict) else {}
+    POSignatureBand.objects.filter(purchase_order=po).delete()
+    POSignatureBand.objects.bulk_create([
+        POSignatureBand(purchase_order=po, bucket=bucket) for bucket in items_buckets(payload.get("items"))
+    ])
+
+
+# ---------- Lookup ----------
+def find_candidate_purchase_orders(items, k=None):
+    """Up to k open POs sharing LSH buckets with the items, most shared bands first"""
+    buckets = items_buckets(items)
+    if not buckets:
+        return []
+    ranked = list(
+        POSignatureBand.objects.filter(bucket__in=buckets)
+        .exclude(purchase_order__stats__open_amount__lte=0)
+        .values("purchase_order_id")
+        .annotate(hits=Count("id"))
+        .order_by("-hits", "purchase_order_id")[:k or top_k()]
+    )
+    pos = PurchaseOrder.objects.in_bulk([row["purchase_order_id"] for row in ranked])
+    return [pos[row["purchase_order_id"]] for row in ranked if row["purchase_order_id"] in pos]
+
+
+def evidence_score(items, po_items, po_index=None):
+    """
+    Mean match score per invoice line, counting only the lines matched on
+    item ID or description - quantity and price agreeing alone is no evidence
+    """
+    if not items:
+        return 0.0
+    pairs = match_items_fuzzy(items, po_items, po_index=po_index)
+    return sum(pair["match_score"] for pair in pairs if pair["evidence"]) / len(items)
+
+
+def pick_candidate_purchase_order(parsed):
+    """
+    Best PO for an invoice among its LSH candidates, or None.
+
+    Candidates whose evidence_score is below PO_CANDIDATE_MIN_SCORE are
+    skipped; the rest are ranked by the rule-based comparator: fewest
+    discrepancies, then highest evidence score.
+    """
+    items = parsed.get("items") or []
+    best, best_rank = None, None
+    for position, po in enumerate(find_candidate_purchase_orders(items)):
+        po_parsed = po.payload if isinstance(po.payload, dict) else {}
+        po_index = get_po_item_index(po)
+        score = evidence_score(items, po_parsed.get("items") or [], po_index=po_index)
+        if score < min_score():
+            continue
+        _, _, reasons, _ = fallback_comparison(parsed, po_parsed, po_index=po_index)
+        rank = (len(reasons), -score, position)
+        if best_rank is None or rank < best_rank:
+            best, best_rank = po, rank
+    if best is not None:
+        logger.info("Linked invoice %s to candidate PO %s", parsed.get("id"), best.purchase_order_id)
+    return best
@@ -0,0 +1,54 @@
+# querysets.py
+"""
+Column projections for the dashboard list and summary endpoints.
+
+PurchaseOrder.payload / item_index, Invoice.payload / compared_payload and
+VerificationRun.stage_timings are the large columns of their tables, and none of the
+list serializers needs them: each queryset here loads only the columns its
+serializer reads (including those of the select_related joins). The one
+payload value the PO list shows, file_size, is projected out of the JSON in
+SQL. Reading a column that is not listed still works, at the cost of one
+extra query per row - extend the field list together with the serializer.
+"""
+from django.db.models.fields.json import KeyTransform
+
+from .models import Invoice, PurchaseOrder, VerificationRun
+
+# PurchaseOrderListSerializer
+PO_LIST_FIELDS = (
+    "id", "created_at", "purchase_order_id", "currency", "subtotal", "tax", "total",
+    "issued_date", "buyer_name", "supplier_name", "stats__invoice_count",
+)
+
+# InvoiceListSerializer
+INVOICE_LIST_FIELDS = (
+    "id", "created_at", "invoice_id", "issue_date", "currency", "subtotal", "tax", "total",
+    "supplier_name", "source_type", "purchase_order__purchase_order_id",
+)
+
+# MatchDataSerializer
+RUN_LIST_FIELDS = (
+    "id", "created_at", "status", "summary", "mismatch_count", "linkage_ok", "totals_ok", "finished_at",
+    "purchase_order__purchase_order_id",
+    "invoice__invoice_id", "invoice__supplier_name", "invoice__total",
+)
+
+
+def po_list_queryset():
+    return (
+        PurchaseOrder.objects.select_related("stats")
+        .only(*PO_LIST_FIELDS)
+        .annotate(file_size=KeyTransform("file_size", "payload"))
+    )
+
+
+def invoice_list_queryset():
+    return Invoice.objects.select_related("purchase_order").only(*INVOICE_LIST_FIELDS)
+
+
+def run_list_queryset():
+    return (
+        VerificationRun.objects.select_related("purchase_order", "invoice")
+        .only(*RUN_LIST_FIELDS)
+        .prefetch_related("discrepancies")
+    )
@@ -0,0 +1,233 @@
+# reconcile.py
+"""
+Bulk reconciliation of unlinked invoices against purchase orders.
+
+Meant for the occasional large catch-up (after a migration or ERP import)
+rather than per upload:
+
+1. the normalized keys of all POs and unlinked invoices are loaded once;
+2. candidates are blocked by the normalized PO number the invoice
+   references and by vendor key, keeping only the MAX_VENDOR_CANDIDATES POs
+   of a vendor closest in total (an invoice's own number is not a PO
+   reference, so it never counts as one);
+3. each candidate pair is scored with the rule-based comparator;
+4. pairs are assigned globally, best score first: every invoice gets at
+   most one PO and, unless it names the PO explicitly, only while the PO's
+   total is not yet used up by other invoices - so the outcome does not
+   depend on upload order;
+5. links are written with bulk updates and re-verification jobs queued
+   for the worker. Without workers (UPLOAD_PROCESSING_ASYNC off) nothing
+   is queued; the summary counts the linked invoices left unverified, to be
+   re-verified separately.
+"""
+import logging
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .compare import fallback_comparison, fuzzy_equal
+from .item_index import get_po_item_index
+from .jobs import enqueue_reverify_jobs, processing_is_async
+from .keys import normalize_po_number
+from .models import Invoice, PendingPOReference, PurchaseOrder
+from .stats import update_po_stats
+
+logger = logging.getLogger(__name__)
+
+MAX_VENDOR_CANDIDATES = 20
+NUMBER_MATCH_SCORE = 100
+REASON_PENALTY = 5
+
+Assignment = namedtuple("Assignment", ["score", "invoice_pk", "po_pk", "by_number"])
+
+
+# ---------- Loading / blocking ----------
+def load_purchase_orders():
+    rows = PurchaseOrder.objects.values_list("pk", "purchase_order_id", "po_number_key", "vendor_key", "total")
+    return {pk: {"pk": pk, "po_id": po_id, "po_number_key": number, "vendor_key": vendor, "total": total}
+            for pk, po_id, number, vendor, total in rows.iterator(chunk_size=2000)}
+
+
+def load_unlinked_invoices(limit=None):
+    rows = (
+        Invoice.objects.filter(purchase_order__isnull=True)
+        .order_by("created_at")
+        .values("pk", "invoice_id", "vendor_key", "total", "payload", "document_blob_path")
+    )
+    if limit:
+        rows = rows[:limit]
+    invoices = []
+    for row in rows.iterator(chunk_size=2000):
+        payload = row["payload"] if isinstance(row["payload"], dict) else {}
+        row["payload"] = payload
+        row["po_number_key"] = normalize_po_number(payload.get("po_number"))
+        invoices.append(row)
+    return invoices
+
+
+def candidate_blocks(invoices, pos):
+    """Yield (invoice, [(po, by_number)]) for every invoice that has any candidate"""
+    by_number = defaultdict(list)
+    by_vendor = defaultdict(list)
+    for po in pos.values():
+        if po["po_number_key"]:
+            by_number[po["po_number_key"]].append(po)
+        if po["vendor_key"]:
+            by_vendor[po["vendor_key"]].append(po)
+
+    for invoice in invoices:
+        candidates = {}
+        for po in by_number.get(invoice["po_number_key"], ()):
+            candidates[po["pk"]] = (po, True)
+        if invoice["vendor_key"]:
+            vendor_pos = by_vendor.get(invoice["vendor_key"], ())
+            if invoice["total"] is not None and len(vendor_pos) > MAX_VENDOR_CANDIDATES:
+                vendor_pos = sorted(
+                    vendor_pos,
+                    key=lambda po: abs(po["total"] - invoice["total"]) if po["total"] is not None else Decimal("Infinity"),
+                )
+            for po in vendor_pos[:MAX_VENDOR_CANDIDATES]:
+                candidates.setdefault(po["pk"], (po, False))
+        if candidates:
+            yield invoice, list(candidates.values())
+
+
+# ---------- Scoring / assignment ----------
+def score_pair(invoice_parsed, po_obj, by_number):
+    """Pair score from the rule-based comparator, or None when nothing ties the two together"""
+    po_parsed = po_obj.payload if isinstance(po_obj.payload, dict) else {}
+    _, _, reasons, details = fallback_comparison(invoice_parsed, po_parsed, po_index=get_po_item_index(po_obj))
+    item_score = sum(row.get("match_score") or 0 for row in details["items"])
+    if not by_number and not item_score:
+        return None
+    score = (NUMBER_MATCH_SCORE if by_number else 0) + item_score - REASON_PENALTY * len(reasons)
+    return score if score > 0 else None
+
+
+def billed_totals(po_pks):
+    """Invoice totals already billed against each PO (duplicates excluded, as in POStats)"""
+    rows = (
+        Invoice.objects.filter(purchase_order_id__in=po_pks, duplicate_of__isnull=True)
+        .values("purchase_order_id")
+        .annotate(billed=Sum("total"))
+    )
+    return {row["purchase_order_id"]: row["billed"] or Decimal("0") for row in rows}
+
+
+def assign(pairs, invoice_totals, pos):
+    """
+    Greedy global assignment, best pair first (ties broken by ids so runs
+    are reproducible). A PO takes invoices by vendor / items only while
+    their totals fit into what is left of its own total.
+    """
+    remaining = {pk: po["total"] for pk, po in pos.items() if po["total"] is not None}
+    billed = billed_totals([pk for pk in {pair.po_pk for pair in pairs} if pk in remaining])
+    for pk, amount in billed.items():
+        remaining[pk] -= amount
+
+    assigned = {}
+    for pair in sorted(pairs, key=lambda p: (-p.score, str(p.invoice_pk), str(p.po_pk))):
+        if pair.invoice_pk in assigned:
+            continue
+        total = invoice_totals.get(pair.invoice_pk)
+        left = remaining.get(pair.po_pk)
+        fits = total is None or left is None or total <= left or fuzzy_equal(total, left)
+        if not (fits or pair.by_number):
+            continue
+        assigned[pair.invoice_pk] = pair
+        if total is not None and left is not None:
+            remaining[pair.po_pk] = left - total
+    return list(assigned.values())
+
+
+# ---------- Entry point ----------
+def reconcile_unlinked_invoices(dry_run=False, queue_verification=True, limit=None, batch_size=500, progress=None):
+    """
+    Link unlinked invoices to POs in bulk. progress(stage, done, total) is
+    called while scoring and writing. Returns a summary dict; with dry_run
+    nothing is written and the proposed links are listed instead.
+    """
+    def report(stage_name, done, total):
+        if progress:
+            progress(stage_name, done, total)
+
+    pos = load_purchase_orders()
+    invoices = load_unlinked_invoices(limit=limit)
+    blocks = list(candidate_blocks(invoices, pos))
+    report("blocked", len(blocks), len(invoices))  # invoices with at least one candidate PO
+    po_objects = {}
+    needed = list({po["pk"] for _, candidates in blocks for po, _ in candidates})
+    for start in range(0, len(needed), batch_size):
+        po_objects.update(
+            PurchaseOrder.objects.only("pk", "payload", "item_index").in_bulk(needed[start:start + batch_size])
+        )
+
+    pairs = []
+    scored = 0
+    for done, (invoice, candidates) in enumerate(blocks, start=1):
+        for po, by_number in candidates:
+            po_obj = po_objects.get(po["pk"])
+            if po_obj is None:
+                continue
+            scored += 1
+            score = score_pair(invoice["payload"], po_obj, by_number)
+            if score is not None:
+                pairs.append(Assignment(score, invoice["pk"], po["pk"], by_number))
+        if done % batch_size == 0 or done == len(blocks):
+            report("scored", done, len(blocks))
+
+    assignments = assign(pairs, {invoice["pk"]: invoice["total"] for invoice in invoices}, pos)
+    summary = {
+        "dry_run": dry_run,
+        "unlinked_invoices": len(invoices),
+        "purchase_orders": len(pos),
+        "invoices_with_candidates": len(blocks),
+        "pairs_scored": scored,
+        "linked": len(assignments),
+    }
+    if dry_run:
+        invoice_ids = {invoice["pk"]: invoice["invoice_id"] for invoice in invoices}
+        summary["links"] = [
+            {
+                "invoice_uuid": str(a.invoice_pk),
+                "invoice_id": invoice_ids[a.invoice_pk],
+                "po_uuid": str(a.po_pk),
+                "po_id": pos[a.po_pk]["po_id"],
+                "score": round(a.score, 2),
+                "by_po_number": a.by_number,
+            }
+            for a in assignments
+        ]
+        return summary
+
+    blob_paths = {invoice["pk"]: (invoice["invoice_id"], invoice["document_blob_path"]) for invoice in invoices}
+    queue_verification = queue_verification and processing_is_async()
+    linked = 0
+    for start in range(0, len(assignments), batch_size):
+        chunk = assignments[start:start + batch_size]
+        with transaction.atomic():
+            # skip invoices that got linked (e.g. by a new PO upload) since they were loaded
+            still_unlinked = {
+                pk: (total, duplicate_of_id)
+                for pk, total, duplicate_of_id in Invoice.objects.select_for_update()
+                .filter(pk__in=[a.invoice_pk for a in chunk], purchase_order__isnull=True)
+                .values_list("pk", "total", "duplicate_of_id")
+            }
+            chunk = [a for a in chunk if a.invoice_pk in still_unlinked]
+            Invoice.objects.bulk_update(
+                [Invoice(pk=a.invoice_pk, purchase_order_id=a.po_pk) for a in chunk], ["purchase_order"]
+            )
+            update_po_stats(moves=[(None, a.po_pk, *still_unlinked[a.invoice_pk]) for a in chunk])
+            PendingPOReference.objects.filter(invoice_id__in=[a.invoice_pk for a in chunk]).delete()
+            if queue_verification:
+                enqueue_reverify_jobs([(a.invoice_pk, *blob_paths[a.invoice_pk]) for a in chunk])
+        linked += len(chunk)
+        report("written", min(start + batch_size, len(assignments)), len(assignments))
+
+    summary["linked"] = linked
+    summary["verification_queued"] = queue_verification
+    summary["unverified"] = 0 if queue_verification else linked
+    logger.info("Reconciliation linked %s of %s unlinked invoices", linked, len(invoices))
+    return summary
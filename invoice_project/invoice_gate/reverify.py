@@ -0,0 +1,194 @@
+# reverify.py
+"""
+Bulk re-verification of already processed invoices.
+
+Used when a PO was corrected or the matching tolerances changed: the stored
+invoice and PO payloads are compared again - no OCR, no extraction - on a
+thread pool (the LLM call is I/O-bound), and the new runs, item rows,
+discrepancies and compared payloads are written in bulk, one transaction
+per chunk.
+
+what_if_statuses() is the fast path: it recomputes, in SQL, the status the
+latest run of each invoice would get under other tolerances from its stored
+ItemVerification rows and the invoice / PO totals, without writing anything.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    BooleanField, Case, Count, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Value, When,
+)
+from django.db.models.functions import Abs, Greatest
+from django.db.models.lookups import Exact, LessThanOrEqual
+
+from .compare import (
+    build_compared_payload,
+    build_result_rows,
+    build_verification_run,
+    get_tolerances,
+)
+from .duplicates import duplicate_details
+from .item_index import get_po_item_index
+from .ledger import LedgerUpdate
+from .models import Discrepancy, Invoice, ItemVerification, VerificationRun, VerificationStatus
+from .pipeline import ProcessingError, compare_invoice
+from .snapshots import save_snapshots
+from .stats import update_po_stats
+
+logger = logging.getLogger(__name__)
+
+WHAT_IF_CHANGES_LIMIT = 200
+
+
+def select_invoices(purchase_order_id=None, invoice_ids=None, all_invoices=False):
+    """Linked invoices to re-verify: those of one PO, an explicit list, or all of them"""
+    if not (purchase_order_id or invoice_ids or all_invoices):
+        raise ProcessingError("Select a purchase order, invoice ids or all invoices")
+    invoices = Invoice.objects.filter(purchase_order__isnull=False)
+    if purchase_order_id:
+        invoices = invoices.filter(purchase_order_id=purchase_order_id)
+    if invoice_ids:
+        invoices = invoices.filter(pk__in=invoice_ids)
+    return invoices
+
+
+# ---------- Re-verification ----------
+def write_results(invoices, results, tolerances=None):
+    """Insert the runs and result rows of a chunk and update the invoices' compared payloads"""
+    runs, item_rows, discrepancy_rows, snapshots = [], [], [], []
+    for invoice_obj, (status_str, summary, reasons, details) in zip(invoices, results):
+        run = build_verification_run(invoice_obj, invoice_obj.purchase_order, status_str, summary, reasons, details)
+        items, discrepancies = build_result_rows(run, details, tolerances)
+        runs.append(run)
+        item_rows.extend(items)
+        discrepancy_rows.extend(discrepancies)
+        snapshots.extend([run.po_snapshot_ref, run.invoice_snapshot_ref])
+
+    with transaction.atomic():
+        # ledger updates go one invoice at a time: each sees the previous one's share
+        for invoice_obj, run, (_, _, reasons, details) in zip(invoices, runs, results):
+            ledger = LedgerUpdate(invoice_obj, invoice_obj.purchase_order)
+            discrepancy_rows.extend(ledger.apply_to_run(run, reasons))
+            ledger.save()
+            invoice_obj.compared_payload = build_compared_payload(run, reasons, details)
+        save_snapshots(snapshots)
+        VerificationRun.objects.bulk_create(runs)
+        ItemVerification.objects.bulk_create(item_rows, batch_size=1000)
+        Discrepancy.objects.bulk_create(discrepancy_rows, batch_size=1000)
+        Invoice.objects.bulk_update(invoices, ["compared_payload"])
+        update_po_stats(runs=runs)
+    return runs
+
+
+def reverify_invoices(invoices, tolerances=None, rules_only=False, max_workers=None, chunk_size=200, progress=None):
+    """
+    Re-verify the given invoices (a queryset) from their stored payloads.
+
+    tolerances overrides the configured ones for this run; rules_only skips
+    the LLM. progress(done, total) is called after each chunk. Returns a
+    summary with the status counts and how many statuses changed.
+    """
+    max_workers = max_workers or getattr(settings, "REVERIFY_MAX_WORKERS", 4)
+    total = invoices.count()
+    rows = invoices.select_related("purchase_order", "duplicate_of").order_by("pk").iterator(chunk_size=chunk_size)
+    po_indexes = {}
+    summary = {"invoices": total, "matched": 0, "mismatched": 0, "changed": 0}
+
+    def compare(invoice_obj):
+        parsed = invoice_obj.payload if isinstance(invoice_obj.payload, dict) else {}
+        po = invoice_obj.purchase_order
+        return compare_invoice(
+            parsed, po, po_index=po_indexes.get(po.pk) if po else None,
+            tolerances=tolerances, rules_only=rules_only, duplicate=duplicate_details(invoice_obj),
+        )
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            # PO indexes are loaded here, so the comparison threads never touch the database
+            for invoice_obj in chunk:
+                po = invoice_obj.purchase_order
+                if po is not None and po.pk not in po_indexes:
+                    po_indexes[po.pk] = get_po_item_index(po)
+            previous = [((i.compared_payload or {}).get("verification") or {}).get("status") for i in chunk]
+            results = list(pool.map(compare, chunk))
+            runs = write_results(chunk, results, tolerances)
+
+            for run, old_status in zip(runs, previous):
+                summary["matched" if run.status == VerificationStatus.MATCHED else "mismatched"] += 1
+                summary["changed"] += old_status != run.status
+            done += len(chunk)
+            if progress:
+                progress(done, total)
+
+    logger.info("Re-verified %s invoices: %s", total, summary)
+    return summary
+
+
+# ---------- What-if (SQL only) ----------
+def _within(a, b, rel_tol, abs_tol):
+    """SQL version of compare.fuzzy_equal: |a - b| <= max(abs_tol, rel_tol * max(|a|, |b|, 1))"""
+    decimal = DecimalField(max_digits=20, decimal_places=6)
+    scale = Greatest(Abs(a), Abs(b), Value(Decimal(1)), output_field=decimal)
+    limit = Greatest(
+        Value(Decimal(str(abs_tol))),
+        ExpressionWrapper(Value(Decimal(str(rel_tol))) * scale, output_field=decimal),
+        output_field=decimal,
+    )
+    return LessThanOrEqual(ExpressionWrapper(Abs(a - b), output_field=decimal), limit)
+
+
+def what_if_statuses(invoices, tolerances=None):
+    """
+    Statuses the latest runs of the given invoices would get under the
+    tolerances, computed from stored item rows: a line fails when it is
+    unpaired or its quantity / price is outside tolerance, a run fails when
+    any line fails, the totals differ beyond the total tolerance or no PO is
+    linked. Returns counts plus the invoices whose status would change.
+    """
+    tol = get_tolerances(tolerances)
+    latest = VerificationRun.objects.filter(invoice=OuterRef("invoice")).order_by("-created_at").values("pk")[:1]
+
+    zero = Value(Decimal(0))
+    inv_qty, po_qty = "item_results__invoice_quantity", "item_results__po_quantity"
+    inv_price, po_price = "item_results__invoice_unit_price", "item_results__po_unit_price"
+    unpaired = (
+        (Q(Exact(F(po_qty), zero)) & Q(Exact(F(po_price), zero)))
+        | (Q(Exact(F(inv_qty), zero)) & Q(Exact(F(inv_price), zero)))
+    )
+    qty_ok = Q(Exact(F(inv_qty), zero)) | Q(Exact(F(po_qty), zero)) | Q(_within(F(inv_qty), F(po_qty), tol["rel_tol"], tol["abs_tol"]))
+    price_ok = Q(Exact(F(inv_price), zero)) | Q(Exact(F(po_price), zero)) | Q(_within(F(inv_price), F(po_price), tol["rel_tol"], tol["abs_tol"]))
+    totals_ok = (
+        Q(invoice__total__isnull=True)
+        | Q(purchase_order__total__isnull=True)
+        | Q(_within(F("invoice__total"), F("purchase_order__total"), tol["total_rel_tol"], tol["total_abs_tol"]))
+    )
+
+    runs = (
+        VerificationRun.objects.filter(invoice__in=invoices, pk=Subquery(latest))
+        .annotate(
+            failing_items=Count("item_results", filter=unpaired | ~qty_ok | ~price_ok),
+            totals_within=Case(When(totals_ok, then=Value(True)), default=Value(False), output_field=BooleanField()),
+        )
+        .values_list("invoice_id", "invoice__invoice_id", "status", "failing_items", "totals_within", "purchase_order_id")
+    )
+
+    summary = {"tolerances": tol, "runs": 0, "would_match": 0, "would_mismatch": 0, "changed": 0, "changes": []}
+    for invoice_pk, invoice_id, status, failing_items, totals_within, po_pk in runs.iterator():
+        ok = not failing_items and totals_within and po_pk is not None
+        new_status = VerificationStatus.MATCHED if ok else VerificationStatus.MISMATCHED
+        summary["runs"] += 1
+        summary["would_match" if ok else "would_mismatch"] += 1
+        if new_status == status:
+            continue
+        summary["changed"] += 1
+        if len(summary["changes"]) < WHAT_IF_CHANGES_LIMIT:
+            summary["changes"].append({"invoice_uuid": str(invoice_pk), "invoice_id": invoice_id, "from": status, "to": new_status})
+    return summary
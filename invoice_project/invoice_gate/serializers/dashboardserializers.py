@@ -430,6 +430,8 @@
 
 # dashboardserializers.py
 
+from decimal import Decimal
+
 from rest_framework import serializers
 from django.utils.timesince import timesince
 from ..models import (
@@ -438,9 +440,26 @@ from ..models import (
     ItemVerification,
     Discrepancy,
     VerificationRun,
+    POLineLedger,
+    POStats,
 )
 
 
+def stats_invoice_count(po):
+    """Linked invoice count from the PO's stats row (see stats.py)"""
+    stats = getattr(po, 'stats', None)
+    return stats.invoice_count if stats else 0
+
+
+def invoice_count_status(count):
+    if count == 0:
+        return {"text": "No Invoices", "type": "pending"}
+    elif count == 1:
+        return {"text": "Invoice Ready", "type": "ready"}
+    else:
+        return {"text": f"{count} Invoices", "type": "completed"}
+
+
 class InvoiceListSerializer(serializers.ModelSerializer):
     """Serializer for invoice list view"""
     linked_po = serializers.SerializerMethodField()
@@ -505,9 +524,13 @@ class PurchaseOrderListSerializer(serializers.ModelSerializer):
         return f"{obj.purchase_order_id}.pdf"
     
     def get_size(self, obj):
-        """Return file size - can be stored in payload or as separate field"""
-        if obj.payload and 'file_size' in obj.payload:
-            return obj.payload['file_size']
+        """Return file size - payload['file_size'], projected as file_size by querysets.po_list_queryset"""
+        if hasattr(obj, 'file_size'):
+            size = obj.file_size
+        else:
+            size = (obj.payload or {}).get('file_size')
+        if size is not None:
+            return size
         return 2457600  # Default mock size
     
     def get_upload_date(self, obj):
@@ -516,17 +539,26 @@ class PurchaseOrderListSerializer(serializers.ModelSerializer):
     
     def get_invoice_count(self, obj):
         """Return count of linked invoices"""
-        return getattr(obj, 'invoice_count', 0)
+        return stats_invoice_count(obj)
     
     def get_status(self, obj):
         """Return status based on invoice count"""
-        count = getattr(obj, 'invoice_count', 0)
-        if count == 0:
-            return {"text": "No Invoices", "type": "pending"}
-        elif count == 1:
-            return {"text": "Invoice Ready", "type": "ready"}
-        else:
-            return {"text": f"{count} Invoices", "type": "completed"}
+        return invoice_count_status(stats_invoice_count(obj))
+
+
+class POStatsSerializer(serializers.ModelSerializer):
+    """Serializer for a PO's maintained counters"""
+
+    class Meta:
+        model = POStats
+        fields = [
+            'invoice_count',
+            'matched_runs',
+            'mismatched_runs',
+            'last_verified_at',
+            'invoiced_amount',
+            'open_amount',
+        ]
 
 
 class PurchaseOrderDetailSerializer(serializers.ModelSerializer):
@@ -537,6 +569,7 @@ class PurchaseOrderDetailSerializer(serializers.ModelSerializer):
     invoice_count = serializers.SerializerMethodField()
     invoices = serializers.SerializerMethodField()
     status = serializers.SerializerMethodField()
+    stats = POStatsSerializer(read_only=True)
     
     class Meta:
         model = PurchaseOrder
@@ -554,6 +587,7 @@ class PurchaseOrderDetailSerializer(serializers.ModelSerializer):
             'buyer_name',
             'supplier_name',
             'invoice_count',
+            'stats',
             'invoices',
             'status',
             'payload',
@@ -571,7 +605,7 @@ class PurchaseOrderDetailSerializer(serializers.ModelSerializer):
         return f"{timesince(obj.created_at)} ago"
     
     def get_invoice_count(self, obj):
-        return obj.invoices.count()
+        return stats_invoice_count(obj)
     
     def get_invoices(self, obj):
         """Return all linked invoices"""
@@ -579,13 +613,7 @@ class PurchaseOrderDetailSerializer(serializers.ModelSerializer):
         return InvoiceListSerializer(invoices, many=True).data
     
     def get_status(self, obj):
-        count = obj.invoices.count()
-        if count == 0:
-            return {"text": "No Invoices", "type": "pending"}
-        elif count == 1:
-            return {"text": "Invoice Ready", "type": "ready"}
-        else:
-            return {"text": f"{count} Invoices", "type": "completed"}
+        return invoice_count_status(stats_invoice_count(obj))
 
 
 class UploadPageSummarySerializer(serializers.Serializer):
@@ -653,6 +681,37 @@ class DiscrepancySerializer(serializers.ModelSerializer):
         return obj.created_at.strftime('%b. %d, %Y, %I:%M %p')
 
 
+class POLineLedgerSerializer(serializers.ModelSerializer):
+    """Serializer for a PO line's running invoiced totals"""
+    open_quantity = serializers.SerializerMethodField()
+    open_amount = serializers.SerializerMethodField()
+
+    class Meta:
+        model = POLineLedger
+        fields = [
+            'position',
+            'item_key',
+            'description',
+            'ordered_quantity',
+            'unit_price',
+            'invoiced_quantity',
+            'invoiced_amount',
+            'open_quantity',
+            'open_amount',
+            'updated_at',
+        ]
+
+    def get_open_quantity(self, obj):
+        if obj.ordered_quantity is None:
+            return None
+        return str(obj.ordered_quantity - obj.invoiced_quantity)
+
+    def get_open_amount(self, obj):
+        if obj.ordered_quantity is None or obj.unit_price is None:
+            return None
+        return str((obj.ordered_quantity * obj.unit_price - obj.invoiced_amount).quantize(Decimal("0.01")))
+
+
 # ===== Purchase Order with Items =====
 
 class POItemSerializer(serializers.Serializer):
@@ -871,4 +930,28 @@ class ReviewPageDocumentSerializer(serializers.Serializer):
     type = serializers.CharField()
     # Additional fields based on type
     po_data = serializers.DictField(required=False)
-    invoices_data = serializers.ListField(required=False)
\ No newline at end of file
+    invoices_data = serializers.ListField(required=False)
+
+class ReconcileRequestSerializer(serializers.Serializer):
+    """Options for the bulk reconciliation of unlinked invoices"""
+    dry_run = serializers.BooleanField(default=False)
+    verify = serializers.BooleanField(default=True)  # queue re-verification jobs for linked invoices
+    limit = serializers.IntegerField(required=False, allow_null=True, min_value=1)
+
+
+class ReverifyRequestSerializer(serializers.Serializer):
+    """Which invoices to re-verify, optional tolerance overrides and the mode"""
+    purchase_order_id = serializers.UUIDField(required=False, allow_null=True)
+    invoice_ids = serializers.ListField(child=serializers.UUIDField(), required=False, allow_empty=True)
+    all = serializers.BooleanField(default=False)
+    rel_tol = serializers.FloatField(required=False, min_value=0)
+    abs_tol = serializers.FloatField(required=False, min_value=0)
+    total_rel_tol = serializers.FloatField(required=False, min_value=0)
+    total_abs_tol = serializers.FloatField(required=False, min_value=0)
+    rules_only = serializers.BooleanField(default=False)  # skip the LLM, rule-based comparison only
+    what_if = serializers.BooleanField(default=False)  # only report the statuses, computed in SQL
+
+    def validate(self, attrs):
+        if not (attrs.get("purchase_order_id") or attrs.get("invoice_ids") or attrs.get("all")):
+            raise serializers.ValidationError("Give purchase_order_id, invoice_ids or all=true")
+        return attrs
@@ -1,5 +1,8 @@
+from django.conf import settings
 from rest_framework import serializers
 
+from ..models import ProcessingJob
+
 
 class POUploadSerializer(serializers.Serializer):
     file = serializers.FileField(write_only=True)
@@ -15,6 +18,17 @@ class InvoiceUploadSerializer(serializers.Serializer):
     file = serializers.FileField(write_only=True)
     filename = serializers.CharField(required=False, allow_blank=True)
     purchase_order_id = serializers.CharField(required=False, allow_blank=True)  # optional explicit link
+    reverify = serializers.BooleanField(required=False, default=False)  # re-run verification if this file was already processed
+
+class InvoiceBatchUploadSerializer(serializers.Serializer):
+    files = serializers.ListField(child=serializers.FileField(), allow_empty=False, write_only=True)
+    purchase_order_id = serializers.UUIDField(required=False, allow_null=True)  # verify every invoice against this PO
+
+    def validate_files(self, files):
+        max_files = getattr(settings, "BATCH_UPLOAD_MAX_FILES", 100)
+        if len(files) > max_files:
+            raise serializers.ValidationError(f"At most {max_files} files per batch")
+        return files
 
 class InvoiceReadSerializer(serializers.ModelSerializer):
     class Meta:
@@ -26,3 +40,14 @@ class VerificationRunSerializer(serializers.ModelSerializer):
         model = None  # set dynamically in view
         fields = '__all__'
 
+
+
+class ProcessingJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source="id", read_only=True)
+
+    class Meta:
+        model = ProcessingJob
+        fields = [
+            "job_id", "kind", "status", "stage", "filename", "attempts",
+            "result", "error", "created_at", "started_at", "finished_at",
+        ]
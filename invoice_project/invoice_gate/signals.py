@@ -0,0 +1,85 @@
+# signals.py
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .jobs import relink_pending_invoices
+from .ledger import ledger_is_current, rebuild_po_ledger, release_invoice
+from .models import Invoice, PurchaseOrder
+from .po_cache import invalidate_purchase_order
+from .po_candidates import index_purchase_order
+from .stats import apply_invoice_edit, create_po_stats, forget_invoice, refresh_open_amount, remember_invoice_link
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=PurchaseOrder, dispatch_uid="po_cache_invalidate_on_save")
+@receiver(post_delete, sender=PurchaseOrder, dispatch_uid="po_cache_invalidate_on_delete")
+def invalidate_po_cache(sender, instance, **kwargs):
+    # drop now, and again on commit in case a concurrent lookup re-cached the old row meanwhile
+    invalidate_purchase_order(instance)
+    transaction.on_commit(lambda: invalidate_purchase_order(instance))
+
+
+@receiver(post_save, sender=PurchaseOrder, dispatch_uid="po_signature_on_save")
+def index_po_signature(sender, instance, update_fields=None, **kwargs):
+    # new POs and payload edits (admin, API); saves limited to other columns keep their bands
+    if update_fields is None or "payload" in update_fields:
+        index_purchase_order(instance)
+
+
+@receiver(post_save, sender=PurchaseOrder, dispatch_uid="po_ledger_on_save")
+def rebuild_ledger_on_po_edit(sender, instance, created, update_fields=None, **kwargs):
+    # corrected PO lines: re-book the linked invoices against the new lines
+    if created or not (update_fields is None or "payload" in update_fields):
+        return
+    if not ledger_is_current(instance):
+        rebuild_po_ledger([instance])
+
+
+@receiver(post_save, sender=PurchaseOrder, dispatch_uid="po_stats_on_save")
+def sync_po_stats_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        create_po_stats(instance)
+    elif update_fields is None or "total" in update_fields:
+        refresh_open_amount(instance)
+
+
+@receiver(pre_save, sender=Invoice, dispatch_uid="po_stats_before_invoice_edit")
+def remember_invoice_for_po_stats(sender, instance, update_fields=None, **kwargs):
+    remember_invoice_link(instance, update_fields)
+
+
+@receiver(post_save, sender=Invoice, dispatch_uid="po_stats_on_invoice_edit")
+def move_invoice_in_po_stats(sender, instance, created, **kwargs):
+    # inserts are counted by the code that creates the invoice (see stats.py)
+    if not created:
+        apply_invoice_edit(instance)
+
+
+@receiver(post_save, sender=PurchaseOrder, dispatch_uid="po_relink_pending_invoices")
+def relink_on_po_created(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    def relink():
+        try:
+            relink_pending_invoices(instance)
+        except Exception:
+            # the PO itself is committed; the invoices simply stay pending
+            logger.exception("Relinking invoices for PO %s failed", instance.pk)
+
+    transaction.on_commit(relink)
+
+
+@receiver(pre_delete, sender=Invoice, dispatch_uid="ledger_release_on_invoice_delete")
+def release_ledger_on_invoice_delete(sender, instance, **kwargs):
+    # before the entries cascade away, so the PO lines' running totals drop with them
+    release_invoice(instance)
+
+
+@receiver(pre_delete, sender=Invoice, dispatch_uid="po_stats_on_invoice_delete")
+def forget_invoice_in_po_stats(sender, instance, **kwargs):
+    forget_invoice(instance)
@@ -0,0 +1,112 @@
+# similarity.py
+"""
+Character n-gram description similarity.
+
+Descriptions are normalized into alphanumeric runs (letters and digits split
+apart, so "M8x40" and "M8 X 40" tokenize the same), turned into bags of
+padded character trigrams and compared by cosine similarity. Word order and
+punctuation therefore stop mattering: "Steel Bolt M8x40" vs
+"BOLT,STEEL M8 X 40" scores 1.0 where plain word overlap scores ~0.
+
+NgramIndex keeps an inverted index (gram -> postings) over a set of
+precomputed vectors, so one query line is scored against every candidate
+with a single sparse matrix-vector product.
+"""
+import math
+import re
+from functools import lru_cache
+
+NGRAM_SIZE = 3
+
+_token_rx = re.compile(r"[a-z]+|\d+")
+
+
+# ---------- Vectors ----------
+def normalize_tokens(text):
+    """Lowercased alphanumeric runs with letters and digits split apart"""
+    return _token_rx.findall((text or "").lower())
+
+
+def ngram_counts(text, n=NGRAM_SIZE):
+    """Bag of padded character n-grams -> {gram: count}"""
+    counts = {}
+    for token in normalize_tokens(text):
+        padded = f" {token} "
+        if len(padded) <= n:
+            counts[padded] = counts.get(padded, 0) + 1
+            continue
+        for i in range(len(padded) - n + 1):
+            gram = padded[i:i + n]
+            counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+def vector_norm(counts):
+    return math.sqrt(sum(c * c for c in counts.values()))
+
+
+@lru_cache(maxsize=4096)
+def _cached_vector(text):
+    counts = ngram_counts(text)
+    return counts, vector_norm(counts)
+
+
+def ngram_vector(text):
+    """(counts, norm) for a description; memoized since invoice lines repeat"""
+    return _cached_vector(text or "")
+
+
+def cosine(vec_a, vec_b):
+    """Cosine similarity of two (counts, norm) vectors"""
+    counts_a, norm_a = vec_a
+    counts_b, norm_b = vec_b
+    if not norm_a or not norm_b:
+        return 0.0
+    if len(counts_a) > len(counts_b):
+        counts_a, counts_b = counts_b, counts_a
+    dot = sum(c * counts_b.get(g, 0) for g, c in counts_a.items())
+    return dot / (norm_a * norm_b)
+
+
+def description_similarity(a, b):
+    """Convenience pairwise score in [0, 1]"""
+    return cosine(ngram_vector(a), ngram_vector(b))
+
+
+# ---------- One-vs-many scoring ----------
+class NgramIndex:
+    """
+    Inverted index over precomputed (counts, norm) vectors.
+
+    scores(vec) returns the cosine similarity of vec against every indexed
+    document, aligned with the order the vectors were given in.
+    """
+
+    def __init__(self, vectors):
+        self.size = len(vectors)
+        self.norms = [norm for _, norm in vectors]
+        self.postings = {}
+        for doc, (counts, _) in enumerate(vectors):
+            for gram, count in counts.items():
+                self.postings.setdefault(gram, []).append((doc, count))
+
+    @classmethod
+    def from_texts(cls, texts):
+        return cls([ngram_vector(t) for t in texts])
+
+    def scores(self, vec):
+        counts, norm = vec
+        dots = [0] * self.size
+        if not norm:
+            return [0.0] * self.size
+        postings = self.postings
+        for gram, count in counts.items():
+            for doc, doc_count in postings.get(gram, ()):
+                dots[doc] += count * doc_count
+        return [
+            (dot / (norm * doc_norm)) if dot and doc_norm else 0.0
+            for dot, doc_norm in zip(dots, self.norms)
+        ]
+
+    def score_text(self, text):
+        return self.scores(ngram_vector(text))
@@ -0,0 +1,47 @@
+# snapshots.py
+"""
+Content-addressed storage for the PO / invoice payload snapshots kept on
+each VerificationRun.
+
+Snapshots are keyed by the SHA-256 of their canonical JSON, so a PO that is
+verified against many invoices (or re-verified) is stored exactly once and
+every run just references the digest.
+"""
+import hashlib
+import json
+
+from .models import Snapshot
+
+
+def canonical_json(data):
+    """Stable JSON text: sorted keys, no insignificant whitespace"""
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def snapshot_digest(data):
+    return hashlib.sha256(canonical_json(data).encode("utf-8")).hexdigest()
+
+
+def build_snapshot(data):
+    """Unsaved Snapshot for data, or None for empty payloads"""
+    if not data:
+        return None
+    return Snapshot(digest=snapshot_digest(data), data=data)
+
+
+def save_snapshots(snapshots):
+    """
+    Insert the given Snapshot rows with a single INSERT ... ON CONFLICT DO
+    NOTHING, so snapshots that are already stored cost nothing extra.
+    None entries are skipped.
+    """
+    unique = {s.digest: s for s in snapshots if s is not None}
+    if unique:
+        Snapshot.objects.bulk_create(list(unique.values()), ignore_conflicts=True)
+
+
+def store_snapshots(*payloads):
+    """Store payloads and return their Snapshot rows (None for empty ones), in order"""
+    snapshots = [build_snapshot(p) for p in payloads]
+    save_snapshots(snapshots)
+    return snapshots
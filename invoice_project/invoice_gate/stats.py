@@ -0,0 +1,177 @@
+# stats.py
+"""
+Maintenance of the per-PO counters in POStats.
+
+The write paths that link invoices to POs or store verification runs call
+update_po_stats() inside their own transaction, so the counters commit or
+roll back together with the rows they count. Changes are applied as
+`UPDATE ... SET n = n + delta`, one statement per PO touched, without
+reading the row first. The row is created together with its PO
+(signals.py); rebuild_po_stats() recomputes all rows from the base tables
+to repair drift (e.g. after links were edited by hand).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
+
+from .models import Invoice, POStats, PurchaseOrder, VerificationRun, VerificationStatus
+
+COUNTERS = ("invoice_count", "matched_runs", "mismatched_runs", "invoiced_amount")
+
+
+def create_po_stats(po):
+    POStats.objects.bulk_create([POStats(purchase_order=po, open_amount=po.total)], ignore_conflicts=True)
+
+
+def refresh_open_amount(po):
+    """Recompute a PO's open amount after its total changed"""
+    open_amount = None if po.total is None else po.total - F("invoiced_amount")
+    POStats.objects.filter(purchase_order_id=po.pk).update(open_amount=open_amount, updated_at=timezone.now())
+
+
+def billed_amount(total, duplicate_of_id=None):
+    """What an invoice adds to its PO's invoiced amount (duplicates add nothing)"""
+    if total is None or duplicate_of_id:
+        return Decimal(0)
+    return Decimal(total)
+
+
+def update_po_stats(runs=(), moves=(), sign=1):
+    """
+    Apply new runs and invoice link changes to the PO counters.
+
+    moves holds (old_po_id, new_po_id, total, duplicate_of_id) per invoice
+    whose link changed (None for "no PO"). sign=-1 takes runs back out.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    verified_at = {}
+    for run in runs:
+        if not run.purchase_order_id:
+            continue
+        field = "matched_runs" if run.status == VerificationStatus.MATCHED else "mismatched_runs"
+        deltas[run.purchase_order_id][field] += sign
+        if sign > 0:
+            finished = run.finished_at or timezone.now()
+            verified_at[run.purchase_order_id] = max(finished, verified_at.get(run.purchase_order_id, finished))
+    for old_po_id, new_po_id, total, duplicate_of_id in moves:
+        if old_po_id == new_po_id:
+            continue
+        amount = billed_amount(total, duplicate_of_id)
+        if old_po_id:
+            deltas[old_po_id]["invoice_count"] -= 1
+            deltas[old_po_id]["invoiced_amount"] -= amount
+        if new_po_id:
+            deltas[new_po_id]["invoice_count"] += 1
+            deltas[new_po_id]["invoiced_amount"] += amount
+
+    now = timezone.now()
+    for po_id, delta in deltas.items():
+        changes = {field: F(field) + value for field, value in delta.items() if value}
+        if delta.get("invoiced_amount"):
+            changes["open_amount"] = F("open_amount") - delta["invoiced_amount"]
+        if po_id in verified_at:
+            changes["last_verified_at"] = verified_at[po_id]
+        if changes:
+            POStats.objects.filter(purchase_order_id=po_id).update(**changes, updated_at=now)
+
+
+def forget_invoice(invoice_obj):
+    """Take a (deleted) invoice and its runs out of the counters"""
+    runs = VerificationRun.objects.filter(invoice_id=invoice_obj.pk, purchase_order__isnull=False).only(
+        "pk", "purchase_order_id", "status"
+    )
+    update_po_stats(
+        runs=list(runs),
+        moves=[(invoice_obj.purchase_order_id, None, invoice_obj.total, invoice_obj.duplicate_of_id)],
+        sign=-1,
+    )
+
+
+# fields of an invoice that feed its PO's counters
+INVOICE_STATS_FIELDS = ("purchase_order_id", "total", "duplicate_of_id")
+
+
+def remember_invoice_link(invoice_obj, update_fields=None):
+    """Before an existing invoice is saved, keep the stored values the counters were built from"""
+    invoice_obj._stats_before = None
+    if invoice_obj._state.adding or not invoice_obj.pk:
+        return
+    if update_fields is not None and not {"purchase_order", "total", "duplicate_of"}.intersection(update_fields):
+        return
+    invoice_obj._stats_before = (
+        Invoice.objects.filter(pk=invoice_obj.pk).values_list(*INVOICE_STATS_FIELDS).first()
+    )
+
+
+def apply_invoice_edit(invoice_obj):
+    """After the save: move the invoice out of the old values and into the new ones"""
+    before = getattr(invoice_obj, "_stats_before", None)
+    invoice_obj._stats_before = None
+    after = tuple(getattr(invoice_obj, field) for field in INVOICE_STATS_FIELDS)
+    if before is None or before == after:
+        return
+    old_po_id, old_total, old_duplicate_of_id = before
+    new_po_id, new_total, new_duplicate_of_id = after
+    update_po_stats(moves=[
+        (old_po_id, None, old_total, old_duplicate_of_id),
+        (None, new_po_id, new_total, new_duplicate_of_id),
+    ])
+
+
+# ---------- Rebuild ----------
+def rebuild_po_stats(batch_size=1000, dry_run=False):
+    """
+    Recompute every PO's counters from invoices and runs (two grouped
+    queries) and write them in batches. Returns (purchase orders, rows that
+    were missing or differed).
+    """
+    invoices = {
+        row["purchase_order_id"]: row
+        for row in Invoice.objects.filter(purchase_order__isnull=False)
+        .values("purchase_order_id")
+        .annotate(n=Count("pk"), amount=Sum("total", filter=Q(duplicate_of__isnull=True)))
+    }
+    runs = {
+        row["purchase_order_id"]: row
+        for row in VerificationRun.objects.filter(purchase_order__isnull=False)
+        .values("purchase_order_id")
+        .annotate(
+            matched=Count("pk", filter=Q(status=VerificationStatus.MATCHED)),
+            mismatched=Count("pk", filter=~Q(status=VerificationStatus.MATCHED)),
+            last=Max("finished_at"),
+        )
+    }
+    current = {row[0]: row[1:] for row in POStats.objects.values_list("purchase_order_id", *COUNTERS, "last_verified_at")}
+
+    total, drifted, pending = 0, 0, []
+    fields = [*COUNTERS, "last_verified_at", "open_amount", "updated_at"]
+
+    def flush():
+        if pending and not dry_run:
+            POStats.objects.bulk_create(
+                pending, update_conflicts=True, unique_fields=["purchase_order"], update_fields=fields
+            )
+        pending.clear()
+
+    for po_id, po_total in PurchaseOrder.objects.values_list("pk", "total").iterator(chunk_size=batch_size):
+        inv = invoices.get(po_id) or {}
+        run = runs.get(po_id) or {}
+        stats = POStats(
+            purchase_order_id=po_id,
+            invoice_count=inv.get("n") or 0,
+            matched_runs=run.get("matched") or 0,
+            mismatched_runs=run.get("mismatched") or 0,
+            invoiced_amount=inv.get("amount") or Decimal(0),
+            last_verified_at=run.get("last"),
+        )
+        stats.open_amount = po_total - stats.invoiced_amount if po_total is not None else None
+        total += 1
+        if current.get(po_id) != tuple(getattr(stats, field) for field in (*COUNTERS, "last_verified_at")):
+            drifted += 1
+        pending.append(stats)
+        if len(pending) >= batch_size:
+            flush()
+    flush()
+    return total, drifted
@@ -0,0 +1,72 @@
+# timing.py
+"""
+Per-stage timing for the upload pipeline.
+
+A PipelineTimer is created when a request starts processing a document and
+is passed down through storage, OCR, extraction, linking, comparison and
+persistence. Each stage is recorded with its wall-clock start and elapsed
+milliseconds; the result is stored on VerificationRun.stage_timings.
+"""
+import time
+from contextlib import contextmanager, nullcontext
+
+from django.utils import timezone
+
+
+class PipelineTimer:
+    def __init__(self, listeners=None):
+        self.started_at = timezone.now()
+        self.finished_at = None
+        self._t0 = time.perf_counter()
+        self.stages = []
+        # callables invoked as listener(event, entry) with event "start" / "end"
+        self.listeners = list(listeners or [])
+
+    def _notify(self, event, entry):
+        for listener in self.listeners:
+            listener(event, entry)
+
+    @contextmanager
+    def stage(self, name, **meta):
+        """Time a block: `with timer.stage("ocr_page", page=1): ...`"""
+        started_at = timezone.now()
+        t0 = time.perf_counter()
+        entry = {"name": name, "started_at": started_at.isoformat(), **meta}
+        self._notify("start", entry)
+        try:
+            yield entry
+        finally:
+            entry["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            self.stages.append(entry)
+            self._notify("end", entry)
+
+    def finish(self):
+        self.finished_at = timezone.now()
+        return self
+
+    @property
+    def duration_ms(self):
+        return int(round((time.perf_counter() - self._t0) * 1000))
+
+    def totals(self):
+        """Milliseconds per stage name (per-page stages summed)"""
+        out = {}
+        for entry in self.stages:
+            out[entry["name"]] = round(out.get(entry["name"], 0) + entry["ms"], 1)
+        return out
+
+    def as_dict(self):
+        return {
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "total_ms": self.duration_ms,
+            "totals": self.totals(),
+            "stages": self.stages,
+        }
+
+
+def stage(timer, name, **meta):
+    """timer.stage(...) when a timer is given, else a no-op context"""
+    if timer is None:
+        return nullcontext({})
+    return timer.stage(name, **meta)
@@ -0,0 +1,125 @@
+# upload_handlers.py
+"""
+Upload handler for document uploads.
+
+While the multipart body streams in, each file is hashed (SHA-256), checked
+by its magic bytes and size-limited, so bogus or oversize files are rejected
+before they are written anywhere. Files up to FILE_UPLOAD_MAX_MEMORY_SIZE stay
+in memory (and can go straight to PyMuPDF); larger ones spill to a temporary
+file. Accepted files carry `content_hash` and `detected_type` attributes.
+"""
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+# (magic prefix, type) for the document types OCR can handle
+MAGIC_TYPES = (
+    (b"%PDF-", "pdf"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+)
+SNIFF_BYTES = 8
+
+
+def sniff_file_type(head):
+    """Document type from the first bytes of a file, or None if unsupported"""
+    for magic, file_type in MAGIC_TYPES:
+        if head.startswith(magic):
+            return file_type
+    return None
+
+
+def max_upload_bytes():
+    return getattr(settings, "UPLOAD_MAX_BYTES", 25 * 1024 * 1024)
+
+
+class DocumentUploadHandler(FileUploadHandler):
+    """
+    Rejected files are skipped and reported in request.upload_errors as a
+    list of (http_status, message). max_memory_size overrides
+    FILE_UPLOAD_MAX_MEMORY_SIZE (0 spools every file to disk).
+    """
+
+    def __init__(self, request=None, max_memory_size=None):
+        super().__init__(request)
+        self.max_memory_size = settings.FILE_UPLOAD_MAX_MEMORY_SIZE if max_memory_size is None else max_memory_size
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.head = b""
+        self.detected_type = None
+        self.size = 0
+        self.buffer = io.BytesIO()
+        self.spooled = None
+
+    def record_error(self, http_status, message):
+        if not hasattr(self.request, "upload_errors"):
+            self.request.upload_errors = []
+        self.request.upload_errors.append((http_status, f"{self.file_name}: {message}"))
+        self.buffer = None
+        if self.spooled is not None:
+            self.spooled.close()  # deletes the temporary file
+            self.spooled = None
+
+    def reject(self, http_status, message):
+        """Drop the rest of this file (the parser skips it)"""
+        self.record_error(http_status, message)
+        raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.detected_type is None and len(self.head) < SNIFF_BYTES:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self.detected_type = sniff_file_type(self.head)
+                if self.detected_type is None:
+                    self.reject(415, "unsupported file type (expected PDF, PNG, JPEG or TIFF)")
+
+        self.size += len(raw_data)
+        if self.size > max_upload_bytes():
+            self.reject(413, f"file exceeds the {max_upload_bytes() / (1024 * 1024):.1f} MB upload limit")
+
+        self.digest.update(raw_data)
+        if self.spooled is None and self.size > self.max_memory_size:
+            # too big to keep in memory: move what we have to a temporary file
+            self.spooled = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+            self.spooled.write(self.buffer.getvalue())
+            self.buffer = None
+        if self.spooled is not None:
+            self.spooled.write(raw_data)
+        else:
+            self.buffer.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.detected_type is None:
+            # shorter than the magic bytes we need
+            self.detected_type = sniff_file_type(self.head)
+            if self.detected_type is None:
+                self.record_error(415, "unsupported file type (expected PDF, PNG, JPEG or TIFF)")
+                return None
+
+        if self.spooled is not None:
+            uploaded = self.spooled
+            uploaded.flush()
+            uploaded.seek(0)
+            uploaded.size = file_size
+        else:
+            self.buffer.seek(0)
+            uploaded = InMemoryUploadedFile(
+                file=self.buffer,
+                field_name=self.field_name,
+                name=self.file_name,
+                content_type=self.content_type,
+                size=file_size,
+                charset=self.charset,
+                content_type_extra=self.content_type_extra,
+            )
+        uploaded.content_hash = self.digest.hexdigest()
+        uploaded.detected_type = self.detected_type
+        return uploaded
@@ -6,12 +6,17 @@ from django.urls import path
 from .views.uploadviews import (
     PurchaseOrderUploadView, 
     InvoiceUploadAndVerifyView,
+    InvoiceBatchUploadView,
+    ProcessingJobListView,
+    ProcessingJobStatusView,
+    ProcessingJobEventsView,
 )
 from .views.dashboardviews import (
     UploadPageDataView,
     PurchaseOrderListView,
     PurchaseOrderDetailView,
     PurchaseOrderInvoicesView,
+    PurchaseOrderLedgerView,
     InvoiceListView,
     InvoiceDetailView,
     ReviewPageDataView,
@@ -19,6 +24,8 @@ from .views.dashboardviews import (
     VerificationRunDetailView,
     VerificationItemResultsView,
     DiscrepancyListView,
+    ReconcileInvoicesView,
+    ReverifyInvoicesView,
 )
 
 urlpatterns = [
@@ -30,6 +37,14 @@ urlpatterns = [
     # Invoice Upload & Verify
     path("home/invoice/upload-and-verify/", InvoiceUploadAndVerifyView.as_view(), name="invoice-upload-verify"),
 
+    # Batch invoice upload & verify (queued as one job per file; without a worker, processed in the request)
+    path("home/invoice/batch-upload-and-verify/", InvoiceBatchUploadView.as_view(), name="invoice-batch-upload-verify"),
+
+    # Upload processing job status (uploads return 202 + job id)
+    path("home/jobs/", ProcessingJobListView.as_view(), name="job-list"),
+    path("home/jobs/<uuid:id>/", ProcessingJobStatusView.as_view(), name="job-status"),
+    path("home/jobs/<uuid:id>/events/", ProcessingJobEventsView.as_view(), name="job-events"),
+
     # Main endpoint - all data for home/upload page
     path("home/upload-page-data/", UploadPageDataView.as_view(), name="home-upload-page-data"),
 
@@ -37,6 +52,7 @@ urlpatterns = [
     path("home/purchase-orders/", PurchaseOrderListView.as_view(), name="home-purchase-orders-list"),
     path("home/purchase-orders/<uuid:id>/", PurchaseOrderDetailView.as_view(), name="home-purchase-order-detail"),
     path("home/purchase-orders/<uuid:po_id>/invoices/", PurchaseOrderInvoicesView.as_view(), name="home-purchase-order-invoices"),
+    path("home/purchase-orders/<uuid:po_id>/ledger/", PurchaseOrderLedgerView.as_view(), name="home-purchase-order-ledger"),
 
     # Invoices
     path("home/invoices/", InvoiceListView.as_view(), name="home-invoices-list"),
@@ -52,4 +68,10 @@ urlpatterns = [
     path("dashboard/verification-runs/<uuid:id>/", VerificationRunDetailView.as_view(), name="dashboard-verification-run-detail"),
     path("dashboard/verification-runs/<uuid:run_id>/items/", VerificationItemResultsView.as_view(), name="dashboard-verification-item-results"),
     path("dashboard/verification-runs/<uuid:run_id>/discrepancies/", DiscrepancyListView.as_view(), name="dashboard-verification-discrepancies"),
+
+    # Bulk reconciliation of unlinked invoices (staff only; queued job, progress via job events)
+    path("dashboard/reconcile/", ReconcileInvoicesView.as_view(), name="dashboard-reconcile"),
+
+    # Bulk re-verification from stored payloads (what_if: SQL-only status preview)
+    path("dashboard/reverify/", ReverifyInvoicesView.as_view(), name="dashboard-reverify"),
 ]
@@ -1,14 +1,19 @@
+import logging
+
 from rest_framework import generics, status
+from rest_framework.permissions import IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.db.models import Count
+from django.db.models import Count, Exists, F, Func, IntegerField, Max, OuterRef, Prefetch, Q, Subquery
 
 from ..models import (
     PurchaseOrder, 
     Invoice,
     VerificationRun,
     ItemVerification,
-    Discrepancy
+    Discrepancy,
+    POLineLedger,
+    JobKind,
 )
 
 from ..serializers.dashboardserializers import (
@@ -21,7 +26,37 @@ from ..serializers.dashboardserializers import (
     InvoiceWithItemsSerializer,
     VerificationItemResultSerializer,
     DiscrepancySerializer,
+    POLineLedgerSerializer,
+    ReconcileRequestSerializer,
+    ReverifyRequestSerializer,
 )
+from ..compare import DEFAULT_TOLERANCES
+from ..jobs import enqueue_job
+from ..pagination import KeysetPaginationMixin
+from ..querysets import invoice_list_queryset, po_list_queryset, run_list_queryset
+from ..reverify import select_invoices, what_if_statuses
+from .uploadviews import queued_job_response
+
+logger = logging.getLogger(__name__)
+
+
+def upload_summary():
+    """
+    Upload page counts in one query: POs, POs with at least one invoice
+    (EXISTS per PO instead of a GROUP BY over all of them) and invoices (a
+    scalar subquery, wrapped in Max() so it can sit in the aggregate).
+    """
+    invoice_count = Invoice.objects.order_by().values(n=Func(F('pk'), function='COUNT'))
+    counts = PurchaseOrder.objects.aggregate(
+        total_pos=Count('pk'),
+        pos_with_invoices=Count('pk', filter=Q(Exists(Invoice.objects.filter(purchase_order=OuterRef('pk'))))),
+        total_invoices=Max(Subquery(invoice_count, output_field=IntegerField())),
+    )
+    if counts['total_invoices'] is None:
+        # no POs at all: the aggregate ran over zero rows
+        counts['total_invoices'] = Invoice.objects.count()
+    counts['pos_without_invoices'] = counts['total_pos'] - counts['pos_with_invoices']
+    return counts
 
 
 class UploadPageDataView(APIView):
@@ -55,22 +90,14 @@ class UploadPageDataView(APIView):
             po_limit = min(max(po_limit, 1), 100)  # Between 1 and 100
             invoice_limit = min(max(invoice_limit, 1), 100)
             
-            # Fetch purchase orders with invoice count annotation
-            purchase_orders = PurchaseOrder.objects.annotate(
-                invoice_count=Count('invoices')
-            ).order_by('-created_at')[:po_limit]
+            # Fetch purchase orders with their maintained stats (invoice count), list columns only
+            purchase_orders = po_list_queryset().order_by('-created_at')[:po_limit]
             
             # Fetch invoices
-            invoices = Invoice.objects.select_related(
-                'purchase_order'
-            ).order_by('-created_at')[:invoice_limit]
+            invoices = invoice_list_queryset().order_by('-created_at')[:invoice_limit]
             
             # Calculate summary statistics
-            total_pos = PurchaseOrder.objects.count()
-            total_invoices = Invoice.objects.count()
-            pos_with_invoices = PurchaseOrder.objects.annotate(
-                invoice_count=Count('invoices')
-            ).filter(invoice_count__gt=0).count()
+            summary = upload_summary()
             
             # Serialize data
             po_serializer = PurchaseOrderListSerializer(purchase_orders, many=True)
@@ -79,12 +106,7 @@ class UploadPageDataView(APIView):
             response_data = {
                 'purchase_orders': po_serializer.data,
                 'invoices': invoice_serializer.data,
-                'summary': {
-                    'total_pos': total_pos,
-                    'total_invoices': total_invoices,
-                    'pos_with_invoices': pos_with_invoices,
-                    'pos_without_invoices': total_pos - pos_with_invoices,
-                }
+                'summary': summary,
             }
             
             return Response(response_data, status=status.HTTP_200_OK)
@@ -101,46 +123,30 @@ class UploadPageDataView(APIView):
             )
 
 
-class PurchaseOrderListView(generics.ListAPIView):
+class PurchaseOrderListView(KeysetPaginationMixin, generics.ListAPIView):
     """
     GET: List all purchase orders
     
     Query Parameters:
     - limit: int (default: 6) - Number of items per page
-    - offset: int (default: 0) - Pagination offset
+    - cursor: str (optional) - next_cursor of the previous page (keyset pagination)
+    - offset: int (default: 0) - Pagination offset, when no cursor is given
+    - count: bool (default: true without cursor, false with one) - Include the total
     
     Response:
     {
         "count": int,
-        "results": [...]
+        "results": [...],
+        "next_cursor": str | null
     }
     """
     serializer_class = PurchaseOrderListSerializer
+    default_limit = 6
     
     def get_queryset(self):
-        queryset = PurchaseOrder.objects.annotate(
-            invoice_count=Count('invoices')
-        ).order_by('-created_at')
+        queryset = po_list_queryset().order_by('-created_at')
         
         return queryset
-    
-    def list(self, request, *args, **kwargs):
-        # Get pagination params
-        limit = int(request.query_params.get('limit', 6))
-        offset = int(request.query_params.get('offset', 0))
-        
-        # Validate
-        limit = min(max(limit, 1), 100)
-        offset = max(offset, 0)
-        
-        # Get queryset and apply pagination
-        queryset = self.get_queryset()[offset:offset + limit]
-        serializer = self.get_serializer(queryset, many=True)
-        
-        return Response({
-            'count': PurchaseOrder.objects.count(),
-            'results': serializer.data
-        })
 
 
 class PurchaseOrderDetailView(generics.RetrieveAPIView):
@@ -150,31 +156,34 @@ class PurchaseOrderDetailView(generics.RetrieveAPIView):
     URL: /api/purchase-orders/{id}/
     """
     serializer_class = PurchaseOrderDetailSerializer
-    queryset = PurchaseOrder.objects.prefetch_related('invoices')
+    queryset = PurchaseOrder.objects.select_related('stats').defer('item_index').prefetch_related(
+        Prefetch('invoices', queryset=invoice_list_queryset())
+    )
     lookup_field = 'id'
 
 
-class InvoiceListView(generics.ListAPIView):
+class InvoiceListView(KeysetPaginationMixin, generics.ListAPIView):
     """
     GET: List all invoices
     
     Query Parameters:
     - limit: int (default: 10) - Number of items per page
-    - offset: int (default: 0) - Pagination offset
+    - cursor: str (optional) - next_cursor of the previous page (keyset pagination)
+    - offset: int (default: 0) - Pagination offset, when no cursor is given
+    - count: bool (default: true without cursor, false with one) - Include the total
     - po_id: str (optional) - Filter by purchase order ID
     
     Response:
     {
         "count": int,
-        "results": [...]
+        "results": [...],
+        "next_cursor": str | null
     }
     """
     serializer_class = InvoiceListSerializer
     
     def get_queryset(self):
-        queryset = Invoice.objects.select_related(
-            'purchase_order'
-        ).order_by('-created_at')
+        queryset = invoice_list_queryset().order_by('-created_at')
         
         # Filter by PO ID if provided
         po_id = self.request.query_params.get('po_id')
@@ -182,27 +191,6 @@ class InvoiceListView(generics.ListAPIView):
             queryset = queryset.filter(purchase_order__purchase_order_id=po_id)
         
         return queryset
-    
-    def list(self, request, *args, **kwargs):
-        # Get pagination params
-        limit = int(request.query_params.get('limit', 10))
-        offset = int(request.query_params.get('offset', 0))
-        
-        # Validate
-        limit = min(max(limit, 1), 100)
-        offset = max(offset, 0)
-        
-        # Get queryset and apply pagination
-        queryset = self.get_queryset()[offset:offset + limit]
-        serializer = self.get_serializer(queryset, many=True)
-        
-        # Get total count (with filters applied)
-        total_count = self.get_queryset().count()
-        
-        return Response({
-            'count': total_count,
-            'results': serializer.data
-        })
 
 
 class InvoiceDetailView(generics.RetrieveAPIView):
@@ -226,9 +214,21 @@ class PurchaseOrderInvoicesView(generics.ListAPIView):
     
     def get_queryset(self):
         po_id = self.kwargs.get('po_id')
-        return Invoice.objects.filter(
+        return invoice_list_queryset().filter(
             purchase_order__id=po_id
-        ).select_related('purchase_order').order_by('-created_at')
+        ).order_by('-created_at')
+
+
+class PurchaseOrderLedgerView(generics.ListAPIView):
+    """
+    GET: Ordered vs invoiced quantities and amounts per line of a purchase order
+
+    URL: /api/purchase-orders/{po_id}/ledger/
+    """
+    serializer_class = POLineLedgerSerializer
+
+    def get_queryset(self):
+        return POLineLedger.objects.filter(purchase_order_id=self.kwargs.get('po_id')).order_by('position')
     
 
 #------------- Detail Page views ----------------#
@@ -249,11 +249,7 @@ class ReviewPageDataView(APIView):
             limit = int(request.query_params.get('limit', 10))
             
             # Fetch verification runs (match data)
-            verification_runs = VerificationRun.objects.select_related(
-                'purchase_order', 'invoice'
-            ).prefetch_related(
-                'item_results', 'discrepancies'
-            ).order_by('-created_at')
+            verification_runs = run_list_queryset().order_by('-created_at')
             
             # Filter by PO if specified
             if po_id:
@@ -271,9 +267,9 @@ class ReviewPageDataView(APIView):
             if verification_runs.exists():
                 first_run = verification_runs.first()
                 
-                if first_run.purchase_order:
-                    # Get PO with items
-                    po = first_run.purchase_order
+                if first_run.purchase_order_id:
+                    # Get PO with items (the runs only carry the PO number)
+                    po = PurchaseOrder.objects.defer('item_index').get(pk=first_run.purchase_order_id)
                     po_serializer = PurchaseOrderWithItemsSerializer(po)
                     po_data = po_serializer.data
                     
@@ -290,7 +286,7 @@ class ReviewPageDataView(APIView):
                     # Get all invoices for this PO
                     invoices = Invoice.objects.filter(
                         purchase_order=po
-                    ).order_by('-created_at')
+                    ).defer('compared_payload').order_by('-created_at')
                     
                     invoice_serializer = InvoiceWithItemsSerializer(invoices, many=True)
                     
@@ -318,7 +314,7 @@ class ReviewPageDataView(APIView):
             )
 
 
-class VerificationRunListView(generics.ListAPIView):
+class VerificationRunListView(KeysetPaginationMixin, generics.ListAPIView):
     """
     GET: List all verification runs (match results)
     
@@ -327,16 +323,14 @@ class VerificationRunListView(generics.ListAPIView):
     - invoice_id: Filter by invoice UUID
     - status: Filter by status (matched, mismatched, pending, error)
     - limit: Number of results (default: 10)
-    - offset: Pagination offset (default: 0)
+    - cursor: next_cursor of the previous page (keyset pagination)
+    - offset: Pagination offset (default: 0), when no cursor is given
+    - count: Include the total (default: true without cursor, false with one)
     """
     serializer_class = MatchDataSerializer
     
     def get_queryset(self):
-        queryset = VerificationRun.objects.select_related(
-            'purchase_order', 'invoice'
-        ).prefetch_related(
-            'item_results', 'discrepancies'
-        ).order_by('-created_at')
+        queryset = run_list_queryset().order_by('-created_at')
         
         # Apply filters
         po_id = self.request.query_params.get('po_id')
@@ -352,18 +346,6 @@ class VerificationRunListView(generics.ListAPIView):
             queryset = queryset.filter(status=status_filter)
         
         return queryset
-    
-    def list(self, request, *args, **kwargs):
-        limit = int(request.query_params.get('limit', 10))
-        offset = int(request.query_params.get('offset', 0))
-        
-        queryset = self.get_queryset()[offset:offset + limit]
-        serializer = self.get_serializer(queryset, many=True)
-        
-        return Response({
-            'count': self.get_queryset().count(),
-            'results': serializer.data
-        })
 
 
 class VerificationRunDetailView(generics.RetrieveAPIView):
@@ -427,4 +409,63 @@ class DiscrepancyListView(generics.ListAPIView):
         run_id = self.kwargs.get('run_id')
         return Discrepancy.objects.filter(
             run__id=run_id
-        ).select_related('item_result').order_by('level', 'type')
\ No newline at end of file
+        ).select_related('item_result').order_by('level', 'type')
+
+
+class ReconcileInvoicesView(APIView):
+    """
+    POST: Link all unlinked invoices to POs in one global pass (see reconcile.py)
+
+    Body: {"dry_run": bool, "verify": bool, "limit": int}
+
+    Staff only. Queued as a ProcessingJob: 202 with the job's status and
+    events URLs (progress events {"stage", "processed", "total"}); the
+    summary ends up in the job's result, dry runs list the proposed links.
+    Without a job worker the job runs in the request and is returned finished;
+    the linked invoices are then not re-verified (counted as "unverified").
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = ReconcileRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = enqueue_job(JobKind.RECONCILE, "", params=serializer.validated_data)
+        return queued_job_response(request, job)
+
+
+class ReverifyInvoicesView(APIView):
+    """
+    POST: Re-verify stored invoices without OCR / extraction (see reverify.py)
+
+    Body: {"purchase_order_id": uuid, "invoice_ids": [uuid], "all": bool,
+           "rel_tol", "abs_tol", "total_rel_tol", "total_abs_tol": number,
+           "rules_only": bool, "what_if": bool}
+
+    Staff only. what_if returns, as plain JSON, the statuses the latest runs
+    would get under the given tolerances (computed in SQL, nothing written).
+    Otherwise a re-verification job is queued, like reconcile.
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = ReverifyRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        options = serializer.validated_data
+        tolerances = {key: options.get(key) for key in DEFAULT_TOLERANCES}
+
+        if options["what_if"]:
+            invoices = select_invoices(
+                purchase_order_id=options.get("purchase_order_id"),
+                invoice_ids=options.get("invoice_ids"),
+                all_invoices=options["all"],
+            )
+            return Response(what_if_statuses(invoices, tolerances))
+
+        job = enqueue_job(JobKind.REVERIFY, "", params={
+            "purchase_order_id": str(options["purchase_order_id"]) if options.get("purchase_order_id") else None,
+            "invoice_ids": [str(pk) for pk in options.get("invoice_ids") or []],
+            "all": options["all"],
+            "tolerances": {key: value for key, value in tolerances.items() if value is not None},
+            "rules_only": options["rules_only"],
+        })
+        return queued_job_response(request, job)
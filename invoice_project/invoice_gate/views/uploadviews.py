@@ -1,30 +1,50 @@
 import os
-import re
+import json
+import hashlib
+import uuid
 import logging
-from decimal import Decimal, InvalidOperation
-from django.utils.dateparse import parse_date as django_parse_date
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.core.files.storage import default_storage
-from django.db import IntegrityError
-from django.utils.dateparse import parse_date
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.urls import reverse
 
 from rest_framework.views import APIView
+from rest_framework import generics
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import MultiPartParser, FormParser
 from drf_yasg.utils import swagger_auto_schema
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 
-from ..models import PurchaseOrder, Invoice, VerificationRun, VerificationStatus
 from ..serializers.uploadserializers import (
     POUploadSerializer, 
     InvoiceUploadSerializer,
+    InvoiceBatchUploadSerializer,
+    ProcessingJobSerializer,
 )
-from ..ocr_utils import file_to_text, extract_structured_fields
-from ..compare import compare_one_pair, persist_verification, normalize_compared_payload
+from ..jobs import EVENT_WAIT_MAX_SECONDS, enqueue_job, processing_is_async, run_job_now, wait_for_job_events
+from ..models import ProcessingJob, JobKind, JobStatus
+from ..pipeline import (
+    ProcessingError,
+    process_purchase_order,
+    purchase_order_result,
+    process_invoice,
+    invoice_result,
+    find_duplicate_purchase_order,
+    find_duplicate_invoice,
+    existing_invoice_result,
+    reverify_invoice,
+    load_batch_purchase_order,
+    process_invoice_batch,
+)
+from ..timing import PipelineTimer
+from ..upload_handlers import DocumentUploadHandler
 
+logger = logging.getLogger(__name__)
 
-MAX_FILES_PER_TYPE = 3
 
 # helper: save uploaded file and return fullpath + saved name
 def save_upload_and_get_path(uploaded_file, subdir="uploads"):
@@ -33,13 +53,93 @@ def save_upload_and_get_path(uploaded_file, subdir="uploads"):
     fullpath = default_storage.path(saved_name) if hasattr(default_storage, "path") else os.path.join(default_storage.location, saved_name)
     return saved_name, fullpath
 
+
+
+def uploaded_file_hash(uploaded_file):
+    """SHA-256 of an uploaded file (computed while streaming by DocumentUploadHandler)"""
+    if getattr(uploaded_file, "content_hash", None):
+        return uploaded_file.content_hash
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def in_memory_bytes(uploaded_file):
+    """File bytes when the upload never left memory (handed to PyMuPDF directly), else None"""
+    if not isinstance(uploaded_file, InMemoryUploadedFile):
+        return None
+    uploaded_file.seek(0)
+    return uploaded_file.read()
+
+
+class DocumentUploadMixin:
+    """
+    Parse multipart uploads with DocumentUploadHandler so files are hashed,
+    sniffed and size-checked while they stream in.
+    """
+    upload_max_memory_size = None  # FILE_UPLOAD_MAX_MEMORY_SIZE
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [DocumentUploadHandler(request, max_memory_size=self.upload_max_memory_size)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def upload_error_response(self, request):
+        """Response for files the upload handler rejected, or None"""
+        request.data  # noqa: B018 - parsing the body runs the upload handler
+        errors = getattr(request._request, "upload_errors", None)
+        if not errors:
+            return None
+        return Response({
+            "error": "; ".join(message for _, message in errors),
+            "rejected_files": [message for _, message in errors],
+        }, status=max(code for code, _ in errors))
+
+
+def duplicate_response(result):
+    """200 with the stored result of a document that was already processed"""
+    return Response({**result, "duplicate": True}, status=status.HTTP_200_OK)
+
+
+def job_links(request, job):
+    return {
+        "job_id": str(job.id),
+        "status": job.status,
+        "status_url": request.build_absolute_uri(reverse("job-status", kwargs={"id": job.id})),
+        "events_url": request.build_absolute_uri(reverse("job-events", kwargs={"id": job.id})),
+    }
+
+
+def job_accepted_response(request, job):
+    """202 response pointing the client at the job status endpoint"""
+    return Response(job_links(request, job), status=status.HTTP_202_ACCEPTED)
+
+
+def queued_job_response(request, job):
+    """
+    For endpoints that always go through a job: 202 when workers run the
+    queue, else the job is run here and returned finished (200, or the
+    status code the job failed with).
+    """
+    if processing_is_async():
+        return job_accepted_response(request, job)
+    job = run_job_now(job)
+    code = status.HTTP_200_OK
+    if job.status == JobStatus.FAILED:
+        code = job.error_status or status.HTTP_500_INTERNAL_SERVER_ERROR
+    return Response(ProcessingJobSerializer(job).data, status=code)
+
 # ---------- PO Upload API ----------
 @method_decorator(csrf_exempt, name='dispatch')
-class PurchaseOrderUploadView(APIView):
+class PurchaseOrderUploadView(DocumentUploadMixin, APIView):
     parser_classes = (MultiPartParser, FormParser)
    
-    @swagger_auto_schema(request_body=POUploadSerializer, responses={201: "PO created", 400: "error"})
+    @swagger_auto_schema(request_body=POUploadSerializer, responses={201: "PO created", 202: "Job queued", 400: "error"})
     def post(self, request):
+        rejected = self.upload_error_response(request)
+        if rejected:
+            return rejected
         serializer = POUploadSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         f = serializer.validated_data["file"]
@@ -49,403 +149,271 @@ class PurchaseOrderUploadView(APIView):
         if not f:
             return Response({"error": "File is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        saved_name, fullpath = save_upload_and_get_path(f, subdir="po_uploads")
-        text = file_to_text(fullpath)
-
-        if not text.strip():
-            return Response({"error": "OCR / text extraction failed or empty"}, status=status.HTTP_400_BAD_REQUEST)
+        timer = PipelineTimer()
+        with timer.stage("hash"):
+            content_hash = uploaded_file_hash(f)
+        duplicate = find_duplicate_purchase_order(content_hash)
+        if duplicate:
+            return duplicate_response(purchase_order_result(duplicate, duplicate.payload))
 
-        # Use extract_structured_fields with PO hint
-        parsed = extract_structured_fields(text, doc_type_hint="po")
+        with timer.stage("storage_save"):
+            saved_name, fullpath = save_upload_and_get_path(f, subdir="po_uploads")
 
-        # Normalize dates if possible (best-effort)
-        issued_date = None
-        if parsed.get("date"):
-            try:
-                # leave as string in payload, but try parse for model field
-                issued_date = parse_date(parsed.get("date"))
-            except:  # noqa: E722
-                issued_date = None
+        if processing_is_async():
+            job = enqueue_job(
+                JobKind.PURCHASE_ORDER, saved_name, filename=filename_override or f.name,
+                params={"content_hash": content_hash},
+            )
+            return job_accepted_response(request, job)
 
         try:
-            po_obj = PurchaseOrder.objects.create(
-                purchase_order_id=parsed.get("id") or (filename_override or f.name),
-                currency=parsed.get("currency") or None,
-                subtotal=parsed.get("subtotal"),
-                tax=parsed.get("tax"),
-                total=parsed.get("total"),
-                issued_date=issued_date,
-                buyer_name=parsed.get("buyer") or parsed.get("requested_by") or None,
-                supplier_name=parsed.get("vendor") or None,
-                payload=parsed
+            po_obj, parsed = process_purchase_order(
+                saved_name, fullpath, filename_override or f.name, timer=timer, content_hash=content_hash,
+                data=in_memory_bytes(f),
             )
+        except ProcessingError as exc:
+            return Response(exc.as_response_data(), status=exc.status_code)
 
-            # attach file path in payload / or separate field if you prefer
-            po_obj.payload = po_obj.payload or {}
-            po_obj.payload.setdefault("_storage", {})["document_blob_path"] = saved_name
-            po_obj.save(update_fields=["payload"])
-
-            return Response({
-                "po_id": po_obj.purchase_order_id,
-                "uuid": str(po_obj.id),
-                "supplier": po_obj.supplier_name,
-                "total": po_obj.total,
-                "parsed": parsed
-            }, status=status.HTTP_201_CREATED)
-        except IntegrityError:
-            return Response({"error": f"Already exists: {po_obj.purchase_order_id}"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(purchase_order_result(po_obj, parsed), status=status.HTTP_201_CREATED)
 
 
 # ---------- Invoice Upload + Verify API ----------
 
-# ---------- helpers ----------
-def safe_decimal(value):
-    """
-    Convert a value to Decimal or return None.
-    Accepts numbers, numeric-strings, or objects like {'VAT_amount': 123.0}.
-    """
-    if value is None:
-        return None
-    # If it's already a Decimal
-    if isinstance(value, Decimal):
-        return value
-    # If it's a dict like {'VAT_amount': 10725.0}
-    if isinstance(value, dict):
-        # prefer common keys
-        for key in ("amount", "value", "VAT_amount", "vat_amount", "total", "amount_due"):
-            if key in value:
-                return safe_decimal(value[key])
-        # otherwise try to find a numeric-like item
-        for v in value.values():
-            if isinstance(v, (int, float, str, Decimal)):
-                dec = safe_decimal(v)
-                if dec is not None:
-                    return dec
-        return None
-    # If numeric types
-    if isinstance(value, (int, float)):
-        try:
-            return Decimal(str(value))
-        except (InvalidOperation, ValueError):
-            return None
-    # If string: strip non-numeric except dot and minus
-    if isinstance(value, str):
-        s = value.strip()
-        # remove currency symbols and grouping commas
-        s = re.sub(r"[^\d\.\-]", "", s)
-        if not s:
-            return None
-        try:
-            return Decimal(s)
-        except (InvalidOperation, ValueError):
-            return None
-    # fallback
-    return None
-
-
-def extract_vendor_name(vendor_field):
-    """
-    vendor_field may be a string or dict (like {'name': 'Foo', ...}).
-    Return a concise string or None.
-    """
-    if not vendor_field:
-        return None
-    if isinstance(vendor_field, str):
-        return vendor_field.strip()[:255] or None
-    if isinstance(vendor_field, dict):
-        # prefer "name" then "vendor" then attempt join of address/name
-        for key in ("name", "vendor", "supplier", "supplier_name"):
-            if key in vendor_field and vendor_field[key]:
-                return str(vendor_field[key]).strip()[:255]
-        # fallback to concatenating first few values
-        vals = [str(v).strip() for v in vendor_field.values() if v and isinstance(v, (str, int, float))]
-        if vals:
-            joined = " | ".join(vals)[:255]
-            return joined
-    # other types
-    try:
-        return str(vendor_field)[:255]
-    except:  # noqa: E722
-        return None
-
-
-def dnormalize_compared_payload(obj):
-    """
-    Convert Decimal values to floats/strings so JSONField will not choke on Decimals
-    (Django's JSONField serializes Decimal but to be safe convert to float where possible).
-    Recursively process dicts/lists.
-    """
-    if isinstance(obj, Decimal):
-        # convert to float if safe
-        try:
-            return float(obj)
-        except Exception:
-            return str(obj)
-    if isinstance(obj, dict):
-        out = {}
-        for k, v in obj.items():
-            out[k] = dnormalize_compared_payload(v)
-        return out
-    if isinstance(obj, list):
-        return [dnormalize_compared_payload(x) for x in obj]
-    return obj
-
-
-logger = logging.getLogger(__name__)
-
-# ---------- patched view.post ----------
 @method_decorator(csrf_exempt, name='dispatch')
-class InvoiceUploadAndVerifyView(APIView):
+class InvoiceUploadAndVerifyView(DocumentUploadMixin, APIView):
     """
     Upload an invoice file, run OCR / structured extraction, attempt to match with a PO,
     compare (either local comparator or via Mistral if enabled), persist results, and return a summary.
     """
     parser_classes = (MultiPartParser, FormParser)
 
-    @swagger_auto_schema(request_body=InvoiceUploadSerializer, responses={200: "Verification result", 400: "error"})
+    @swagger_auto_schema(request_body=InvoiceUploadSerializer, responses={200: "Verification result", 202: "Job queued", 400: "error"})
     def post(self, request):
+        rejected = self.upload_error_response(request)
+        if rejected:
+            return rejected
         serializer = InvoiceUploadSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         f = serializer.validated_data["file"]
         filename_override = serializer.validated_data.get("filename")
         explicit_po_id = serializer.validated_data.get("purchase_order_id")
-        print("*"*50)
-        print(explicit_po_id)
-        print("*"*50)
+        reverify = serializer.validated_data.get("reverify", False)
 
         if not f:
             return Response({"error": "File is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Save uploaded file and convert to text
+        timer = PipelineTimer()
+
+        # Same file processed before: return its result, or re-verify it without OCR / extraction
+        with timer.stage("hash"):
+            content_hash = uploaded_file_hash(f)
+        duplicate = find_duplicate_invoice(content_hash)
+        if duplicate:
+            existing = None if reverify else existing_invoice_result(duplicate)
+            if existing is not None:
+                return duplicate_response(existing)
+            if processing_is_async():
+                job = enqueue_job(
+                    JobKind.INVOICE, duplicate.document_blob_path or "", filename=filename_override or f.name,
+                    params={"reverify_invoice_id": str(duplicate.pk), "purchase_order_id": explicit_po_id or None},
+                )
+                return job_accepted_response(request, job)
+            try:
+                return duplicate_response(invoice_result(*reverify_invoice(duplicate, explicit_po_id, timer=timer)))
+            except ProcessingError as exc:
+                return Response(exc.as_response_data(), status=exc.status_code)
+
+        # Save uploaded file
         try:
-            saved_name, fullpath = save_upload_and_get_path(f, subdir="invoice_uploads")
+            with timer.stage("storage_save"):
+                saved_name, fullpath = save_upload_and_get_path(f, subdir="invoice_uploads")
         except Exception as exc:
             logger.exception("Failed to save uploaded file")
             return Response({"error": "Failed to save uploaded file", "detail": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        text = file_to_text(fullpath)
-        if not text.strip():
-            return Response({"error": "OCR / text extraction failed - empty text"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Extract structured fields (this function should return a dict)
-        parsed = extract_structured_fields(text, doc_type_hint="invoice") or {}
-
-        # Normalize / sanitize parsed fields
-        def _safe_decimal_local(value):
-            if value is None:
-                return None
-            if isinstance(value, Decimal):
-                return value
-            if isinstance(value, dict):
-                # common keys
-                for key in ("amount", "value", "VAT_amount", "vat_amount", "total", "amount_due"):
-                    if key in value:
-                        return _safe_decimal_local(value[key])
-                # try values
-                for v in value.values():
-                    if isinstance(v, (int, float, str, Decimal)):
-                        dec = _safe_decimal_local(v)
-                        if dec is not None:
-                            return dec
-                return None
-            if isinstance(value, (int, float)):
-                try:
-                    return Decimal(str(value))
-                except (InvalidOperation, ValueError):
-                    return None
-            if isinstance(value, str):
-                s = re.sub(r"[^\d\.\-]", "", value.strip())
-                if not s:
-                    return None
-                try:
-                    return Decimal(s)
-                except (InvalidOperation, ValueError):
-                    return None
-            return None
+        if processing_is_async():
+            job = enqueue_job(
+                JobKind.INVOICE, saved_name, filename=filename_override or f.name,
+                params={"purchase_order_id": explicit_po_id or None, "content_hash": content_hash},
+            )
+            return job_accepted_response(request, job)
 
-        def _extract_vendor_name_local(vendor_field):
-            if not vendor_field:
-                return None
-            if isinstance(vendor_field, str):
-                return vendor_field.strip()[:255] or None
-            if isinstance(vendor_field, dict):
-                for key in ("name", "vendor", "supplier", "supplier_name"):
-                    if key in vendor_field and vendor_field[key]:
-                        return str(vendor_field[key]).strip()[:255]
-                vals = [str(v).strip() for v in vendor_field.values() if v and isinstance(v, (str, int, float))]
-                if vals:
-                    return " | ".join(vals)[:255]
-            try:
-                return str(vendor_field)[:255]
-            except Exception:
-                return None
-
-        # Issue date
-        issue_date = None
-        parsed_date = parsed.get("date")
-        if parsed_date:
-            try:
-                issue_date = django_parse_date(parsed_date) or None
-            except Exception:
-                issue_date = None
+        try:
+            invoice_obj, matched_po, run, reasons, details = process_invoice(
+                saved_name, fullpath, filename_override or f.name,
+                explicit_po_id=explicit_po_id, timer=timer, content_hash=content_hash,
+                data=in_memory_bytes(f),
+            )
+        except ProcessingError as exc:
+            return Response(exc.as_response_data(), status=exc.status_code)
 
-        supplier_name = _extract_vendor_name_local(parsed.get("vendor"))
+        return Response(invoice_result(invoice_obj, matched_po, run, reasons, details), status=status.HTTP_200_OK)
 
-        # Monetary fields converted to Decimal or None
-        subtotal_dec = _safe_decimal_local(parsed.get("subtotal"))
-        tax_dec = _safe_decimal_local(parsed.get("tax"))
-        total_dec = _safe_decimal_local(parsed.get("total"))
 
-        # Create InvoiceRef (purchase_order left null for now)
-        invoice_identifier = parsed.get("id") or (filename_override or f.name)
+# ---------- Batch Invoice Upload + Verify API ----------
+@method_decorator(csrf_exempt, name='dispatch')
+class InvoiceBatchUploadView(DocumentUploadMixin, APIView):
+    """
+    Upload many invoice files at once (optionally all against one PO).
+
+    With UPLOAD_PROCESSING_ASYNC every file becomes its own ProcessingJob and
+    the 202 response lists them ({"index", "filename", "job_id", "status_url",
+    ...}, or the stored "result" for files processed before); poll them all
+    with GET jobs/?ids=...
+
+    Otherwise files are processed in the request, concurrently
+    (BATCH_UPLOAD_MAX_WORKERS at a time), and the response streams
+    newline-delimited JSON: one line per file as it finishes ({"index",
+    "filename", "status", "http_status", "result" | "error"}, plus
+    "duplicate": true for files processed before), then a final
+    {"done": true, ...} summary line.
+
+    Batch files are spooled to temporary files while they upload, not kept
+    in memory.
+    """
+    parser_classes = (MultiPartParser, FormParser)
+    upload_max_memory_size = 0
+
+    @swagger_auto_schema(request_body=InvoiceBatchUploadSerializer, responses={200: "NDJSON stream of per-file results", 400: "error", 404: "PO not found"})
+    def post(self, request):
+        rejected = self.upload_error_response(request)
+        if rejected:
+            return rejected
+        serializer = InvoiceBatchUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        files = serializer.validated_data["files"]
+        purchase_order_id = serializer.validated_data.get("purchase_order_id")
+
         try:
-            default_source = Invoice._meta.get_field("source_type").default
-        except Exception:
-            default_source = "upload"
+            matched_po = load_batch_purchase_order(purchase_order_id) if purchase_order_id else None
+        except ProcessingError as exc:
+            return Response(exc.as_response_data(), status=exc.status_code)
+
+        if processing_is_async():
+            return self.enqueue_batch(request, files, purchase_order_id)
 
         try:
-            invoice_obj = Invoice.objects.create(
-                invoice_id=invoice_identifier,
-                issue_date=issue_date,
-                currency=parsed.get("currency") or None,
-                subtotal=subtotal_dec,
-                tax=tax_dec,
-                total=total_dec,
-                supplier_name=supplier_name,
-                source_type=default_source,
-                source_ref=saved_name,
-                payload=parsed,
-                document_blob_path=saved_name
-            )
+            uploads = []
+            for f in files:
+                content_hash = uploaded_file_hash(f)
+                if find_duplicate_invoice(content_hash):
+                    # already processed: the batch returns the stored result, nothing to save
+                    uploads.append((None, None, f.name, content_hash))
+                else:
+                    uploads.append(save_upload_and_get_path(f, subdir="invoice_uploads") + (f.name, content_hash))
         except Exception as exc:
-            logger.exception("Failed to create InvoiceRef")
-            return Response({"error": "Failed to persist invoice", "detail": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            logger.exception("Failed to save uploaded batch")
+            return Response({"error": "Failed to save uploaded file", "detail": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        # Attempt linking to a PO (several heuristics)
-        matched_po = None
+        max_workers = getattr(settings, "BATCH_UPLOAD_MAX_WORKERS", 4)
+
+        def stream():
+            succeeded = failed = 0
+            for entry in process_invoice_batch(uploads, matched_po=matched_po, max_workers=max_workers):
+                if entry["status"] == "ok":
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield json.dumps(entry, default=str) + "\n"
+            yield json.dumps({"done": True, "count": len(uploads), "succeeded": succeeded, "failed": failed}) + "\n"
+
+        response = StreamingHttpResponse(stream(), content_type="application/x-ndjson")
+        response["X-Accel-Buffering"] = "no"  # let proxies pass lines through as they are written
+        return response
+
+    def enqueue_batch(self, request, files, purchase_order_id):
+        """One queued job per file; files processed before return their stored result"""
+        po_param = str(purchase_order_id) if purchase_order_id else None
+        entries = []
         try:
-            if explicit_po_id:
-                matched_po = PurchaseOrder.objects.filter(id=explicit_po_id).first()
-        except Exception:
-            matched_po = None
+            for position, f in enumerate(files):
+                entry = {"index": position, "filename": f.name}
+                content_hash = uploaded_file_hash(f)
+                duplicate = find_duplicate_invoice(content_hash)
+                existing = existing_invoice_result(duplicate) if duplicate else None
+                if existing is not None:
+                    entry.update(status="ok", duplicate=True, result=existing)
+                elif duplicate:
+                    job = enqueue_job(
+                        JobKind.INVOICE, duplicate.document_blob_path or "", filename=f.name,
+                        params={"reverify_invoice_id": str(duplicate.pk), "purchase_order_id": po_param},
+                    )
+                    entry.update(duplicate=True, **job_links(request, job))
+                else:
+                    saved_name, _ = save_upload_and_get_path(f, subdir="invoice_uploads")
+                    job = enqueue_job(
+                        JobKind.INVOICE, saved_name, filename=f.name,
+                        params={"purchase_order_id": po_param, "content_hash": content_hash},
+                    )
+                    entry.update(job_links(request, job))
+                entries.append(entry)
+        except Exception as exc:
+            logger.exception("Failed to queue uploaded batch")
+            return Response({"error": "Failed to save uploaded file", "detail": str(exc), "files": entries},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        if not matched_po and parsed.get("po_number"):
-            try:
-                matched_po = PurchaseOrder.objects.filter(purchase_order_id__iexact=parsed.get("po_number")).first()
-            except Exception:
-                matched_po = None
-
-        if not matched_po:
-            vendor = (supplier_name or "").strip()
-            total_val = total_dec
-            if vendor and total_val is not None:
-                try:
-                    matched_po = PurchaseOrder.objects.filter(
-                        supplier_name__icontains=vendor[:50],
-                        total=total_val
-                    ).order_by("-created_at").first()
-                except Exception:
-                    matched_po = None
-
-        if not matched_po:
-            inv_id = parsed.get("id")
-            if inv_id:
-                try:
-                    matched_po = PurchaseOrder.objects.filter(purchase_order_id__iexact=inv_id).first()
-                except Exception:
-                    matched_po = None
-
-        if matched_po:
-            try:
-                invoice_obj.purchase_order = matched_po
-                invoice_obj.save(update_fields=["purchase_order"])
-            except Exception:
-                logger.exception("Failed to link invoice to matched PO")
+        job_ids = [entry["job_id"] for entry in entries if "job_id" in entry]
+        return Response({
+            "count": len(entries),
+            "queued": len(job_ids),
+            "files": entries,
+            "status_url": request.build_absolute_uri(reverse("job-list")) + "?ids=" + ",".join(job_ids),
+        }, status=status.HTTP_202_ACCEPTED)
 
-        # Prepare parsed PO payload for comparison
-        po_parsed = matched_po.payload if matched_po and isinstance(matched_po.payload, dict) else {}
 
+# ---------- Processing job status ----------
+class ProcessingJobListView(generics.ListAPIView):
+    """
+    Status of several jobs in one request (e.g. the jobs of a batch upload):
+    GET jobs/?ids=<uuid>,<uuid>,...
+    """
+    serializer_class = ProcessingJobSerializer
+
+    def get_queryset(self):
+        ids = [value for value in self.request.query_params.get("ids", "").split(",") if value]
+        max_ids = getattr(settings, "BATCH_UPLOAD_MAX_FILES", 100)
         try:
-            status_str, summary, reasons, details = compare_one_pair(parsed, po_parsed)
-        except Exception as exc:
-            logger.exception("Comparator failed")
-            status_str = "NEEDS REVIEW"
-            summary = f"Comparator error: {str(exc)}"
-            reasons = [f"Comparator exception: {str(exc)}"]
-            details = {
-                "invoice_total": parsed.get("total"),
-                "po_total": po_parsed.get("total"),
-                "items": []
-            }
-
-        # Persist verification results (creates VerificationRun, ItemResults, Discrepancies)
-        try:
-            run = persist_verification(invoice_obj, matched_po, status_str, summary, reasons, details)
-        except Exception:
-            logger.exception("persist_verification failed; creating fallback run")
-            # fallback minimal run to keep response shape
-            try:
-                run = VerificationRun.objects.create(
-                    purchase_order=matched_po,
-                    invoice=invoice_obj,
-                    status=(VerificationStatus.MATCHED if status_str == "MATCHED" else VerificationStatus.MISMATCHED),
-                    summary=summary,
-                    mismatch_count=(len(reasons) if isinstance(reasons, (list, tuple)) else (1 if reasons else 0)),
-                    matched_item_count=details.get("matched_items", 0) if isinstance(details, dict) else 0,
-                    quantities_ok=details.get("quantities_ok", True) if isinstance(details, dict) else True,
-                    prices_ok=details.get("prices_ok", True) if isinstance(details, dict) else True,
-                    totals_ok=(status_str == "MATCHED"),
-                    currency_ok=details.get("currency_ok", True) if isinstance(details, dict) else True,
-                    linkage_ok=(matched_po is not None),
-                    started_at=None,
-                    finished_at=None,
-                    duration_ms=0,
-                    po_snapshot=po_parsed,
-                    invoice_snapshot=parsed
-                )
-            except Exception as exc2:
-                logger.exception("Failed to create fallback VerificationRun")
-                return Response({"error": "Failed to persist verification run", "detail": str(exc2)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        # Save compared payload normalized (so JSONField is safe)
-        compared = {
-            "verification": {
-                "status": run.status,
-                "summary": run.summary,
-                "reasons": reasons,
-                "details": details
-            }
-        }
-        try:
-            invoice_obj.compared_payload = normalize_compared_payload(compared)
-            invoice_obj.save(update_fields=["compared_payload"])
-        except Exception:
-            logger.exception("Failed to save compared_payload (non-fatal)")
-
-        # Build response
-        response_payload = {
-            "invoice": {
-                "uuid": str(invoice_obj.id),
-                "invoice_id": invoice_obj.invoice_id,
-                "supplier": invoice_obj.supplier_name,
-                "total": float(invoice_obj.total) if invoice_obj.total is not None else None,
-            },
-            "matched_po": {
-                "uuid": str(matched_po.id) if matched_po else None,
-                "po_id": matched_po.purchase_order_id if matched_po else None,
-            },
-            "verification": {
-                "run_id": str(run.id),
-                "status": run.status,
-                "summary": run.summary,
-                "mismatch_count": run.mismatch_count,
-                "reasons": reasons,
-                "details": details
-            }
-        }
-
-        return Response(response_payload, status=status.HTTP_200_OK)
-    
+            ids = [uuid.UUID(value) for value in ids[:max_ids]]
+        except ValueError:
+            raise ValidationError({"ids": "Expected comma-separated job ids"})
+        return ProcessingJob.objects.filter(pk__in=ids).order_by("created_at")
 
 
+class ProcessingJobStatusView(generics.RetrieveAPIView):
+    """
+    Current status / stage of a queued upload. Once the job succeeded,
+    `result` holds the same payload the synchronous upload endpoint returns.
+    """
+    queryset = ProcessingJob.objects.all()
+    serializer_class = ProcessingJobSerializer
+    lookup_field = "id"
 
+
+class ProcessingJobEventsView(APIView):
+    """
+    Progress events of a job, long-polled: GET jobs/<id>/events/?after=<last id>
+    returns the events after that id as soon as there are any, or an empty
+    list after ?wait= seconds (default and maximum 5). Events: saved, started,
+    page_ocred (per page), classified, extracted (item count), po_linked,
+    compared, persisted, then succeeded or failed. `done` is set once the job
+    finished - its result is on the job status endpoint.
+    """
+
+    def get(self, request, id):
+        if not ProcessingJob.objects.filter(pk=id).exists():
+            return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            after_id = int(request.query_params.get("after") or 0)
+            wait_seconds = float(request.query_params.get("wait", EVENT_WAIT_MAX_SECONDS))
+        except ValueError:
+            return Response({"error": "after and wait must be numbers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        events, done = wait_for_job_events(id, after_id=after_id, wait_seconds=wait_seconds)
+        return Response({
+            "events": [
+                {"id": event.id, "event": event.event, "data": event.data, "at": event.created_at}
+                for event in events
+            ],
+            "last_id": events[-1].id if events else after_id,
+            "done": done,
+        })
@@ -95,6 +95,50 @@ REST_FRAMEWORK = {
 
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY", "")
 
+# "1": upload endpoints enqueue a ProcessingJob and return 202; `manage.py run_jobs` does the work,
+# so only enable it where a worker runs (the Docker image does). Off by default: uploads are
+# processed inside the request.
+UPLOAD_PROCESSING_ASYNC = os.getenv("UPLOAD_PROCESSING_ASYNC", "0") == "1"
+# Worker lease: a running job whose lease is not renewed for this long is requeued
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Progress events of finished jobs are deleted by the workers after this many hours
+JOB_EVENT_RETENTION_HOURS = int(os.getenv("JOB_EVENT_RETENTION_HOURS", "24"))
+
+# Batch invoice upload: files per request and concurrent documents per batch
+BATCH_UPLOAD_MAX_FILES = int(os.getenv("BATCH_UPLOAD_MAX_FILES", "100"))
+BATCH_UPLOAD_MAX_WORKERS = int(os.getenv("BATCH_UPLOAD_MAX_WORKERS", "4"))
+
+# Per-worker LRU cache of PO-number lookups used when linking invoices (see po_cache.py);
+# the TTL bounds how long PO edits made by other processes can go unseen
+PO_LOOKUP_CACHE_SIZE = int(os.getenv("PO_LOOKUP_CACHE_SIZE", "256"))
+PO_LOOKUP_CACHE_TTL = float(os.getenv("PO_LOOKUP_CACHE_TTL", "300"))
+
+# Invoices without a PO number: LSH candidates checked by the rule-based comparator (see po_candidates.py)
+PO_CANDIDATE_TOP_K = int(os.getenv("PO_CANDIDATE_TOP_K", "5"))
+# Minimum match score per invoice line, counting only lines matched on item ID or description
+PO_CANDIDATE_MIN_SCORE = float(os.getenv("PO_CANDIDATE_MIN_SCORE", "30"))
+
+# Verification tolerances (see compare.DEFAULT_TOLERANCES): line quantities / prices
+# match within rel_tol or abs_tol, totals are flagged beyond total_rel_tol and total_abs_tol
+VERIFICATION_TOLERANCES = {
+    "rel_tol": float(os.getenv("VERIFY_REL_TOL", "0.02")),
+    "abs_tol": float(os.getenv("VERIFY_ABS_TOL", "1.0")),
+    "total_rel_tol": float(os.getenv("VERIFY_TOTAL_REL_TOL", "0.02")),
+    "total_abs_tol": float(os.getenv("VERIFY_TOTAL_ABS_TOL", "2.0")),
+}
+REVERIFY_MAX_WORKERS = int(os.getenv("REVERIFY_MAX_WORKERS", "4"))
+
+# Duplicate invoices (see duplicates.py): "flag" exact duplicates on a NEEDS REVIEW run, or
+# "reject" their upload; near duplicates (same vendor and total) are searched within this many days
+DUPLICATE_INVOICE_ACTION = os.getenv("DUPLICATE_INVOICE_ACTION", "flag")
+DUPLICATE_NEAR_DAYS = int(os.getenv("DUPLICATE_NEAR_DAYS", "7"))
+
+# Per-file upload limit enforced while the upload streams (see upload_handlers.py);
+# files up to FILE_UPLOAD_MAX_MEMORY_SIZE stay in memory and go to OCR without a disk round trip
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv("FILE_UPLOAD_MAX_MEMORY_SIZE", str(10 * 1024 * 1024)))
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',